@@ -0,0 +1,101 @@
+# archive.py — move post/ items to posted/: concurrent copies, one delete_objects per 1000 keys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+MAX_DELETE = 1000                              # S3 DeleteObjects limit
+
+
+class S3Archiver:
+    """
+    Archive queue items in bulk. All copies (media + caption) run concurrently;
+    objects above multipart_threshold use a managed multipart copy. Sources are
+    then removed with DeleteObjects, but only for items whose every copy
+    succeeded, so a failed item stays complete in post/. An item whose source
+    could not be deleted is reported failed too: it is still queued.
+    """
+
+    def __init__(
+        self,
+        *,
+        s3,
+        bucket: str,
+        dest_prefix: str = "posted/",
+        workers: int = 8,
+        multipart_threshold: int = 64 * 1024 * 1024,
+        multipart_chunksize: int = 16 * 1024 * 1024,
+    ):
+        from boto3.s3.transfer import TransferConfig
+
+        self.s3 = s3
+        self.bucket = bucket
+        self.dest_prefix = dest_prefix
+        self.workers = workers
+        self.multipart_threshold = multipart_threshold
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=4,
+        )
+
+
+    def dest_key(self, key: str) -> str:
+        return f"{self.dest_prefix}{os.path.basename(key)}"
+
+
+    def _copy(self, key: str, size: int | None):
+        source = {"Bucket": self.bucket, "Key": key}
+        if size is not None and size >= self.multipart_threshold:
+            self.s3.copy(source, self.bucket, self.dest_key(key), Config=self.transfer)
+        else:
+            self.s3.copy_object(Bucket=self.bucket, CopySource=source, Key=self.dest_key(key))
+
+
+    def archive(self, items: dict[str, list[str]], sizes: dict[str, int] | None = None) -> dict:
+        """
+        items maps each media key to every key that belongs to it (media + caption).
+        Returns {"moved": [media keys], "failed": {media key: error}}.
+        """
+        sizes = sizes or {}
+        with shared_tracer().span("archive", dest=self.dest_prefix, items=len(items)) as sp:
+            res = self._archive(items, sizes)
+            copied = [k for media in res["moved"] for k in items[media]]
+            sp.set(objects=len(copied), bytes=sum(sizes.get(k) or 0 for k in copied),
+                   moved=len(res["moved"]), failed=len(res["failed"]))
+            return res
+
+
+    def _archive(self, items: dict[str, list[str]], sizes: dict[str, int]) -> dict:
+        owner = {k: media for media, keys in items.items() for k in keys}
+        failed: dict[str, str] = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(owner) or 1)),
+                                thread_name_prefix="archive") as pool:
+            futures = {k: pool.submit(self._copy, k, sizes.get(k)) for k in owner}
+            for k, fut in futures.items():
+                try:
+                    fut.result()
+                except Exception as e:
+                    failed.setdefault(owner[k], f"{k}: {e}")
+
+        to_delete = [k for k, media in owner.items() if media not in failed]
+        for i in range(0, len(to_delete), MAX_DELETE):
+            chunk = to_delete[i:i + MAX_DELETE]
+            resp = self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True},
+            )
+            for err in resp.get("Errors") or []:
+                # The copy exists in posted/, but the source is still queued: not moved.
+                key = err.get("Key")
+                failed.setdefault(owner.get(key), f"delete {key}: {err.get('Code')} {err.get('Message')}")
+
+        moved = [m for m in items if m not in failed]
+        for media in moved:
+            safe_print(f"📤 Moved {', '.join(items[media])} → {self.dest_prefix}")
+        for media, err in failed.items():
+            safe_print(f"❌ Archive failed for {media}: {err}")
+        return {"moved": moved, "failed": failed}
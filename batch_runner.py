@@ -0,0 +1,232 @@
+# batch_runner.py — post N items for several pages/accounts on a bounded worker pool
+#
+# accounts.json is a list of SocialPoster configs plus a few runner fields:
+#   [{"name": "loan-officer", "count": 3, "min_interval": 60,
+#     "fb_app_id": "$FB_APP_ID", "fb_page_token": "$FB_PAGE_TOKEN", ...}, ...]
+# String values starting with "$" are read from the environment (get_env).
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.client import Config
+from dotenv import load_dotenv
+
+from graph_api import GraphClient, make_async_client, make_session
+from safio import get_env, safe_print
+from social_post import SocialPoster
+
+
+RUNNER_FIELDS = ("name", "count", "min_interval")
+
+
+class RunStats:
+    """Thread-safe counters for one batch run (posts/min + per-platform latency)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.posted = 0
+        self.failed = 0
+        self.latency: dict[str, list[float]] = {}
+        self.per_account: dict[str, dict] = {}
+
+
+    def record(self, account: str, results: dict | None, ok: bool):
+        with self._lock:
+            acc = self.per_account.setdefault(account, {"posted": 0, "failed": 0})
+            if ok:
+                self.posted += 1
+                acc["posted"] += 1
+            else:
+                self.failed += 1
+                acc["failed"] += 1
+            for platform, r in (results or {}).items():
+                if isinstance(r, dict) and "seconds" in r:
+                    self.latency.setdefault(platform, []).append(r["seconds"])
+
+
+    def summary(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            latency = {}
+            for platform, xs in self.latency.items():
+                xs = sorted(xs)
+                latency[platform] = {
+                    "n": len(xs),
+                    "mean": round(statistics.fmean(xs), 2),
+                    "p50": xs[len(xs) // 2],
+                    "max": xs[-1],
+                }
+            return {
+                "posted": self.posted,
+                "failed": self.failed,
+                "elapsed_s": round(elapsed, 1),
+                "posts_per_min": round(self.posted / elapsed * 60, 2) if elapsed > 0 else 0.0,
+                "latency_s": latency,
+                "accounts": dict(self.per_account),
+            }
+
+
+class BatchRunner:
+    """
+    Drain up to `count` items per account. Accounts run in parallel on a bounded
+    pool; items within one account run one after another, at least min_interval
+    seconds apart, so each page's own posting rate is respected. S3 clients and
+    the HTTP connection pool are shared by every account.
+    """
+
+    def __init__(self, accounts: list[dict], *, workers: int = 4, default_count: int = 1):
+        self.accounts = accounts
+        self.workers = max(1, workers)
+        self.default_count = default_count
+        self.stats = RunStats()
+        self.session = make_session(pool_connections=4, pool_maxsize=self.workers * 3)
+        self._s3_clients: dict[tuple, object] = {}
+        self._s3_lock = threading.Lock()
+
+
+    # ------------------------------------------------------------------
+    # Shared clients
+    # ------------------------------------------------------------------
+    def s3_client(self, endpoint: str, key: str, secret: str):
+        """One boto3 client per (endpoint, credentials), shared across accounts."""
+        endpoint = endpoint if str(endpoint).startswith("http") else f"https://{endpoint}"
+        ident = (endpoint, key)
+        with self._s3_lock:
+            if ident not in self._s3_clients:
+                self._s3_clients[ident] = boto3.client(
+                    "s3",
+                    endpoint_url=endpoint,
+                    aws_access_key_id=key,
+                    aws_secret_access_key=secret,
+                    config=Config(signature_version="s3v4", max_pool_connections=self.workers * 3),
+                )
+            return self._s3_clients[ident]
+
+
+    def build_poster(self, cfg: dict, async_client=None) -> SocialPoster:
+        kwargs = {k: v for k, v in cfg.items() if k not in RUNNER_FIELDS}
+        return SocialPoster(
+            **kwargs,
+            graph=GraphClient(app_secret=kwargs.get("fb_app_secret"), session=self.session),
+            s3_client=self.s3_client(kwargs["s3_endpoint"], kwargs["s3_key"], kwargs["s3_secret"]),
+            async_client=async_client,
+        )
+
+
+    # ------------------------------------------------------------------
+    # Run
+    # ------------------------------------------------------------------
+    def run_account(self, cfg: dict):
+        name = cfg.get("name") or cfg.get("fb_page_id") or "account"
+        count = int(cfg.get("count") or self.default_count)
+        min_interval = float(cfg.get("min_interval") or 0)
+        poster = self.build_poster(cfg)
+
+        last = None
+        for n in range(count):
+            if last is not None and min_interval:
+                wait = min_interval - (time.monotonic() - last)
+                if wait > 0:
+                    time.sleep(wait)
+            last = time.monotonic()
+            safe_print(f"[{name}] item {n + 1}/{count}")
+            try:
+                results = poster.post_one()
+            except Exception as e:
+                # The item is still queued; stop this account rather than hammer it.
+                safe_print(f"❌ [{name}] {e}")
+                self.stats.record(name, None, ok=False)
+                return
+            if results is None:
+                return                          # queue empty
+            self.stats.record(name, results, ok=True)
+
+
+    def run(self) -> dict:
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="account") as pool:
+            for fut in [pool.submit(self.run_account, cfg) for cfg in self.accounts]:
+                fut.result()
+        return self.stats.summary()
+
+
+    # ------------------------------------------------------------------
+    # Run on one event loop (--aio): every account in flight at once
+    # ------------------------------------------------------------------
+    async def run_account_async(self, cfg: dict, client):
+        name = cfg.get("name") or cfg.get("fb_page_id") or "account"
+        count = int(cfg.get("count") or self.default_count)
+        min_interval = float(cfg.get("min_interval") or 0)
+        poster = await asyncio.to_thread(self.build_poster, cfg, client)
+
+        last = None
+        for n in range(count):
+            if last is not None and min_interval:
+                wait = min_interval - (time.monotonic() - last)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            last = time.monotonic()
+            safe_print(f"[{name}] item {n + 1}/{count}")
+            try:
+                results = await poster.post_one_async()
+            except Exception as e:
+                safe_print(f"❌ [{name}] {e}")
+                self.stats.record(name, None, ok=False)
+                return
+            if results is None:
+                return
+            self.stats.record(name, results, ok=True)
+
+
+    async def run_async(self) -> dict:
+        """
+        All accounts on one loop with one httpx pool; IG container waits hold no
+        thread, so `workers` only sizes the pool for the blocking S3/X steps.
+        """
+        client = make_async_client(max_connections=max(20, len(self.accounts) * 3))
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="account"))
+        try:
+            await asyncio.gather(*(self.run_account_async(cfg, client) for cfg in self.accounts))
+        finally:
+            await client.aclose()
+        return self.stats.summary()
+
+
+def load_accounts(path: str) -> list[dict]:
+    """Read accounts.json, resolving "$NAME" values through get_env."""
+    with open(path, "r", encoding="utf-8") as f:
+        accounts = json.load(f)
+
+    def resolve(v):
+        if isinstance(v, str) and v.startswith("$"):
+            return get_env(v[1:])
+        return v
+
+    return [{k: resolve(v) for k, v in acc.items()} for acc in accounts]
+
+
+def main(argv=None):
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Post queued items for several pages at once.")
+    ap.add_argument("accounts", help="JSON file with a list of account configs")
+    ap.add_argument("--count", type=int, default=1, help="items per account (unless set per account)")
+    ap.add_argument("--workers", type=int, default=4, help="accounts posting at the same time")
+    ap.add_argument("--aio", action="store_true",
+                    help="drive every account on one asyncio loop (httpx); --workers sizes the S3/X thread pool")
+    args = ap.parse_args(argv)
+
+    runner = BatchRunner(load_accounts(args.accounts), workers=args.workers, default_count=args.count)
+    summary = asyncio.run(runner.run_async()) if args.aio else runner.run()
+    safe_print("BATCH SUMMARY:", json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
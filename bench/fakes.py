@@ -0,0 +1,644 @@
+# bench/fakes.py — local stand-ins for the Graph API, S3, the Make webhook and X media upload
+import email.utils
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+
+class FakeServer:
+    """
+    A ThreadingHTTPServer on 127.0.0.1 (free port, HTTP/1.1 keep-alive) that
+    sleeps `latency` (+/- jitter) per request and answers `error_rate` of them
+    with a 500. Subclasses implement handle(); calls and injected errors are
+    counted per route for the benchmark report.
+    """
+
+    name = "fake"
+
+    def __init__(self, *, latency: float = 0.0, jitter: float = 0.5, error_rate: float = 0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.server = None
+        self.url = None
+
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> "FakeServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                fake._dispatch(self)
+
+            do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+        return self
+
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+
+    def count(self, route: str, error: str | None = None):
+        with self._lock:
+            self.calls[route] += 1
+            if error:
+                self.errors[f"{route}:{error}"] += 1
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "total": sum(self.calls.values()), "errors": dict(self.errors)}
+
+
+    # ------------------------------------------------------------------
+    # Request plumbing
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _read_body(h) -> bytes:
+        if "chunked" in (h.headers.get("Transfer-Encoding") or "").lower():
+            out = bytearray()
+            while True:
+                size = int(h.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while h.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return bytes(out)
+                out += h.rfile.read(size)
+                h.rfile.readline()
+        length = int(h.headers.get("Content-Length") or 0)
+        return h.rfile.read(length) if length else b""
+
+
+    def _dispatch(self, h):
+        parts = urlsplit(h.path)
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        body = self._read_body(h)
+        if self.latency:
+            time.sleep(max(0.0, self.latency * self.rng.uniform(1 - self.jitter, 1 + self.jitter)))
+
+        route = self.route(h.command, parts.path, query)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.count(route, "500")
+            status, headers, payload = self.server_error()
+        else:
+            status, headers, payload = self.handle(h.command, unquote(parts.path), query, h.headers, body, route)
+
+        h.send_response(status)
+        for k, v in (headers or {}).items():
+            h.send_header(k, v)
+        if "Content-Length" not in (headers or {}):
+            h.send_header("Content-Length", str(len(payload)))
+        h.end_headers()
+        if h.command != "HEAD" and payload:
+            h.wfile.write(payload)
+
+
+    def route(self, method: str, path: str, query: dict) -> str:
+        return f"{method} {path}"
+
+
+    def server_error(self):
+        return 500, {"Content-Type": "application/json"}, b'{"error": {"message": "injected", "code": 2}}'
+
+
+    def handle(self, method, path, query, headers, body, route):
+        raise NotImplementedError
+
+
+def _json(status: int, obj, headers: dict | None = None):
+    return status, {"Content-Type": "application/json", **(headers or {})}, json.dumps(obj).encode()
+
+
+# ----------------------------------------------------------------------
+# Graph API
+# ----------------------------------------------------------------------
+class FakeGraph(FakeServer):
+    """
+    Pages (/photos, /videos, /feed; published=false + scheduled_publish_time
+    within 10 min .. 30 days is kept in .scheduled, DELETE /<id> cancels), IG
+    containers (/media, status reads incl. ?ids=, /media_publish,
+    /content_publishing_limit), /me/accounts and batch POST /. Containers
+    become FINISHED after image_delay / video_delay (+/-50%).
+
+    token_expiry_rate: share of page calls answered with code 190; the token
+    presented is revoked and /me/accounts hands out its successor.
+    publish_9007_rate: share of publishes answered with code 9007 even when
+    the container is ready (publishing before FINISHED always gets 9007).
+    container_error_rate: share of containers that end in status ERROR.
+    app_limit: calls per hour behind X-App-Usage (0 = no usage headers).
+    """
+
+    name = "graph"
+
+    def __init__(
+        self,
+        *,
+        image_delay: float = 1.0,
+        video_delay: float = 5.0,
+        token_expiry_rate: float = 0.0,
+        publish_9007_rate: float = 0.0,
+        container_error_rate: float = 0.0,
+        app_limit: int = 0,
+        user_token: str = "user-token",
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.image_delay = image_delay
+        self.video_delay = video_delay
+        self.token_expiry_rate = token_expiry_rate
+        self.publish_9007_rate = publish_9007_rate
+        self.container_error_rate = container_error_rate
+        self.app_limit = app_limit
+        self.user_token = user_token
+        self.page_tokens: dict[str, str] = {}  # page id -> token it was first seen with
+        self.successor: dict[str, str] = {}   # revoked token -> its replacement
+        self.containers: dict[str, dict] = {}
+        self.scheduled: dict[str, int] = {}   # post id -> scheduled_publish_time
+        self.published: Counter = Counter()    # IG user -> publishes
+        self._recent: list[float] = []
+
+
+    def route(self, method, path, query):
+        parts = [p for p in path.split("/") if p][1:]   # drop the version
+        if not parts:
+            return "batch" if method == "POST" else "status_multi"
+        if parts == ["me", "accounts"]:
+            return "me/accounts"
+        if len(parts) == 1:
+            return "status"
+        return parts[-1]
+
+
+    def _latest(self, token: str) -> str:
+        while token in self.successor:
+            token = self.successor[token]
+        return token
+
+
+    def _usage_headers(self) -> dict:
+        if not self.app_limit:
+            return {}
+        now = time.time()
+        with self._lock:
+            self._recent = [t for t in self._recent if t > now - 3600] + [now]
+            pct = min(100, round(len(self._recent) / self.app_limit * 100))
+        return {"X-App-Usage": json.dumps({"call_count": pct, "total_time": pct, "total_cputime": pct})}
+
+
+    def _error(self, code: int, message: str, status: int = 400, **extra):
+        return status, {"error": {"code": code, "message": message, "type": "OAuthException", **extra}}
+
+
+    def handle(self, method, path, query, headers, body, route):
+        params = dict(query)
+        if body and "json" not in (headers.get("Content-Type") or ""):
+            params.update(parse_qsl(body.decode(), keep_blank_values=True))
+        status, obj = self.call(method, path, params, route)
+        if status >= 400:
+            self.count(route, str((obj.get("error") or {}).get("code", status)))
+        else:
+            self.count(route)
+        return _json(status, obj, self._usage_headers())
+
+
+    def call(self, method: str, path: str, params: dict, route: str) -> tuple[int, dict]:
+        parts = [p for p in path.split("/") if p][1:]
+        token = params.get("access_token") or ""
+
+        if route == "batch":
+            return 200, self._batch(json.loads(params.get("batch") or "[]"), token)
+
+        if route == "me/accounts":
+            if token != self.user_token:
+                return self._error(190, "Invalid user token")
+            with self._lock:
+                data = [{"id": pid, "access_token": self._latest(tok), "name": f"Page {pid}"}
+                        for pid, tok in self.page_tokens.items()]
+            return 200, {"data": data}
+
+        with self._lock:
+            if token in self.successor:
+                return self._error(190, "Error validating access token: Session has expired", error_subcode=463)
+            if route in ("photos", "videos", "feed"):
+                self.page_tokens.setdefault(parts[0], token)
+            if route != "status" and route != "status_multi" and self.token_expiry_rate \
+                    and self.rng.random() < self.token_expiry_rate:
+                self.successor[token] = f"{token.split('.r')[0]}.r{self.next_id()}"
+                return self._error(190, "Error validating access token: Session has expired", error_subcode=463)
+
+        now = time.time()
+        if route in ("photos", "videos", "feed") and method == "POST":
+            when = params.get("scheduled_publish_time")
+            if when and not now + 600 <= int(when) <= now + 30 * 86400:
+                return self._error(100, "The specified scheduled publish time is invalid.")
+            n = self.next_id()
+            if when and params.get("published") == "false":
+                with self._lock:
+                    self.scheduled[f"{parts[0]}_{n}"] = int(when)
+            return 200, {"id": f"{n}", "post_id": f"{parts[0]}_{n}"}
+
+        if route == "status" and method == "DELETE":
+            with self._lock:
+                if self.scheduled.pop(parts[0], None) is None:
+                    return self._error(100, f"Unsupported delete request for {parts[0]}")
+            return 200, {"success": True}
+
+        if route == "media" and method == "POST":
+            is_video = params.get("media_type") in ("REELS", "VIDEO")
+            delay = self.video_delay if is_video else self.image_delay
+            cid = f"17{self.next_id():010d}"
+            with self._lock:
+                self.containers[cid] = {
+                    "ready_at": now + delay * self.rng.uniform(0.5, 1.5),
+                    "error": self.rng.random() < self.container_error_rate,
+                    "published": False,
+                }
+            return 200, {"id": cid}
+
+        if route == "media_publish":
+            c = self.containers.get(params.get("creation_id") or "")
+            if not c:
+                return self._error(100, "Invalid creation_id")
+            if now < c["ready_at"] or c["error"] or self.rng.random() < self.publish_9007_rate:
+                return self._error(9007, "Media ID is not available", error_subcode=2207027)
+            c["published"] = True
+            with self._lock:
+                self.published[parts[0]] += 1
+            return 200, {"id": f"18{self.next_id():010d}"}
+
+        if route == "content_publishing_limit":
+            return 200, {"data": [{"quota_usage": self.published[parts[0]],
+                                   "config": {"quota_total": 50, "quota_duration": 86400}}]}
+
+        if route == "status":
+            return 200, self._status(parts[0], now)
+        if route == "status_multi":
+            return 200, {cid: self._status(cid, now) for cid in (params.get("ids") or "").split(",") if cid}
+
+        return self._error(100, f"Unknown path {path}")
+
+
+    def _status(self, cid: str, now: float) -> dict:
+        c = self.containers.get(cid)
+        if not c:
+            return {"id": cid, "status_code": "EXPIRED"}
+        if c["published"]:
+            return {"id": cid, "status_code": "PUBLISHED"}
+        if now < c["ready_at"]:
+            return {"id": cid, "status_code": "IN_PROGRESS"}
+        return {"id": cid, "status_code": "ERROR" if c["error"] else "FINISHED"}
+
+
+    def _batch(self, ops: list[dict], token: str) -> list:
+        named, out = {}, []
+        for op in ops:
+            if op.get("depends_on") and not (named.get(op["depends_on"]) or {}).get("ok"):
+                out.append(None)
+                continue
+            resolve = lambda text: re.sub(
+                r"\{result=([^:]+):\$\.(\w+)\}",
+                lambda m: str((named.get(m.group(1)) or {}).get("body", {}).get(m.group(2), "")), text)
+            body = resolve(op.get("body") or "")
+            url = urlsplit("/v/" + resolve(op["relative_url"]))
+            params = {"access_token": token, **dict(parse_qsl(url.query)), **dict(parse_qsl(body))}
+            route = self.route(op["method"], url.path, params)
+            status, obj = self.call(op["method"], url.path, params, route)
+            self.count(f"batch:{route}", None if status < 400 else str(obj["error"]["code"]))
+            res = {"ok": status < 400, "body": obj}
+            if op.get("name"):
+                named[op["name"]] = res
+            omit = op.get("name") and op.get("omit_response_on_success") and status < 400
+            out.append({"code": status, "headers": [], "body": None if omit else json.dumps(obj)})
+        return out
+
+
+# ----------------------------------------------------------------------
+# S3 (path-style subset boto3 uses here)
+# ----------------------------------------------------------------------
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class FakeS3(FakeServer):
+    """
+    In-memory, path-style S3: ListObjectsV2, Head/Get (Range)/Put/Copy/Delete
+    Object, DeleteObjects and multipart uploads (create / part / complete /
+    abort). Accepts aws-chunked bodies (newer botocore checksums uploads that
+    way) and conditional PUTs (If-None-Match: * and If-Match, answered with
+    412). Calls are counted per S3 operation.
+    """
+
+    name = "s3"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.objects: dict[tuple[str, str], dict] = {}
+        self._put_lock = threading.Lock()
+        self.uploads: dict[str, dict] = {}    # upload id -> {"bucket", "key", "parts": {n: bytes}}
+
+
+    def put(self, bucket: str, key: str, data: bytes):
+        self.objects[(bucket, key)] = {
+            "data": data,
+            "etag": hashlib.md5(data).hexdigest(),
+            "mtime": time.time(),
+        }
+
+
+    def keys(self, bucket: str, prefix: str = "") -> list[str]:
+        return sorted(k for b, k in self.objects if b == bucket and k.startswith(prefix))
+
+
+    def route(self, method, path, query):
+        key = path.lstrip("/").partition("/")[2]
+        if method == "GET" and not key:
+            return "ListObjectsV2"
+        if method == "POST" and "delete" in query:
+            return "DeleteObjects"
+        if method == "POST":
+            return "CreateMultipartUpload" if "uploads" in query else "CompleteMultipartUpload"
+        if "uploadId" in query:
+            return "UploadPart" if method == "PUT" else "AbortMultipartUpload"
+        return {"HEAD": "HeadObject", "GET": "GetObject", "DELETE": "DeleteObject"}.get(method, "PutObject")
+
+
+    def server_error(self):
+        return 500, {"Content-Type": "application/xml"}, \
+            b"<Error><Code>InternalError</Code><Message>injected</Message></Error>"
+
+
+    @staticmethod
+    def _xml(status: int, root: str, inner: str):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{S3_NS}">{inner}</{root}>'
+        return status, {"Content-Type": "application/xml"}, body.encode()
+
+
+    @staticmethod
+    def _error(status: int, code: str, inner: str = ""):
+        # S3 error bodies carry no namespace; botocore only finds <Code> without one.
+        body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code>{inner}</Error>'
+        return status, {"Content-Type": "application/xml"}, body.encode()
+
+
+    def _no_such_key(self, key: str):
+        return self._error(404, "NoSuchKey", f"<Key>{escape(key)}</Key>")
+
+
+    @staticmethod
+    def _iso(ts: float) -> str:
+        return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(ts))
+
+
+    @staticmethod
+    def _decode_aws_chunked(body: bytes) -> bytes:
+        out, pos = bytearray(), 0
+        while True:
+            eol = body.index(b"\r\n", pos)
+            size = int(body[pos:eol].split(b";")[0], 16)
+            if size == 0:
+                return bytes(out)
+            out += body[eol + 2:eol + 2 + size]
+            pos = eol + 2 + size + 2
+
+
+    def handle(self, method, path, query, headers, body, route):
+        bucket, _, key = path.lstrip("/").partition("/")
+        self.count(route if "x-amz-copy-source" not in headers else "CopyObject")
+
+        if route == "ListObjectsV2":
+            return self._list(bucket, query)
+        if route == "DeleteObjects":
+            root = ET.fromstring(body)
+            deleted = []
+            for k in root.iter(f"{{{S3_NS}}}Key") if root.tag.startswith("{") else root.iter("Key"):
+                self.objects.pop((bucket, k.text), None)
+                deleted.append(f"<Deleted><Key>{escape(k.text)}</Key></Deleted>")
+            return self._xml(200, "DeleteResult", "".join(deleted))
+        if route in ("CreateMultipartUpload", "UploadPart", "CompleteMultipartUpload", "AbortMultipartUpload"):
+            return self._multipart(route, bucket, key, query, headers, body)
+        if method == "DELETE":
+            self.objects.pop((bucket, key), None)
+            return 204, {}, b""
+
+        if method == "PUT":
+            src = headers.get("x-amz-copy-source")
+            if src:
+                sb, _, sk = unquote(src).lstrip("/").partition("/")
+                obj = self.objects.get((sb, sk.split("?")[0]))
+                if not obj:
+                    return self._no_such_key(sk)
+                self.objects[(bucket, key)] = dict(obj, mtime=time.time())
+                return self._xml(200, "CopyObjectResult",
+                                 f'<LastModified>{self._iso(time.time())}</LastModified><ETag>"{obj["etag"]}"</ETag>')
+            if "aws-chunked" in (headers.get("Content-Encoding") or "") \
+                    or (headers.get("x-amz-content-sha256") or "").startswith("STREAMING"):
+                body = self._decode_aws_chunked(body)
+            with self._put_lock:
+                current = self.objects.get((bucket, key))
+                if_match, if_none = headers.get("If-Match"), headers.get("If-None-Match")
+                if (if_none == "*" and current) or \
+                        (if_match and (not current or if_match.strip('"') != current["etag"])):
+                    return self._error(412, "PreconditionFailed")
+                self.put(bucket, key, body)
+                return 200, {"ETag": f'"{self.objects[(bucket, key)]["etag"]}"'}, b""
+
+        obj = self.objects.get((bucket, key))
+        if not obj:
+            return (404, {}, b"") if method == "HEAD" else self._no_such_key(key)
+        data = obj["data"]
+        meta = {
+            "ETag": f'"{obj["etag"]}"',
+            "Last-Modified": email.utils.formatdate(obj["mtime"], usegmt=True),
+            "Content-Type": "application/octet-stream",
+            "Accept-Ranges": "bytes",
+        }
+        if (headers.get("If-None-Match") or "").strip('"') == obj["etag"]:
+            return 304, meta, b""
+        if method == "HEAD":
+            return 200, {**meta, "Content-Length": str(len(data))}, b""
+        m = re.match(r"bytes=(\d+)-(\d*)", headers.get("Range") or "")
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else len(data) - 1, len(data) - 1)
+            return 206, {**meta, "Content-Range": f"bytes {start}-{end}/{len(data)}"}, data[start:end + 1]
+        return 200, meta, data
+
+
+    def _multipart(self, route, bucket, key, query, headers, body):
+        if route == "CreateMultipartUpload":
+            upload_id = f"upload-{self.next_id()}"
+            self.uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {}}
+            return self._xml(200, "InitiateMultipartUploadResult",
+                             f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>")
+        upload = self.uploads.get(query["uploadId"])
+        if not upload:
+            return self._error(404, "NoSuchUpload")
+        if route == "AbortMultipartUpload":
+            self.uploads.pop(query["uploadId"], None)
+            return 204, {}, b""
+        if route == "UploadPart":
+            if "aws-chunked" in (headers.get("Content-Encoding") or "") \
+                    or (headers.get("x-amz-content-sha256") or "").startswith("STREAMING"):
+                body = self._decode_aws_chunked(body)
+            upload["parts"][int(query["partNumber"])] = body
+            return 200, {"ETag": f'"{hashlib.md5(body).hexdigest()}"'}, b""
+        # CompleteMultipartUpload: parts in order; ETag = md5 of the part md5s + "-<count>"
+        parts = [upload["parts"][n] for n in sorted(upload["parts"])]
+        etag = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts)).hexdigest() + f"-{len(parts)}"
+        self.objects[(bucket, key)] = {"data": b"".join(parts), "etag": etag, "mtime": time.time()}
+        self.uploads.pop(query["uploadId"], None)
+        return self._xml(200, "CompleteMultipartUploadResult",
+                         f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>&quot;{etag}&quot;</ETag>")
+
+
+    def _list(self, bucket: str, query: dict):
+        prefix = query.get("prefix", "")
+        after = query.get("continuation-token") or query.get("start-after") or ""
+        max_keys = int(query.get("max-keys") or 1000)
+        keys = [k for k in self.keys(bucket, prefix) if k > after]
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = "".join(
+            f"<Contents><Key>{escape(k)}</Key>"
+            f"<LastModified>{self._iso(self.objects[(bucket, k)]['mtime'])}</LastModified>"
+            f"<ETag>&quot;{self.objects[(bucket, k)]['etag']}&quot;</ETag>"
+            f"<Size>{len(self.objects[(bucket, k)]['data'])}</Size>"
+            f"<StorageClass>STANDARD</StorageClass></Contents>"
+            for k in page
+        )
+        inner = (f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+                 f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+                 f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{contents}")
+        if truncated:
+            inner += f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>"
+        return self._xml(200, "ListBucketResult", inner)
+
+
+# ----------------------------------------------------------------------
+# Make webhook
+# ----------------------------------------------------------------------
+class FakeMake(FakeServer):
+    name = "make"
+
+    def route(self, method, path, query):
+        return "webhook"
+
+
+    def handle(self, method, path, query, headers, body, route):
+        self.count(route)
+        return 200, {"Content-Type": "text/plain"}, b"Accepted"
+
+
+# ----------------------------------------------------------------------
+# X (v1.1 chunked media upload + v2 create tweet)
+# ----------------------------------------------------------------------
+class FakeX(FakeServer):
+    """
+    POST /1.1/media/upload.json?command=INIT|APPEND|FINALIZE, GET ...?command=STATUS
+    and POST /2/tweets. Videos stay "in_progress" for video_delay after FINALIZE.
+    rate_limit_rate answers that share of calls with a 429 (reset in 1 s);
+    tweet_limit > 0 adds x-rate-limit-* headers to /2/tweets.
+    """
+
+    name = "x"
+
+    def __init__(self, *, video_delay: float = 3.0, rate_limit_rate: float = 0.0, tweet_limit: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.video_delay = video_delay
+        self.rate_limit_rate = rate_limit_rate
+        self.tweet_limit = tweet_limit
+        self.media: dict[str, dict] = {}
+        self.bytes_received = 0
+        self._window = (time.time(), 0)
+
+
+    def route(self, method, path, query):
+        if path.startswith("/2/tweets"):
+            return "tweets"
+        return (query.get("command") or "upload").upper()
+
+
+    def _limit_headers(self) -> dict:
+        if not self.tweet_limit:
+            return {}
+        with self._lock:
+            start, used = self._window
+            if time.time() - start > 900:
+                start, used = time.time(), 0
+            self._window = (start, used + 1)
+        return {
+            "x-rate-limit-limit": str(self.tweet_limit),
+            "x-rate-limit-remaining": str(max(0, self.tweet_limit - used - 1)),
+            "x-rate-limit-reset": str(int(start + 900)),
+        }
+
+
+    def handle(self, method, path, query, headers, body, route):
+        if self.rate_limit_rate and self.rng.random() < self.rate_limit_rate:
+            self.count(route, "429")
+            return _json(429, {"errors": [{"message": "Too Many Requests"}]},
+                         {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(int(time.time()) + 1)})
+        self.count(route)
+
+        if route == "tweets":
+            payload = json.loads(body or b"{}")
+            return _json(201, {"data": {"id": str(10**18 + self.next_id()), "text": payload.get("text", "")}},
+                         self._limit_headers())
+
+        now = time.time()
+        media_id = query.get("media_id")
+        if route == "INIT":
+            media_id = str(10**17 + self.next_id())
+            self.media[media_id] = {"type": query.get("media_type", ""), "bytes": 0, "ready_at": None}
+            return _json(202, {"media_id": int(media_id), "media_id_string": media_id, "expires_after_secs": 86400})
+        m = self.media.get(media_id or "")
+        if m is None:
+            return _json(400, {"errors": [{"message": "invalid media_id"}]})
+        if route == "APPEND":
+            with self._lock:
+                m["bytes"] += len(body)
+                self.bytes_received += len(body)
+            return 204, {}, b""
+        if route == "FINALIZE":
+            out = {"media_id": int(media_id), "media_id_string": media_id, "size": m["bytes"]}
+            if m["type"].startswith("video/"):
+                m["ready_at"] = now + self.video_delay
+                out["processing_info"] = {"state": "pending", "check_after_secs": 1}
+            return _json(201, out)
+        if route == "STATUS":
+            done = not m["ready_at"] or now >= m["ready_at"]
+            info = {"state": "succeeded", "progress_percent": 100} if done else \
+                {"state": "in_progress", "check_after_secs": 1, "progress_percent": 50}
+            return _json(200, {"media_id_string": media_id, "processing_info": info})
+        return _json(400, {"errors": [{"message": f"unknown command {route}"}]})
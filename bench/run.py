@@ -0,0 +1,386 @@
+# bench/run.py — offline end-to-end benchmark against local Graph API / S3 / Make / X stand-ins
+#
+#   python -m bench.run --accounts 20 --items 5                 # threads, one account per thread
+#   python -m bench.run --accounts 200 --items 2 --aio           # post_one_async on one loop
+#   python -m bench.run --accounts 2 --items 12 --nodes 4       # 4 leased workers per bucket
+#   python -m bench.run --x --linkedin --latency 0.05 --error-rate 0.02 --token-expiry-rate 0.01
+#   python -m bench.run ... --json before.json                   # save the report
+#   python -m bench.run ... --baseline before.json               # compare; exit 1 on a regression
+#
+# Everything runs on 127.0.0.1 with made-up credentials; nothing leaves the machine.
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fakes import FakeGraph, FakeMake, FakeS3, FakeX
+
+
+APP_SECRET = "bench-app-secret"
+
+
+def fake_jpeg(size: int, tag: bytes = b"", width: int = 1080, height: int = 1080) -> bytes:
+    """SOI + JFIF + SOF0 (what preflight probes), then tag (distinct content per item), padded to size bytes."""
+    head = (b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+            + b"\xff\xc0\x00\x11\x08" + struct.pack(">HH", height, width)
+            + b"\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01" + tag)
+    return head + b"\x00" * max(0, size - len(head) - 2) + b"\xff\xd9"
+
+
+def fake_mp4(size: int, tag: bytes = b"") -> bytes:
+    head = struct.pack(">I4s4sI", 24, b"ftyp", b"mp42", 0) + b"mp42isom"
+    body = tag + b"\x00" * max(0, size - len(head) - 8 - len(tag))
+    return head + struct.pack(">I4s", 8 + len(body), b"mdat") + body
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send fd 1 to /dev/null (safe_print binds sys.stdout at import, so redirect_stdout misses it)."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def percentile(xs: list[float], q: float) -> float:
+    """Nearest-rank percentile of xs (0 <= q <= 100)."""
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[max(0, min(len(xs) - 1, round(q / 100 * len(xs) + 0.5) - 1))]
+
+
+# ----------------------------------------------------------------------
+# Setup
+# ----------------------------------------------------------------------
+def start_fakes(args) -> dict:
+    common = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate}
+    fakes = {
+        "graph": FakeGraph(
+            image_delay=args.ig_image_delay,
+            video_delay=args.ig_video_delay,
+            token_expiry_rate=args.token_expiry_rate,
+            publish_9007_rate=args.publish_9007_rate,
+            container_error_rate=args.container_error_rate,
+            app_limit=args.app_limit,
+            seed=args.seed,
+            **common,
+        ),
+        "s3": FakeS3(seed=args.seed, **common),
+        "make": FakeMake(seed=args.seed, **common),
+        "x": FakeX(video_delay=args.x_video_delay, rate_limit_rate=args.x_429_rate, seed=args.seed, **common),
+    }
+    for fake in fakes.values():
+        fake.start()
+    return fakes
+
+
+def seed_queue(s3: FakeS3, args) -> list[str]:
+    rng = random.Random(args.seed)
+    buckets = []
+    for a in range(args.accounts):
+        bucket = f"bench-{a:04d}"
+        for n in range(args.items):
+            tag = f"{bucket}/{n}".encode()
+            if rng.random() < args.video_ratio:
+                key, data = f"post/{n:04d}.mp4", fake_mp4(args.video_kb * 1024, tag)
+            else:
+                key, data = f"post/{n:04d}.jpg", fake_jpeg(args.image_kb * 1024, tag)
+            s3.put(bucket, key, data)
+            s3.put(bucket, key.rsplit(".", 1)[0] + ".txt", f"Bench post {a}/{n} #bench".encode())
+        buckets.append(bucket)
+    return buckets
+
+
+class Bench:
+    """
+    One SocialPoster (+ optional XPoster / LinkedInPoster) per fake account, sharing pools like
+    batch_runner. With --nodes N, N posters per account drain the same bucket, each with its own
+    lease owner, as separate hosts would.
+    """
+
+    def __init__(self, args, fakes: dict, workdir: str):
+        from graph_api import GraphClient, make_session
+        from media_source import MediaSource, make_s3_client
+
+        self.args = args
+        self.fakes = fakes
+        self.workdir = workdir
+        pool = max(8, args.accounts * args.nodes * 3)
+        self.session = make_session(pool_connections=4, pool_maxsize=pool)
+        self.s3 = make_s3_client(fakes["s3"].url, "bench", "bench-secret",
+                                 s3={"addressing_style": "path"}, max_pool_connections=pool)
+        self._GraphClient = GraphClient
+        self._MediaSource = MediaSource
+        self.latencies: list[float] = []
+        self.failures: list[str] = []
+        self.posted: Counter = Counter()       # (bucket, key) -> times posted
+        self._lock = threading.Lock()
+
+
+    def build(self, a: int, bucket: str, async_client=None, node: int = 0):
+        from social_post import SocialPoster
+
+        s3_url = self.fakes["s3"].url
+        shared = self.args.nodes > 1
+        source = self._MediaSource(s3_bucket=bucket, media_base_url=f"{s3_url}/{bucket}", s3_client=self.s3,
+                                   claim_ttl=self.args.claim_ttl if shared else None,
+                                   worker_id=f"node-{node}" if shared else None)
+        state = os.path.join(self.workdir, bucket, f"node-{node}") if shared else os.path.join(self.workdir, bucket)
+        os.makedirs(state, exist_ok=True)
+
+        x_poster = None
+        if self.args.x:
+            from bench.xapi import HttpXApi, HttpXClient
+            from x_post import XPoster
+
+            x_url = self.fakes["x"].url
+            x_poster = XPoster(
+                api_key="bench", api_secret="bench", access_token=f"{a}-bench", access_token_secret="bench",
+                s3=self.s3, s3_bucket=bucket, state_dir=state,
+                client=HttpXClient(x_url, self.session), api_v1=HttpXApi(x_url, self.session),
+            )
+
+        preflight = None
+        if self.args.preflight:
+            from preflight import Preflight
+            preflight = Preflight(s3=self.s3, bucket=bucket)
+
+        poster = SocialPoster(
+            fb_app_id="bench",
+            fb_app_secret=APP_SECRET,
+            fb_long_lived_user_token=self.fakes["graph"].user_token,
+            fb_page_id=str(10_000 + a),
+            fb_page_token=f"page-{a}",
+            ig_user_id=str(20_000 + a),
+            ig_page_token="",
+            media_source=source,
+            posts_folder=os.path.join(state, "local"),
+            graph=self._GraphClient(app_secret=APP_SECRET, session=self.session, host=self.fakes["graph"].url),
+            s3_client=self.s3,
+            journal_path=os.path.join(state, "journal.sqlite") if self.args.journal else None,
+            x_poster=x_poster,
+            preflight=preflight,
+            async_client=async_client,
+        )
+        linkedin = None
+        if self.args.linkedin:
+            from linkedin_post import LinkedInPoster
+            linkedin = LinkedInPoster(make_webhook_url=self.fakes["make"].url + "/hook", media_source=source)
+        return poster, linkedin
+
+
+    def record(self, seconds: float, error: Exception | None, label: str, key: str | None = None):
+        with self._lock:
+            if error is None:
+                self.latencies.append(seconds)
+                self.posted[(label, key)] += 1
+            else:
+                self.failures.append(f"{label}: {error}")
+
+
+    # ------------------------------------------------------------------
+    # Runs
+    # ------------------------------------------------------------------
+    def run_account(self, a: int, bucket: str, node: int = 0):
+        poster, linkedin = self.build(a, bucket, node=node)
+        for n in range(self.args.items):
+            t0 = time.perf_counter()
+            try:
+                current = poster.source.current()
+                if not current:
+                    return                     # drained (by this node or its peers)
+                if linkedin:
+                    linkedin.post_one()
+                poster.post_one()
+                self.record(time.perf_counter() - t0, None, bucket, current.key)
+            except Exception as e:
+                self.record(0.0, e, f"{bucket}/{n}")
+                if self.args.stop_on_error:
+                    return
+
+
+    def run_threads(self, buckets: list[str]):
+        nodes = range(self.args.nodes)
+        workers = self.args.workers or len(buckets) * self.args.nodes
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench") as pool:
+            for fut in [pool.submit(self.run_account, a, b, n) for a, b in enumerate(buckets) for n in nodes]:
+                fut.result()
+
+
+    async def run_account_async(self, a: int, bucket: str, client, node: int = 0):
+        poster, linkedin = await asyncio.to_thread(self.build, a, bucket, client, node)
+        for n in range(self.args.items):
+            t0 = time.perf_counter()
+            try:
+                current = await asyncio.to_thread(poster.source.current)
+                if not current:
+                    return
+                if linkedin:
+                    await asyncio.to_thread(linkedin.post_one)
+                await poster.post_one_async()
+                self.record(time.perf_counter() - t0, None, bucket, current.key)
+            except Exception as e:
+                self.record(0.0, e, f"{bucket}/{n}")
+                if self.args.stop_on_error:
+                    return
+
+
+    async def run_async(self, buckets: list[str]):
+        from graph_api import make_async_client
+
+        client = make_async_client(max_connections=max(20, len(buckets) * self.args.nodes * 3))
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.args.workers or 16,
+                                                     thread_name_prefix="bench"))
+        try:
+            await asyncio.gather(*(self.run_account_async(a, b, client, n)
+                                   for a, b in enumerate(buckets) for n in range(self.args.nodes)))
+        finally:
+            await client.aclose()
+
+
+# ----------------------------------------------------------------------
+# Report
+# ----------------------------------------------------------------------
+def report(args, bench: Bench, fakes: dict, wall: float) -> dict:
+    from telemetry import shared_tracer
+
+    ok = len(bench.latencies)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+        "posts": ok,
+        "failed": len(bench.failures),
+        "double_posted": sorted(f"{b}/{k}" for (b, k), n in bench.posted.items() if n > 1),
+        "wall_s": round(wall, 3),
+        "posts_per_s": round(ok / wall, 3) if wall > 0 else 0.0,
+        "latency_s": {
+            "p50": round(percentile(bench.latencies, 50), 3),
+            "p90": round(percentile(bench.latencies, 90), 3),
+            "p99": round(percentile(bench.latencies, 99), 3),
+            "max": round(max(bench.latencies, default=0.0), 3),
+        },
+        "calls": {name: fake.stats() for name, fake in fakes.items()},
+        "calls_per_post": {name: round(fake.stats()["total"] / ok, 2) if ok else None
+                           for name, fake in fakes.items()},
+        "spans": shared_tracer().snapshot(),
+        "failures": bench.failures[:20],
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions beyond tolerance (fraction) in throughput, p50/p99 latency and calls per post."""
+    out = []
+    checks = [("posts_per_s", result["posts_per_s"], baseline.get("posts_per_s"), False)]
+    for q in ("p50", "p99"):
+        checks.append((f"latency {q}", result["latency_s"][q], (baseline.get("latency_s") or {}).get(q), True))
+    for name, n in result["calls_per_post"].items():
+        checks.append((f"{name} calls/post", n, (baseline.get("calls_per_post") or {}).get(name), True))
+    for label, now, before, lower_is_better in checks:
+        if not before or now is None:
+            continue
+        change = (now - before) / before
+        worse = change > tolerance if lower_is_better else change < -tolerance
+        print(f"  {label:<20} {before:>10} -> {now:<10} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+        if worse:
+            out.append(label)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline end-to-end posting benchmark against local fakes.")
+    ap.add_argument("--accounts", type=int, default=4)
+    ap.add_argument("--items", type=int, default=3, help="Queued items (= posts) per account.")
+    ap.add_argument("--workers", type=int, default=0, help="Thread pool size (default: one per account).")
+    ap.add_argument("--aio", action="store_true", help="post_one_async() for every account on one event loop.")
+    ap.add_argument("--nodes", type=int, default=1, help="Posters per account sharing its bucket (leased items).")
+    ap.add_argument("--claim-ttl", type=float, default=900.0, help="Lease TTL (s) with --nodes > 1.")
+    ap.add_argument("--x", action="store_true", help="Post to X in-process (XPoster against the X fake).")
+    ap.add_argument("--linkedin", action="store_true", help="Also send every item to the Make webhook fake.")
+    ap.add_argument("--journal", action="store_true", help="Keep a posting journal per account.")
+    ap.add_argument("--preflight", action="store_true", help="Run media pre-flight (fake media is JPEG-only valid).")
+    ap.add_argument("--video-ratio", type=float, default=0.0)
+    ap.add_argument("--image-kb", type=int, default=256)
+    ap.add_argument("--video-kb", type=int, default=4096)
+    ap.add_argument("--latency", type=float, default=0.02, help="Seconds per request on every fake.")
+    ap.add_argument("--jitter", type=float, default=0.5, help="Latency +/- this fraction.")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500.")
+    ap.add_argument("--token-expiry-rate", type=float, default=0.0, help="Share of Graph calls failing with 190.")
+    ap.add_argument("--publish-9007-rate", type=float, default=0.0, help="Share of IG publishes failing with 9007.")
+    ap.add_argument("--container-error-rate", type=float, default=0.0)
+    ap.add_argument("--ig-image-delay", type=float, default=1.0, help="IG container processing (s).")
+    ap.add_argument("--ig-video-delay", type=float, default=5.0)
+    ap.add_argument("--x-video-delay", type=float, default=3.0)
+    ap.add_argument("--x-429-rate", type=float, default=0.0)
+    ap.add_argument("--app-limit", type=int, default=0, help="Calls/hour behind X-App-Usage (0 = no header).")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--stop-on-error", action="store_true", help="Stop an account at its first failed post.")
+    ap.add_argument("--verbose", action="store_true", help="Keep the posters' own output.")
+    ap.add_argument("--json", help="Write the report here.")
+    ap.add_argument("--baseline", help="Earlier --json report to compare against.")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression vs --baseline (fraction).")
+    args = ap.parse_args()
+
+    fakes = start_fakes(args)
+    buckets = seed_queue(fakes["s3"], args)
+    print(f"🧪 {args.accounts} accounts x {args.items} items x {args.nodes} nodes, {'aio' if args.aio else 'threads'}; "
+          + ", ".join(f"{name} {fake.url}" for name, fake in fakes.items()))
+
+    with tempfile.TemporaryDirectory(prefix="socialpost-bench-") as workdir:
+        bench = Bench(args, fakes, workdir)
+        t0 = time.perf_counter()
+        with contextlib.nullcontext() if args.verbose else quiet():
+            if args.aio:
+                asyncio.run(bench.run_async(buckets))
+            else:
+                bench.run_threads(buckets)
+        wall = time.perf_counter() - t0
+        result = report(args, bench, fakes, wall)
+
+    for fake in fakes.values():
+        fake.stop()
+
+    lat = result["latency_s"]
+    print(f"📊 {result['posts']} posts ({result['failed']} failed) in {result['wall_s']}s: "
+          f"{result['posts_per_s']} posts/s, p50 {lat['p50']}s, p99 {lat['p99']}s, max {lat['max']}s")
+    for name, stats in result["calls"].items():
+        routes = ", ".join(f"{r} {n}" for r, n in sorted(stats["calls"].items()))
+        errors = f"; errors {stats['errors']}" if stats["errors"] else ""
+        print(f"   {name:<5} {stats['total']:>6} calls ({result['calls_per_post'][name]}/post): {routes}{errors}")
+    if result["double_posted"]:
+        print(f"   ‼️ posted more than once: {', '.join(result['double_posted'][:10])}")
+    for failure in result["failures"][:5]:
+        print(f"   ❌ {failure}")
+
+    if args.json:
+        tmp = args.json + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp, args.json)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"📐 vs {args.baseline}:")
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
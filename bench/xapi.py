@@ -0,0 +1,70 @@
+# bench/xapi.py — the slice of tweepy that XPoster/ChunkedUploader use, over plain HTTP to FakeX
+import json
+from types import SimpleNamespace
+
+import requests
+
+
+class XHTTPError(Exception):
+    """Raised for 4xx/5xx; like tweepy's HTTPException it carries .response (status_code, headers)."""
+
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} {response.text[:200]}")
+        self.response = response
+
+
+class _Base:
+    def __init__(self, base_url: str, session: requests.Session | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or requests.Session()
+        self.last_response = None
+
+
+    def _send(self, method: str, path: str, **kwargs):
+        r = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        self.last_response = r
+        if r.status_code >= 400:
+            raise XHTTPError(r)
+        return r
+
+
+class HttpXApi(_Base):
+    """tweepy.API stand-in: chunked_upload_init/append/finalize and get_media_upload_status."""
+
+    PATH = "/1.1/media/upload.json"
+
+
+    def _media(self, r) -> SimpleNamespace | None:
+        return SimpleNamespace(**r.json()) if r.content else None
+
+
+    def chunked_upload_init(self, total_bytes: int, media_type: str, *, media_category: str | None = None):
+        params = {"command": "INIT", "total_bytes": total_bytes, "media_type": media_type}
+        if media_category:
+            params["media_category"] = media_category
+        return self._media(self._send("POST", self.PATH, params=params))
+
+
+    def chunked_upload_append(self, media_id, media, segment_index: int):
+        params = {"command": "APPEND", "media_id": media_id, "segment_index": segment_index}
+        self._send("POST", self.PATH, params=params, data=bytes(media),
+                   headers={"Content-Type": "application/octet-stream"})
+
+
+    def chunked_upload_finalize(self, media_id):
+        return self._media(self._send("POST", self.PATH, params={"command": "FINALIZE", "media_id": media_id}))
+
+
+    def get_media_upload_status(self, media_id):
+        return self._media(self._send("GET", self.PATH, params={"command": "STATUS", "media_id": media_id}))
+
+
+class HttpXClient(_Base):
+    """tweepy.Client stand-in: create_tweet(text=, media_ids=) -> response with .data."""
+
+    def create_tweet(self, *, text: str = "", media_ids=None):
+        body = {"text": text}
+        if media_ids:
+            body["media"] = {"media_ids": [str(m) for m in media_ids]}
+        r = self._send("POST", "/2/tweets", data=json.dumps(body), headers={"Content-Type": "application/json"})
+        return SimpleNamespace(data=r.json()["data"], headers=r.headers)
@@ -0,0 +1,206 @@
+# claims.py — S3 leases so several workers can drain post/ without posting an item twice
+import json
+import os
+import socket
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+def default_owner() -> str:
+    """hostname:pid — unique per worker process; set WORKER_ID for a stable name."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _error_code(e: ClientError) -> str:
+    return str(e.response.get("Error", {}).get("Code"))
+
+
+def _status(e: ClientError):
+    return e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+
+
+class QueueClaims:
+    """
+    One lease object per queued item: claims/<key>.lock = {"owner", "key", "expires"}.
+
+    try_claim() creates it with a conditional PUT (If-None-Match: *), so of two
+    workers racing for the same item exactly one gets a 200 and the other a 412
+    and moves on to the next item. A lease past its "expires" (the worker died
+    mid-post) is taken over with If-Match on the stale lease's ETag, so only one
+    of the workers noticing the expiry wins that too. A worker may always take
+    back its own lease (same owner), e.g. after a failed run.
+
+    The claim is read back after writing; on stores that ignore conditional
+    headers that is what keeps two workers off the same item (last writer wins,
+    the other sees a foreign owner and backs off).
+
+    While this worker holds any lease a background thread renews them every
+    ttl/3, so a post that outlasts the TTL (slow IG video polling, retries)
+    keeps its item. Leases are released when the item leaves post/
+    (MediaSource.forget) or the post failed (MediaSource.release); hosts are
+    expected to keep their clocks in sync (NTP).
+    """
+
+    def __init__(
+        self,
+        *,
+        s3,
+        bucket: str,
+        owner: str | None = None,             # WORKER_ID; default hostname:pid
+        ttl: float = 900.0,                   # seconds a lease lasts without renew()
+        prefix: str = "claims/",
+        verify: bool = True,                  # read the lease back after writing it
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.owner = owner or default_owner()
+        self.ttl = float(ttl)
+        self.prefix = prefix
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._held: dict[str, tuple] = {}     # item key -> (ETag of our lease, expires)
+        self._keeper: threading.Thread | None = None
+
+
+    def lock_key(self, key: str) -> str:
+        return f"{self.prefix}{key}.lock"
+
+
+    def holds(self, key: str) -> bool:
+        """True while a lease this worker wrote is unexpired (by our own clock)."""
+        with self._lock:
+            held = self._held.get(key)
+        return bool(held) and held[1] > time.time()
+
+
+    # ------------------------------------------------------------------
+    # S3 round trips
+    # ------------------------------------------------------------------
+    def _body(self, key: str) -> bytes:
+        now = time.time()
+        return json.dumps({"owner": self.owner, "key": key, "claimed": round(now, 3),
+                           "expires": round(now + self.ttl, 3)}).encode("utf-8")
+
+
+    def _put(self, key: str, **conditions) -> tuple | None:
+        """Write our lease; (ETag, expires), or None when a condition failed."""
+        body = self._body(key)
+        try:
+            resp = self.s3.put_object(Bucket=self.bucket, Key=self.lock_key(key), Body=body,
+                                      ContentType="application/json", **conditions)
+        except ClientError as e:
+            # 412 = the condition failed; 409 = a concurrent conditional write won
+            if _status(e) in (409, 412) or _error_code(e) in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return None
+            raise
+        return (resp.get("ETag") or "").strip('"') or None, json.loads(body)["expires"]
+
+
+    def _read(self, key: str) -> tuple[dict | None, str | None]:
+        """(lease, ETag), or (None, None) when there is no lease."""
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket, Key=self.lock_key(key))
+            body = obj["Body"].read()
+        except ClientError as e:
+            if _error_code(e) in ("404", "NoSuchKey", "NotFound"):
+                return None, None
+            raise
+        try:
+            lease = json.loads(body)
+        except ValueError:
+            lease = {}                        # unreadable: treat as expired
+        return lease, (obj.get("ETag") or "").strip('"') or None
+
+
+    # ------------------------------------------------------------------
+    # Claim / renew / release
+    # ------------------------------------------------------------------
+    def try_claim(self, key: str) -> bool:
+        """True if this worker now holds the lease on key."""
+        if self.holds(key):
+            return True
+        with shared_tracer().span("claim", key=key) as sp:
+            written = self._put(key, IfNoneMatch="*")
+            if written is None:
+                lease, stale = self._read(key)
+                if lease is None:             # released between our PUT and GET
+                    written = self._put(key, IfNoneMatch="*")
+                elif lease.get("owner") == self.owner or float(lease.get("expires") or 0) < time.time():
+                    if lease.get("owner") != self.owner:
+                        safe_print(f"⏳ Lease on {key} held by {lease.get('owner')} expired; taking it over.")
+                    written = self._put(key, IfMatch=f'"{stale}"') if stale else None
+                else:
+                    sp.set(held_by=lease.get("owner"))
+                    return False
+            if written is None:
+                sp.set(lost=True)
+                return False
+            if self.verify:
+                lease, etag = self._read(key)
+                if not lease or lease.get("owner") != self.owner:
+                    sp.set(lost=True, held_by=(lease or {}).get("owner"))
+                    return False
+                written = (etag, float(lease.get("expires") or 0))
+        with self._lock:
+            self._held[key] = written
+            if self._keeper is None:
+                self._keeper = threading.Thread(target=self._keep, name="claims-renew", daemon=True)
+                self._keeper.start()
+        return True
+
+
+    def _keep(self):
+        """Renew every held lease each ttl/3; exits once nothing is held."""
+        while True:
+            time.sleep(self.ttl / 3)
+            with self._lock:
+                keys = list(self._held)
+                if not keys:
+                    self._keeper = None
+                    return
+            for key in keys:
+                with self._lock:
+                    if key not in self._held:    # released meanwhile
+                        continue
+                try:
+                    if not self.renew(key):
+                        safe_print(f"⚠️ Lost the lease on {key}; another worker may post it.")
+                except ClientError as e:
+                    safe_print(f"⚠️ Could not renew the lease on {key}: {e}")
+
+
+    def renew(self, key: str) -> bool:
+        """Push the expiry out by another TTL; False if the lease was lost."""
+        with self._lock:
+            if key not in self._held:
+                return False
+            etag = self._held[key][0]
+        written = self._put(key, IfMatch=f'"{etag}"') if etag else self._put(key)
+        with self._lock:
+            if written is None:
+                self._held.pop(key, None)
+                return False
+            if key in self._held:               # not released while we wrote
+                self._held[key] = written
+        return True
+
+
+    def release(self, keys):
+        """Drop the leases this worker holds among keys (others' leases are left alone)."""
+        with self._lock:
+            mine = [k for k in keys if k in self._held]
+            for k in mine:
+                self._held.pop(k)
+        if not mine:
+            return
+        try:
+            self.s3.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": self.lock_key(k)} for k in mine], "Quiet": True})
+        except ClientError as e:
+            # Left behind, they expire after the TTL; the items are gone from post/ anyway.
+            safe_print(f"⚠️ Could not release leases on {', '.join(mine)}: {e}")
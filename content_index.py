@@ -0,0 +1,132 @@
+# content_index.py — content-addressed index of post/ and posted/, for duplicate detection
+import sqlite3
+import threading
+import time
+
+from safio import safe_print
+
+
+def content_digest(etag: str | None, size: int | None = None) -> str | None:
+    """
+    Content key from S3 metadata. A single-part ETag is the MD5 of the bytes
+    ("md5:<hex>"); a multipart ETag ("<hex>-<parts>") depends on the part size,
+    so it only matches identical uploads and is kept apart ("etag:<etag>:<size>").
+    """
+    etag = (etag or "").strip('"')
+    if not etag:
+        return None
+    if "-" in etag:
+        return f"etag:{etag}:{size}"
+    return f"md5:{etag}"
+
+
+class ContentIndex:
+    """
+    digest -> keys under post/ and posted/, in SQLite (WAL, like the journal).
+
+    post/ rows come for free from the queue index listing (sync_queue);
+    posted/ is relisted at most every resync_after seconds and otherwise
+    kept current by record_moves() as items are archived.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        s3=None,
+        bucket: str | None = None,
+        posted_prefix: str = "posted/",
+        resync_after: float = 24 * 3600,
+    ):
+        self.path = path
+        self.s3 = s3
+        self.bucket = bucket
+        self.posted_prefix = posted_prefix
+        self.resync_after = resync_after
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS content (
+                   key    TEXT PRIMARY KEY,
+                   digest TEXT NOT NULL,
+                   size   INTEGER,
+                   ts     REAL NOT NULL
+               )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS content_digest ON content (digest)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS synced (prefix TEXT PRIMARY KEY, ts REAL NOT NULL)")
+
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def _replace_prefix(self, prefix: str, entries: dict[str, dict]):
+        now = time.time()
+        rows = []
+        for key, meta in entries.items():
+            digest = content_digest(meta.get("etag"), meta.get("size"))
+            if digest:
+                rows.append((key, digest, meta.get("size"), now))
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM content WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff"))
+            self._db.executemany("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO synced VALUES (?, ?)", (prefix, now))
+            self._db.execute("COMMIT")
+
+
+    def sync_queue(self, queue):
+        """Mirror the post/ rows from an S3QueueIndex (no extra S3 request)."""
+        self._replace_prefix(queue.prefix, {k: queue.meta(k) or {} for k in queue.media_keys()})
+
+
+    def sync_posted(self, force: bool = False):
+        """Relist posted/ when the last listing is older than resync_after."""
+        if not (self.s3 and self.bucket):
+            return
+        with self._lock:
+            row = self._db.execute("SELECT ts FROM synced WHERE prefix = ?", (self.posted_prefix,)).fetchone()
+        if not force and row and time.time() - row[0] < self.resync_after:
+            return
+        entries = {}
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.posted_prefix):
+            for c in page.get("Contents") or []:
+                if not c["Key"].lower().endswith(".txt"):
+                    entries[c["Key"]] = {"etag": c.get("ETag"), "size": c.get("Size")}
+        self._replace_prefix(self.posted_prefix, entries)
+        safe_print(f"🧬 Content index: {len(entries)} objects under {self.posted_prefix}")
+
+
+    def record_moves(self, moves: dict[str, str]):
+        """Re-key archived items ({old key: new key}); their content is unchanged."""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE OR REPLACE content SET key = ?, ts = ? WHERE key = ?",
+                [(new, time.time(), old) for old, new in moves.items()],
+            )
+
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def keys_for(self, digest: str | None) -> list[str]:
+        if not digest:
+            return []
+        with self._lock:
+            rows = self._db.execute("SELECT key FROM content WHERE digest = ? ORDER BY key", (digest,)).fetchall()
+        return [r[0] for r in rows]
+
+
+    def posted_duplicates(self, key: str, etag: str | None, size: int | None = None) -> list[str]:
+        """Keys under posted/ with the same content as key."""
+        self.sync_posted()
+        return [k for k in self.keys_for(content_digest(etag, size))
+                if k != key and k.startswith(self.posted_prefix)]
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
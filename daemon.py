@@ -0,0 +1,274 @@
+# daemon.py — resident posting scheduler: warm clients, posting windows with jitter, health/metrics
+#
+#   DAEMON_WINDOWS_SOCIAL="09:00-10:30,17:00-18:30"   one FB/IG(/X) post per window per day
+#   DAEMON_WINDOWS_LINKEDIN="08:30-09:00"            keep LinkedIn's window before the social one
+#   DAEMON_WATCH_SECONDS=15                          queue refresh interval while a due slot waits for media
+#   DAEMON_REFRESH_SECONDS=900                       queue refresh interval otherwise (depth for /metrics)
+#   DAEMON_HTTP_PORT=8765                            /healthz (JSON) and /metrics (Prometheus text)
+import datetime
+import json
+import random
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rate_limit import shared_limiter
+from safio import get_env, load_env, safe_print
+from telemetry import shared_tracer
+
+
+def parse_windows(spec: str | None) -> list[tuple[datetime.time, datetime.time]]:
+    """'09:00-10:30,17:00-18:00' -> [(09:00, 10:30), (17:00, 18:00)]"""
+    windows = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, end = (datetime.time.fromisoformat(x.strip()) for x in part.split("-", 1))
+        windows.append((start, end))
+    return windows
+
+
+class Slot:
+    """One post for one poster, due at a jittered time inside its window."""
+
+    def __init__(self, poster: str, due: float, window_end: float):
+        self.poster = poster
+        self.due = due
+        self.window_end = window_end
+        self.done = False
+
+
+class PostingDaemon:
+    """
+    Keeps the posters (S3 client, HTTP pools, token cache) alive between posts.
+    Each day every window gets one slot at a random time inside it. A slot whose
+    time has come fires as soon as the queue has media, up to the end of its
+    window.
+
+    S3 cost: each queue refresh is one ListObjectsV2 page run (or one
+    conditional manifest GET). Refreshes happen every watch_interval only while
+    a due slot waits for media; otherwise every refresh_interval, which just
+    keeps queue_depth current (the defaults are ~100 requests a day outside the
+    windows). The post itself lists/loads the queue afresh.
+    """
+
+    def __init__(
+        self,
+        *,
+        posters: dict,                         # name -> callable that posts one item
+        windows: dict,                         # name -> [(start, end), ...]
+        source,                                # media_source.MediaSource shared by the posters
+        watch_interval: float = 15.0,           # seconds between refreshes while a slot waits for media
+        refresh_interval: float = 900.0,        # seconds between refreshes otherwise
+    ):
+        self.posters = posters
+        self.windows = windows
+        self.source = source
+        self.watch_interval = watch_interval
+        self.refresh_interval = refresh_interval
+        self._refreshed_at = 0.0
+        self.slots: list[Slot] = []
+        self.planned_for: datetime.date | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.metrics = {
+            "posts_ok": {name: 0 for name in posters},
+            "posts_failed": {name: 0 for name in posters},
+            "slots_missed": {name: 0 for name in posters},
+            "queue_refreshes": 0,
+            "last_post_ts": 0.0,
+            "last_error": None,
+        }
+
+
+    # ------------------------------------------------------------------
+    # Planning
+    # ------------------------------------------------------------------
+    def plan_day(self, day: datetime.date):
+        slots = []
+        for name, windows in self.windows.items():
+            for start, end in windows:
+                t0 = datetime.datetime.combine(day, start).timestamp()
+                t1 = datetime.datetime.combine(day, end).timestamp()
+                if t1 <= time.time():
+                    continue
+                due = random.uniform(max(t0, time.time()), t1)
+                slots.append(Slot(name, due, t1))
+        with self._lock:
+            self.slots = sorted(slots, key=lambda s: s.due)
+            self.planned_for = day
+        for s in self.slots:
+            safe_print(f"🗓️ {s.poster}: slot at {datetime.datetime.fromtimestamp(s.due):%Y-%m-%d %H:%M:%S}")
+
+
+    def next_slot(self) -> Slot | None:
+        with self._lock:
+            pending = [s for s in self.slots if not s.done]
+        return pending[0] if pending else None
+
+
+    # ------------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------------
+    def queue_depth(self) -> int:
+        return self.source.depth()
+
+
+    def tick(self):
+        today = datetime.date.today()
+        if self.planned_for != today:
+            self.plan_day(today)
+
+        now = time.time()
+        if self.waiting(now) or now - self._refreshed_at >= self.refresh_interval:
+            try:
+                self.source.refresh()
+                self.metrics["queue_refreshes"] += 1
+                self._refreshed_at = now
+            except Exception as e:
+                self.metrics["last_error"] = f"queue refresh: {e}"
+                safe_print(f"⚠️ Queue refresh failed: {e}")
+                return
+
+        for slot in list(self.slots):
+            if slot.done or slot.due > now:
+                continue
+            if now > slot.window_end + self.watch_interval:   # one interval of grace for a late wake-up
+                slot.done = True
+                self.metrics["slots_missed"][slot.poster] += 1
+                safe_print(f"⚠️ {slot.poster}: window ended with nothing posted.")
+                continue
+            if not self.queue_depth():
+                continue                        # wait inside the window for new media
+            self.fire(slot)
+
+
+    def waiting(self, now: float) -> bool:
+        """True while a slot is due (and not yet posted or missed)."""
+        with self._lock:
+            return any(not s.done and s.due <= now for s in self.slots)
+
+
+    def fire(self, slot: Slot):
+        slot.done = True
+        self.source.advance()                   # resolve the head of the queue afresh
+        try:
+            self.posters[slot.poster]()
+            self.metrics["posts_ok"][slot.poster] += 1
+            self.metrics["last_post_ts"] = time.time()
+        except Exception as e:
+            self.metrics["posts_failed"][slot.poster] += 1
+            self.metrics["last_error"] = f"{slot.poster}: {e}"
+            safe_print(f"❌ {slot.poster}: {e}")
+
+
+    def run_forever(self):
+        safe_print("🟢 Posting daemon started.")
+        while not self._stop.is_set():
+            self.tick()
+            now = time.time()
+            nxt = self.next_slot()
+            wait = max(self.watch_interval, self._refreshed_at + self.refresh_interval - now)
+            if self.waiting(now):
+                wait = self.watch_interval
+            elif nxt:
+                wait = min(wait, max(1.0, nxt.due - now))
+            self._stop.wait(wait)
+        safe_print("🔴 Posting daemon stopped.")
+
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+    # ------------------------------------------------------------------
+    # Health / metrics
+    # ------------------------------------------------------------------
+    def health(self) -> dict:
+        nxt = self.next_slot()
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "queue_depth": self.queue_depth(),
+            "next_slot": {"poster": nxt.poster, "due": nxt.due} if nxt else None,
+            **self.metrics,
+            "rate_limits": shared_limiter().snapshot(),
+            "spans": shared_tracer().snapshot(),
+        }
+
+
+    def prometheus(self) -> str:
+        m = self.metrics
+        lines = [
+            "# TYPE socialpost_posts_total counter",
+            *[f'socialpost_posts_total{{poster="{p}",result="ok"}} {n}' for p, n in m["posts_ok"].items()],
+            *[f'socialpost_posts_total{{poster="{p}",result="failed"}} {n}' for p, n in m["posts_failed"].items()],
+            "# TYPE socialpost_slots_missed_total counter",
+            *[f'socialpost_slots_missed_total{{poster="{p}"}} {n}' for p, n in m["slots_missed"].items()],
+            "# TYPE socialpost_queue_refreshes_total counter",
+            f"socialpost_queue_refreshes_total {m['queue_refreshes']}",
+            "# TYPE socialpost_queue_depth gauge",
+            f"socialpost_queue_depth {self.queue_depth()}",
+            "# TYPE socialpost_last_post_timestamp_seconds gauge",
+            f"socialpost_last_post_timestamp_seconds {m['last_post_ts']}",
+        ]
+        return "\n".join(lines) + "\n" + shared_tracer().prometheus()
+
+
+    def serve_http(self, port: int) -> ThreadingHTTPServer:
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/healthz"):
+                    body, ctype = json.dumps(daemon.health()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, ctype = daemon.prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, name="daemon-http", daemon=True).start()
+        safe_print(f"📈 Health on :{port}/healthz, metrics on :{port}/metrics")
+        return server
+
+
+def main():
+    load_env()
+    from main import build_posters
+
+    poster, li_poster = build_posters()
+    daemon = PostingDaemon(
+        posters={"social": poster.post_one, "linkedin": li_poster.post_one},
+        windows={
+            "social": parse_windows(get_env("DAEMON_WINDOWS_SOCIAL", "09:00-10:30")),
+            "linkedin": parse_windows(get_env("DAEMON_WINDOWS_LINKEDIN", "08:30-09:00")),
+        },
+        source=poster.source,
+        watch_interval=float(get_env("DAEMON_WATCH_SECONDS", 15)),
+        refresh_interval=float(get_env("DAEMON_REFRESH_SECONDS", 900)),
+    )
+    port = int(get_env("DAEMON_HTTP_PORT", 8765))
+    if port:
+        daemon.serve_http(port)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+# derivatives.py — per-platform renditions, built once per (source ETag, profile) and cached
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+
+from preflight import MB, SPECS, MediaInfo, PreflightError, Spec
+from safio import safe_print
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    spec: Spec                                 # what the rendition has to satisfy
+    long_side: int | None = None               # target long side (images) / cap (video)
+    shrink_above: int | None = None            # in spec but bigger than this -> still use a rendition
+    thumbnail: bool = False
+
+
+def _profiles() -> dict[str, Profile]:
+    long_side = {"instagram": 1080, "x": 2048, "facebook": 2048, "linkedin": 2048}
+    out = {f"{p}_{k}": Profile(f"{p}_{k}", spec, long_side=long_side.get(p) if k == "image" else None)
+           for (p, k), spec in SPECS.items()}
+    # X bytes go out over our own uplink (the Pi), so big originals are shrunk
+    # even when X would accept them. FB/IG/LinkedIn fetch by URL themselves.
+    out["x_image"] = Profile("x_image", SPECS[("x", "image")], long_side=2048, shrink_above=1 * MB)
+    out["thumbnail"] = Profile("thumbnail", Spec(("jpeg",), 1 * MB), long_side=640, thumbnail=True)
+    return out
+
+
+PROFILES = _profiles()
+
+
+def profile_for(platform: str, kind: str) -> Profile | None:
+    return PROFILES.get(f"{platform}_{kind}")
+
+
+# ----------------------------------------------------------------------
+# Rendering (Pillow for images, ffmpeg for video; both imported/located lazily)
+# ----------------------------------------------------------------------
+def _target_box(w: int, h: int, spec: Spec, long_cap: int | None) -> tuple[tuple[int, int], tuple[int, int]]:
+    """(crop w, h) bringing the aspect into range, then (scale w, h) within the size caps."""
+    cw, ch = w, h
+    if spec.min_aspect and w / h < spec.min_aspect:
+        ch = int(w / spec.min_aspect)
+    if spec.max_aspect and w / h > spec.max_aspect:
+        cw = int(h * spec.max_aspect)
+    scale = 1.0
+    for cap, side in ((long_cap or spec.max_long_side, max(cw, ch)), (spec.max_short_side, min(cw, ch))):
+        if cap and side > cap:
+            scale = min(scale, cap / side)
+    even = lambda v: max(2, int(v * scale) // 2 * 2)
+    return (cw, ch), (even(cw), even(ch))
+
+
+def render_image(src: str, dst: str, spec: Spec, long_side: int | None):
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        (cw, ch), (tw, th) = _target_box(im.width, im.height, spec, long_side)
+        left, top = (im.width - cw) // 2, (im.height - ch) // 2
+        im = im.crop((left, top, left + cw, top + ch)).resize((tw, th), Image.LANCZOS)
+        for quality in (90, 85, 80, 70, 60):
+            im.save(dst, "JPEG", quality=quality, optimize=True, progressive=True)
+            if os.path.getsize(dst) <= spec.max_bytes:
+                return
+    raise PreflightError(f"Could not bring {src} under {spec.max_bytes / MB:.0f} MB")
+
+
+def _ffmpeg() -> str:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise PreflightError("ffmpeg not installed; cannot transcode video")
+    return ffmpeg
+
+
+def render_video(src: str, dst: str, info: MediaInfo, spec: Spec, long_side: int | None):
+    (cw, ch), (tw, th) = _target_box(info.width or 1080, info.height or 1920, spec, long_side)
+    cmd = [_ffmpeg(), "-y", "-loglevel", "error", "-i", src,
+           "-vf", f"crop={cw}:{ch},scale={tw}:{th}",
+           "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-pix_fmt", "yuv420p", "-crf", "23",
+           "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart"]
+    if spec.max_duration and info.duration and info.duration > spec.max_duration:
+        cmd += ["-t", str(spec.max_duration)]
+    subprocess.run(cmd + [dst], check=True)
+
+
+def render_thumbnail(src: str, dst: str, info: MediaInfo, profile: Profile):
+    if not info.is_video:
+        render_image(src, dst, profile.spec, profile.long_side)
+        return
+    at = min(1.0, (info.duration or 0) / 2)
+    subprocess.run([_ffmpeg(), "-y", "-loglevel", "error", "-ss", f"{at:.2f}", "-i", src, "-frames:v", "1",
+                    "-vf", f"scale='min({profile.long_side},iw)':-2", "-q:v", "3", dst], check=True)
+
+
+def render(src: str, dst: str, info: MediaInfo, profile: Profile):
+    if profile.thumbnail:
+        render_thumbnail(src, dst, info, profile)
+    elif info.is_video:
+        render_video(src, dst, info, profile.spec, profile.long_side)
+    else:
+        render_image(src, dst, profile.spec, profile.long_side)
+
+
+def extension_for(info: MediaInfo, profile: Profile) -> str:
+    return ".mp4" if info.is_video and not profile.thumbnail else ".jpg"
+
+
+# ----------------------------------------------------------------------
+# Stores
+# ----------------------------------------------------------------------
+class S3Store:
+    """Renditions under <prefix><etag>/<profile>.<ext>, next to the originals (publishable by URL)."""
+
+    def __init__(self, *, s3, bucket: str, prefix: str = "derived/"):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+
+
+    def ref(self, etag: str, profile: str, ext: str) -> str:
+        return f"{self.prefix}{etag}/{profile}{ext}"
+
+
+    def lookup(self, etag: str, profile: str, ext: str) -> str | None:
+        from botocore.exceptions import ClientError
+
+        key = self.ref(etag, profile, ext)
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return key
+        except ClientError:
+            return None
+
+
+    def put(self, etag: str, profile: str, ext: str, path: str) -> str:
+        key = self.ref(etag, profile, ext)
+        self.s3.upload_file(path, self.bucket, key,
+                            ExtraArgs={"ContentType": mimetypes.guess_type(path)[0] or "application/octet-stream"})
+        return key
+
+
+class LocalLRUStore:
+    """
+    Renditions under <root>/<etag>/<profile>.<ext>. Hits refresh the mtime;
+    after every put the least recently used files go until the directory
+    is back under max_bytes.
+    """
+
+    def __init__(self, root: str, *, max_bytes: int = 2048 * MB):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+
+    def ref(self, etag: str, profile: str, ext: str) -> str:
+        return os.path.join(self.root, etag, f"{profile}{ext}")
+
+
+    def lookup(self, etag: str, profile: str, ext: str) -> str | None:
+        path = self.ref(etag, profile, ext)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+
+    def put(self, etag: str, profile: str, ext: str, path: str) -> str:
+        dest = self.ref(etag, profile, ext)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(path, dest)
+        self.evict(keep=dest)
+        return dest
+
+
+    def evict(self, keep: str | None = None):
+        with self._lock:
+            files = []
+            for folder, _, names in os.walk(self.root):
+                for n in names:
+                    p = os.path.join(folder, n)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in files)
+            for _, size, p in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if p == keep:
+                    continue
+                try:
+                    os.remove(p)
+                    total -= size
+                except OSError:
+                    pass
+                try:
+                    os.rmdir(os.path.dirname(p))
+                except OSError:
+                    pass
+
+
+# ----------------------------------------------------------------------
+# Cache
+# ----------------------------------------------------------------------
+class DerivativeCache:
+    """
+    get_many(item, info, profiles) -> {profile: S3 key or local path}.
+    A miss downloads the original once for all missing profiles, renders
+    them, and stores them; every later run (or platform) reuses the result.
+    """
+
+    def __init__(self, *, s3, bucket: str, store, workdir: str | None = None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.store = store
+        self.workdir = workdir
+
+
+    @property
+    def local(self) -> bool:
+        return isinstance(self.store, LocalLRUStore)
+
+
+    def get_many(self, item, info: MediaInfo, profiles) -> dict[str, str]:
+        if not item.etag:
+            raise PreflightError(f"{item.key}: no ETag to key renditions by")
+        out, missing = {}, []
+        for name in dict.fromkeys(profiles):
+            ref = self.store.lookup(item.etag, name, extension_for(info, PROFILES[name]))
+            if ref:
+                out[name] = ref
+            else:
+                missing.append(name)
+        if not missing:
+            return out
+
+        with tempfile.TemporaryDirectory(dir=self.workdir, prefix="renditions-") as tmp:
+            src = os.path.join(tmp, "src" + os.path.splitext(item.key)[1])
+            self.s3.download_file(self.bucket, item.key, src)
+            for name in missing:
+                profile = PROFILES[name]
+                ext = extension_for(info, profile)
+                dst = os.path.join(tmp, name + ext)
+                render(src, dst, info, profile)
+                out[name] = self.store.put(item.etag, name, ext, dst)
+                safe_print(f"🛠️ Rendition {name}: {out[name]}")
+        return out
+
+
+    def get(self, item, info: MediaInfo, profile: str) -> str:
+        return self.get_many(item, info, [profile])[profile]
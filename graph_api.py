@@ -0,0 +1,422 @@
+# graph_api.py — pooled HTTP session + Graph API client shared by every poster
+import asyncio
+import hashlib
+import hmac
+import inspect
+import json
+import threading
+from urllib.parse import quote, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import shared_limiter
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+GRAPH_VERSION = "v21.0"
+GRAPH_HOST = "https://graph.facebook.com"
+RATE_LIMIT_CODES = (4, 17, 32, 613, 80001, 80002, 80004, 80005, 80006, 80008, 80014)
+
+_shared_session = None
+_shared_lock = threading.Lock()
+
+
+def make_session(pool_connections: int = 4, pool_maxsize: int = 8) -> requests.Session:
+    """
+    requests.Session with keep-alive and a bounded connection pool per host.
+    pool_connections = number of hosts kept, pool_maxsize = sockets per host.
+    """
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def shared_session() -> requests.Session:
+    """Process-wide pooled session (Graph API, Make webhook, token renewal)."""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = make_session()
+        return _shared_session
+
+
+class GraphClient:
+    """
+    Thin Graph API client on a pooled session.
+
+    - access_token is attached per call (form body for POST, query for GET)
+    - appsecret_proof is computed once per token and attached centrally
+    - a code 190 (expired/invalid token) response is retried once with the
+      token returned by on_token_expired(old_token)
+    - every call is paced by the rate limiter (app bucket + the bucket of the
+      page / IG user the path starts with); usage headers re-tune it through
+      a response hook, and a rate-limit error is retried once after backing off
+    """
+
+    def __init__(
+        self,
+        *,
+        app_secret: str | None = None,        # for appsecret_proof
+        version: str = GRAPH_VERSION,
+        session: requests.Session | None = None,
+        limiter=None,                          # rate_limit.RateLimiter; default: shared_limiter()
+        host: str = GRAPH_HOST,                # e.g. a local stand-in (bench/)
+    ):
+        self.app_secret = app_secret
+        self.version = version
+        self.host = host.rstrip("/")
+        self.session = session or shared_session()
+        self.limiter = limiter or shared_limiter()
+        self._proofs: dict[str, str] = {}
+
+        hooks = getattr(self.session, "hooks", None)
+        if hooks is not None and self.limiter.graph_hook not in hooks.setdefault("response", []):
+            hooks["response"].append(self.limiter.graph_hook)
+
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def url(self, path: str) -> str:
+        if path.startswith("http"):
+            return path
+        return f"{self.host}/{self.version}/{path.lstrip('/')}"
+
+
+    def proof(self, token: str | None) -> str | None:
+        """appsecret_proof for token (HMAC-SHA256), memoized."""
+        if not (token and self.app_secret):
+            return None
+        p = self._proofs.get(token)
+        if p is None:
+            p = hmac.new(self.app_secret.encode("utf-8"),
+                         msg=token.encode("utf-8"),
+                         digestmod=hashlib.sha256).hexdigest()
+            self._proofs[token] = p
+        return p
+
+
+    @staticmethod
+    def limit_keys(path: str) -> list[str]:
+        """Buckets a call to path counts against: the app, and the object it starts with."""
+        keys = ["graph:app"]
+        head = path.lstrip("/").split("/", 1)[0].split("?", 1)[0]
+        if head.isdigit():
+            keys.append(f"graph:{head}")
+        return keys
+
+
+    def pace(self, path: str, n: int = 1):
+        for key in self.limit_keys(path):
+            self.limiter.acquire(key, n)
+
+
+    @staticmethod
+    def error_code(r: requests.Response):
+        try:
+            return (r.json().get("error") or {}).get("code")
+        except Exception:
+            return None
+
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        token: str | None = None,
+        params: dict | None = None,
+        data: dict | None = None,
+        timeout: float = 30,
+        on_token_expired=None,                 # callable(old_token) -> new_token | None
+        pace: bool = True,                     # False when the caller already paced (batch)
+    ) -> requests.Response:
+        retried_token = retried_rate = False
+        while True:
+            q = dict(params or {})
+            body = dict(data) if data is not None else None
+            if token:
+                if body is not None:
+                    body["access_token"] = token
+                else:
+                    q["access_token"] = token
+                proof = self.proof(token)
+                if proof:
+                    q["appsecret_proof"] = proof
+
+            if pace:
+                self.pace(path)
+            r = self.session.request(method, self.url(path), params=q, data=body, timeout=timeout)
+            if r.ok:
+                return r
+
+            code = self.error_code(r)
+            if code == 190 and on_token_expired and not retried_token:
+                retried_token = True
+                new_token = on_token_expired(token)
+                if new_token:
+                    safe_print(f"🔑 Graph {method} {path}: token expired, retrying with refreshed token.")
+                    shared_tracer().retry("token_expired")
+                    token = new_token
+                    continue
+            if code in RATE_LIMIT_CODES and not retried_rate:
+                retried_rate = True
+                safe_print(f"🚦 Graph {method} {path}: rate limited (code {code}), backing off.")
+                shared_tracer().retry("rate_limit")
+                for key in self.limit_keys(path):
+                    self.limiter.throttled(key)
+                pace = True
+                continue
+            return r
+
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("data", {})
+        return self.request("POST", path, **kwargs)
+
+
+# ----------------------------------------------------------------------
+# asyncio twin (httpx) — many polls/publishes in flight on one event loop
+# ----------------------------------------------------------------------
+def make_async_client(max_connections: int = 100, max_keepalive: int = 20):
+    """httpx.AsyncClient with a bounded pool (httpx is only needed on the async path)."""
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        timeout=30,
+    )
+
+
+class AsyncGraphClient:
+    """
+    GraphClient.request() on an httpx.AsyncClient, for callers running an event
+    loop. URL building, appsecret_proof, the limiter buckets and the code 190 /
+    rate-limit retries are the sync client's; waits use asyncio.sleep, so no
+    thread is held while a call is paced or in flight. on_token_expired may be
+    a plain function or a coroutine function.
+
+    The httpx client is bound to the loop that first uses it: close it (aclose)
+    before that loop ends. Pass client= to share one pool across accounts.
+    """
+
+    def __init__(self, graph: GraphClient, *, client=None):
+        self.graph = graph
+        self.limiter = graph.limiter
+        self._owns_client = client is None
+        self.client = client or make_async_client()
+
+
+    async def pace(self, path: str, n: int = 1):
+        for key in self.graph.limit_keys(path):
+            await self.limiter.acquire_async(key, n)
+
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        token: str | None = None,
+        params: dict | None = None,
+        data: dict | None = None,
+        timeout: float = 30,
+        on_token_expired=None,                 # (async) callable(old_token) -> new_token | None
+        pace: bool = True,
+    ):
+        retried_token = retried_rate = False
+        while True:
+            q = dict(params or {})
+            body = dict(data) if data is not None else None
+            if token:
+                if body is not None:
+                    body["access_token"] = token
+                else:
+                    q["access_token"] = token
+                proof = self.graph.proof(token)
+                if proof:
+                    q["appsecret_proof"] = proof
+
+            if pace:
+                await self.pace(path)
+            r = await self.client.request(method, self.graph.url(path), params=q, data=body, timeout=timeout)
+            self.limiter.observe_graph(r.headers)
+            if r.is_success:
+                return r
+
+            code = self.graph.error_code(r)
+            if code == 190 and on_token_expired and not retried_token:
+                retried_token = True
+                new_token = on_token_expired(token)
+                if inspect.isawaitable(new_token):
+                    new_token = await new_token
+                if new_token:
+                    safe_print(f"🔑 Graph {method} {path}: token expired, retrying with refreshed token.")
+                    shared_tracer().retry("token_expired")
+                    token = new_token
+                    continue
+            if code in RATE_LIMIT_CODES and not retried_rate:
+                retried_rate = True
+                safe_print(f"🚦 Graph {method} {path}: rate limited (code {code}), backing off.")
+                shared_tracer().retry("rate_limit")
+                for key in self.graph.limit_keys(path):
+                    self.limiter.throttled(key)
+                pace = True
+                continue
+            return r
+
+
+    async def get(self, path: str, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+
+    async def post(self, path: str, **kwargs):
+        kwargs.setdefault("data", {})
+        return await self.request("POST", path, **kwargs)
+
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+
+def run_sync(coro):
+    """Drive a coroutine to completion from sync code (main.py, cron, the daemon)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("run_sync() called from a running event loop; await the coroutine instead.")
+
+
+# ----------------------------------------------------------------------
+# Batch requests (POST / with batch=[...], up to 50 operations per call)
+# ----------------------------------------------------------------------
+MAX_BATCH = 50
+
+
+class GraphBatch:
+    """
+    Collect Graph API operations and send them as `batch` requests.
+
+        b = GraphBatch(client, token)
+        c = b.add("POST", f"{ig_user_id}/media", body={...}, name="c1")
+        p = b.add("POST", f"{ig_user_id}/media_publish",
+                  body={"creation_id": "{result=c1:$.id}"}, depends_on="c1")
+        results = b.execute()      # one dict per add(), in order
+
+    Operations linked by depends_on are always sent in the same HTTP call,
+    so a dependency chain never straddles a 50-operation boundary.
+    """
+
+    def __init__(self, client: GraphClient, token: str, *, on_token_expired=None):
+        self.client = client
+        self.token = token
+        self.on_token_expired = on_token_expired
+        self._ops: list[dict] = []
+
+
+    def __len__(self):
+        return len(self._ops)
+
+
+    def add(
+        self,
+        method: str,
+        relative_url: str,
+        *,
+        body: dict | None = None,
+        name: str | None = None,               # referenced as {result=<name>:$.id}
+        depends_on: str | None = None,
+        omit_response_on_success: bool = False,
+    ) -> int:
+        """Queue one operation; returns its index in execute()'s result list."""
+        op = {"method": method.upper(), "relative_url": relative_url.lstrip("/")}
+        if body:
+            # keep {result=name:$.path} references readable for the batch engine
+            op["body"] = urlencode(body, quote_via=quote, safe="{}=:$.*")
+        if name:
+            op["name"] = name
+            op["omit_response_on_success"] = omit_response_on_success
+        if depends_on:
+            op["depends_on"] = depends_on
+        self._ops.append(op)
+        return len(self._ops) - 1
+
+
+    def _chunks(self):
+        """Index groups of at most MAX_BATCH, keeping dependency chains together."""
+        groups, by_name = [], {}
+        for i, op in enumerate(self._ops):
+            parent = op.get("depends_on")
+            if parent in by_name:
+                g = by_name[parent]
+                g.append(i)
+            else:
+                g = [i]
+                groups.append(g)
+            if op.get("name"):
+                by_name[op["name"]] = g
+
+        chunk = []
+        for g in groups:
+            if len(g) > MAX_BATCH:
+                raise ValueError(f"Dependency chain of {len(g)} operations exceeds the batch limit of {MAX_BATCH}.")
+            if len(chunk) + len(g) > MAX_BATCH:
+                yield chunk
+                chunk = []
+            chunk.extend(g)
+        if chunk:
+            yield chunk
+
+
+    def execute(self, timeout: float = 120) -> list[dict]:
+        """
+        Send the queued operations. Returns one {"ok", "code", "body"} per operation;
+        body is the parsed JSON (None when omitted or not run because a dependency failed).
+        """
+        results: list[dict | None] = [None] * len(self._ops)
+        for idx in self._chunks():
+            ops = [self._ops[i] for i in idx]
+            # every operation counts against the quota of the object it targets
+            for op in ops:
+                self.client.pace(op["relative_url"])
+            with shared_tracer().span("graph_batch", ops=len(ops)) as sp:
+                r = self.client.post(
+                    "",
+                    token=self.token,
+                    data={"batch": json.dumps(ops), "include_headers": "false"},
+                    timeout=timeout,
+                    on_token_expired=self.on_token_expired,
+                    pace=False,
+                )
+                sp.set(status=r.status_code)
+            if not r.ok:
+                safe_print("🧺 Graph batch FAIL:", r.status_code, r.text)
+                r.raise_for_status()
+
+            for i, item in zip(idx, r.json()):
+                if item is None:
+                    results[i] = {"ok": False, "code": None, "body": None}
+                    continue
+                try:
+                    body = json.loads(item.get("body") or "null")
+                except ValueError:
+                    body = item.get("body")
+                code = item.get("code")
+                results[i] = {"ok": code is not None and 200 <= code < 300, "code": code, "body": body}
+
+        self._ops = []
+        return results
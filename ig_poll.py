@@ -0,0 +1,226 @@
+# ig_poll.py — IG media container readiness: immediate first check, backoff + jitter
+import asyncio
+import random
+import time
+
+import requests
+
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+GRAPH_BASE = "https://graph.facebook.com/v21.0"
+READY = ("FINISHED", "PUBLISHED")
+FAILED = ("ERROR", "FAILED", "EXPIRED")
+MAX_IDS_PER_READ = 50                         # Graph API limit for ?ids=
+
+
+class IGContainerPoller:
+    """
+    Wait for IG media containers to reach status_code FINISHED.
+
+    The first check is made right away (most image containers are ready in ~1 s),
+    then the delay grows exponentially with jitter up to max_delay, until the
+    image or video time budget runs out. Several containers can be checked with
+    one multi-id read (GET /?ids=a,b,c&fields=status_code).
+
+    fetch_statuses_async / wait_many_async do the same on an httpx.AsyncClient
+    with asyncio.sleep between rounds, for callers running an event loop.
+
+    The poller is shared by concurrent posts, so a caller's own printer is
+    passed per call (printer=...) rather than set on the instance.
+    """
+
+    def __init__(
+        self,
+        *,
+        image_budget: float = 60.0,            # seconds to wait for an image container
+        video_budget: float = 300.0,           # seconds to wait for a Reel container
+        base_delay: float = 1.0,
+        max_delay: float = 15.0,
+        jitter: float = 0.5,                   # +/- fraction applied to every delay
+        session=None,                          # anything with .get(); defaults to requests
+        limiter=None,                          # rate_limit.RateLimiter; paces the status reads
+        printer=safe_print,
+        sleep=time.sleep,
+        graph_base: str = GRAPH_BASE,          # host + version, e.g. a local stand-in
+    ):
+        self.graph_base = graph_base.rstrip("/")
+        self.image_budget = image_budget
+        self.video_budget = video_budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.session = session or requests
+        self.limiter = limiter
+        self.printer = printer
+        self.sleep = sleep
+
+
+    def delay(self, attempt: int) -> float:
+        """Backoff delay before poll number attempt+1 (attempt 0 is the immediate check)."""
+        d = min(self.max_delay, self.base_delay * (2 ** max(attempt - 1, 0)))
+        return max(0.0, d * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+    def budget(self, is_video: bool) -> float:
+        return self.video_budget if is_video else self.image_budget
+
+
+    # ------------------------------------------------------------------
+    # Single container
+    # ------------------------------------------------------------------
+    def wait(self, container_id: str, token: str, appsecret_func=None, is_video: bool = False, printer=None):
+        """Block until container_id is ready; raises RuntimeError / TimeoutError."""
+        self.wait_many([container_id], token, appsecret_func, is_video=is_video, printer=printer)
+
+
+    # ------------------------------------------------------------------
+    # Many containers, one request per round
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _params(token: str, appsecret_func=None) -> dict:
+        params = {"fields": "status_code", "access_token": token}
+        proof = appsecret_func(token) if appsecret_func else None
+        if proof:
+            params["appsecret_proof"] = proof
+        return params
+
+
+    @staticmethod
+    def _chunks(container_ids):
+        ids = list(container_ids)
+        for i in range(0, len(ids), MAX_IDS_PER_READ):
+            yield ids[i:i + MAX_IDS_PER_READ]
+
+
+    def _read(self, chunk, params) -> tuple[str, dict]:
+        """URL + params of the status read for chunk (single id, or ?ids=)."""
+        if len(chunk) == 1:
+            return f"{self.graph_base}/{chunk[0]}", params
+        return f"{self.graph_base}/", {**params, "ids": ",".join(chunk)}
+
+
+    def _collect(self, statuses: dict, chunk, ok: bool, rs, printer):
+        body = None
+        if ok:
+            try:
+                body = {chunk[0]: rs.json()} if len(chunk) == 1 else rs.json()
+            except ValueError:                # e.g. an HTML error page from a proxy
+                body = None
+        if not isinstance(body, dict):
+            printer(f"⚠️ IG poll failed ({rs.status_code}): {rs.text}")
+            statuses.update({cid: None for cid in chunk})
+            return
+        for cid in chunk:
+            statuses[cid] = (body.get(cid) or {}).get("status_code")
+
+
+    def fetch_statuses(self, container_ids, token: str, appsecret_func=None, printer=None) -> dict:
+        """{container_id: status_code|None} using the ?ids= multi-id read (None = unreadable)."""
+        params = self._params(token, appsecret_func)
+        statuses = {}
+        for chunk in self._chunks(container_ids):
+            if self.limiter:
+                self.limiter.acquire("graph:app", len(chunk))   # a multi-id read counts per id
+            url, q = self._read(chunk, params)
+            with shared_tracer().span("ig_poll", ids=len(chunk)) as sp:
+                rs = self.session.get(url, params=q, timeout=30)
+                sp.set(status=rs.status_code)
+            self._collect(statuses, chunk, rs.ok, rs, printer or self.printer)
+        return statuses
+
+
+    async def fetch_statuses_async(self, client, container_ids, token: str, appsecret_func=None,
+                                   printer=None) -> dict:
+        """fetch_statuses() on an httpx.AsyncClient."""
+        params = self._params(token, appsecret_func)
+        statuses = {}
+        for chunk in self._chunks(container_ids):
+            if self.limiter:
+                await self.limiter.acquire_async("graph:app", len(chunk))
+            url, q = self._read(chunk, params)
+            with shared_tracer().span("ig_poll", ids=len(chunk)) as sp:
+                rs = await client.get(url, params=q, timeout=30)
+                sp.set(status=rs.status_code)
+            if self.limiter:
+                self.limiter.observe_graph(rs.headers)
+            self._collect(statuses, chunk, rs.is_success, rs, printer or self.printer)
+        return statuses
+
+
+    def _settle(self, pending: list, done: dict, statuses: dict, attempt: int, printer):
+        """Move ready containers from pending to done; raise on a failed one."""
+        for cid in list(pending):
+            status = statuses.get(cid)
+            if status in READY:
+                done[cid] = status
+                pending.remove(cid)
+            elif status in FAILED:
+                raise RuntimeError(f"IG processing failed for {cid}: {status}")
+        printer(f"⏳ IG poll {attempt + 1}: {len(done)} ready, {len(pending)} pending")
+
+
+    def _next_pause(self, pending: list, attempt: int, deadline: float, is_video: bool) -> float:
+        pause = self.delay(attempt)
+        if time.monotonic() + pause > deadline:
+            raise TimeoutError(f"IG containers {', '.join(pending)} not ready after {self.budget(is_video):.0f}s.")
+        return pause
+
+
+    def wait_many(self, container_ids, token: str, appsecret_func=None, is_video: bool = False,
+                  printer=None) -> dict:
+        """
+        Poll until every container is ready. Returns {container_id: status_code}.
+        Raises RuntimeError on the first container that reports ERROR/EXPIRED and
+        TimeoutError when the budget is used up.
+        """
+        printer = printer or self.printer
+        pending = list(dict.fromkeys(container_ids))
+        done = {}
+        deadline = time.monotonic() + self.budget(is_video)
+        attempt = 0
+
+        while pending:
+            try:
+                statuses = self.fetch_statuses(pending, token, appsecret_func, printer)
+            except requests.RequestException as e:
+                printer(f"⚠️ IG polling error: {e}")
+                statuses = {}
+
+            self._settle(pending, done, statuses, attempt, printer)
+            if not pending:
+                break
+
+            attempt += 1
+            self.sleep(self._next_pause(pending, attempt, deadline, is_video))
+
+        return done
+
+
+    async def wait_many_async(self, client, container_ids, token: str, appsecret_func=None,
+                              is_video: bool = False, printer=None) -> dict:
+        """wait_many() on an httpx.AsyncClient; the loop is free between rounds."""
+        import httpx
+
+        printer = printer or self.printer
+        pending = list(dict.fromkeys(container_ids))
+        done = {}
+        deadline = time.monotonic() + self.budget(is_video)
+        attempt = 0
+
+        while pending:
+            try:
+                statuses = await self.fetch_statuses_async(client, pending, token, appsecret_func, printer)
+            except httpx.HTTPError as e:
+                printer(f"⚠️ IG polling error: {e}")
+                statuses = {}
+
+            self._settle(pending, done, statuses, attempt, printer)
+            if not pending:
+                break
+
+            attempt += 1
+            await asyncio.sleep(self._next_pause(pending, attempt, deadline, is_video))
+
+        return done
@@ -0,0 +1,92 @@
+# journal.py — append-only SQLite journal of per-item, per-platform posting state
+import json
+import sqlite3
+import threading
+import time
+
+
+# States after which a platform step is never repeated for the same item.
+# "scheduled" = an FB post created ahead with scheduled_publish_time.
+FINAL_STATES = ("posted", "published", "copied", "moved", "scheduled")
+
+
+class PostJournal:
+    """
+    Every state change is appended as one row (nothing is updated in place):
+
+        item      media key + ETag, so a re-uploaded file counts as a new item
+        platform  facebook | instagram | linkedin | local | archive
+        state     e.g. container -> published, posted, scheduled, cancelled, copied,
+                  removed, moved, failed
+        ref       container id / post id / local path, when there is one
+
+    The latest row per (item, platform) is the current state, which lets
+    post_one resume only the steps that are still outstanding.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS events (
+                   id       INTEGER PRIMARY KEY AUTOINCREMENT,
+                   ts       REAL NOT NULL,
+                   item     TEXT NOT NULL,
+                   platform TEXT NOT NULL,
+                   state    TEXT NOT NULL,
+                   ref      TEXT,
+                   detail   TEXT
+               )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_item ON events (item, platform, id)")
+
+
+    @staticmethod
+    def item_id(media_key: str, etag: str | None = None) -> str:
+        return f"{media_key}#{etag}" if etag else media_key
+
+
+    def record(self, item: str, platform: str, state: str, ref: str | None = None, detail=None):
+        if detail is not None and not isinstance(detail, str):
+            detail = json.dumps(detail, default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO events (ts, item, platform, state, ref, detail) VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), item, platform, state, ref, detail),
+            )
+
+
+    def state(self, item: str) -> dict[str, dict]:
+        """{platform: {"state", "ref", "ts"}} — latest row for each platform of item."""
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT platform, state, ref, ts FROM events
+                   WHERE id IN (SELECT MAX(id) FROM events WHERE item = ? GROUP BY platform)""",
+                (item,),
+            ).fetchall()
+        return {p: {"state": s, "ref": r, "ts": ts} for p, s, r, ts in rows}
+
+
+    def last_ref(self, item: str, platform: str, state: str) -> str | None:
+        """ref of the most recent `state` row for (item, platform), if any."""
+        with self._lock:
+            row = self._db.execute(
+                """SELECT ref FROM events WHERE item = ? AND platform = ? AND state = ?
+                   ORDER BY id DESC LIMIT 1""",
+                (item, platform, state),
+            ).fetchone()
+        return row[0] if row else None
+
+
+    def done(self, item: str, platform: str) -> dict | None:
+        """The latest row for platform if it is final (never to be repeated), else None."""
+        st = self.state(item).get(platform)
+        return st if st and st["state"] in FINAL_STATES else None
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -6,11 +6,12 @@ import tempfile
 import hmac
 import hashlib
 from urllib.parse import urlparse
-import requests
-import boto3
-from botocore.client import Config
-from botocore.exceptions import ClientError
 from safio import safe_print
+from media_source import MediaSource
+from graph_api import make_async_client, shared_session
+from journal import PostJournal
+from preflight import PreflightError
+from telemetry import shared_tracer
 
 
 DEFAULT_CAPTION = "#MortgageWithAndy #LowMortgageRates #RealEstateInvesting #HomePurchase DM me today."
@@ -23,52 +24,80 @@ class LinkedInPoster:
         # ---- LinkedIn via Make (not our focus now) ----
         make_webhook_url: str | None,
         # ---- Storage (for listing/captions only; NOT used for X media bytes) ----
-        s3_bucket: str,
-        s3_endpoint: str,
-        s3_key: str,
-        s3_secret: str,
+        s3_bucket: str | None = None,
+        s3_endpoint: str | None = None,
+        s3_key: str | None = None,
+        s3_secret: str | None = None,
         # ---- Media URL service (stable public URL for FB/IG) ----
-        media_base_url: str,                  # e.g. https://media.andysabo.com
+        media_base_url: str | None = None,    # e.g. https://media.andysabo.com
+        # ---- Queue index snapshot (optional; shared by all posters) ----
+        queue_cache_path: str | None = None,
+        # ---- Publish manifest (post/manifest.json); None = list post/ ----
+        manifest_key: str | None = None,
+        manifest_cache_path: str | None = None,
+        # ---- Shared bucket: lease items (claims/<key>.lock) so workers never double-post ----
+        claim_ttl: float | None = None,       # seconds; None = single worker
+        worker_id: str | None = None,
+        # ---- Posting journal (SQLite) for idempotent resume; None = off ----
+        journal_path: str | None = None,
+        # ---- Shared media source (media_source.MediaSource); replaces the S3 args ----
+        media_source: MediaSource | None = None,
+        # ---- Duplicate content (content_index.ContentIndex); "flag" | "skip" | "off" ----
+        content_index=None,
+        dedup: str = "flag",
+        # ---- Media pre-flight (preflight.Preflight); None = send the original as is ----
+        preflight=None,
+        # ---- httpx.AsyncClient for post_linkedin_async; built on first use if not given ----
+        async_client=None,
     ):
 
         self.make_webhook_url = make_webhook_url
-
-        # S3 client (for listing keys and reading captions ONLY)
-        endpoint = s3_endpoint if str(s3_endpoint).startswith("http") else f"https://{s3_endpoint}"
-        self.s3_bucket = s3_bucket
-        self.s3 = boto3.client(
-            "s3",
-            endpoint_url=endpoint,
-            aws_access_key_id=s3_key,
-            aws_secret_access_key=s3_secret,
-            config=Config(signature_version="s3v4"),
+        self.journal = PostJournal(journal_path) if journal_path else None
+        self.content_index = content_index
+        self.dedup = dedup
+        self.preflight = preflight
+        self._async_client = async_client
+        self._owns_async_client = async_client is None
+        self.tracer = shared_tracer()
+
+        # S3 client + queue (for listing keys and reading captions ONLY)
+        self.source = media_source or MediaSource(
+            s3_bucket=s3_bucket,
+            s3_endpoint=s3_endpoint,
+            s3_key=s3_key,
+            s3_secret=s3_secret,
+            media_base_url=media_base_url,
+            queue_cache_path=queue_cache_path,
+            manifest_key=manifest_key,
+            manifest_cache_path=manifest_cache_path,
+            claim_ttl=claim_ttl,
+            worker_id=worker_id,
         )
+        self.s3_bucket = self.source.s3_bucket
+        self.s3 = self.source.s3
+        self.queue = self.source.queue
 
         # Media URL base and local cache root
-        self.media_base_url = media_base_url.rstrip("/")
+        self.media_base_url = self.source.media_base_url
 
 
     # ------------------------------------------------------------------
     # Utilities
     # ------------------------------------------------------------------
     def list_post_files(self):
-        """List objects under post/ on iDrive (used to pick ‘next’)."""
-        resp = self.s3.list_objects_v2(Bucket=self.s3_bucket, Prefix="post/")
-        return [c["Key"] for c in (resp.get("Contents") or []) if not c["Key"].endswith("/")]
+        """List objects under post/ on iDrive (all pages, via the cached queue index)."""
+        self.queue.refresh()
+        return self.queue.keys()
 
 
     def read_caption(self, key: str) -> str | None:
         """Read optional post/<name>.txt from iDrive."""
-        try:
-            obj = self.s3.get_object(Bucket=self.s3_bucket, Key=key)
-            return obj["Body"].read().decode("utf-8", errors="replace").strip() or None
-        except ClientError:
-            return None
+        return self.source.read_caption(key)
 
 
     def public_url(self, key: str) -> str:
         """Public URL served by media-service (what FB/IG will fetch)."""
-        return f"{self.media_base_url}/media/{key}"
+        return self.source.public_url(key)
 
 
     @staticmethod
@@ -80,7 +109,8 @@ class LinkedInPoster:
     # ------------------------------------------------------------------
     # LinkedIn via Make (left as-is; we’ll fix scenario later)
     # ------------------------------------------------------------------
-    def post_linkedin(self, message: str, media_url: str | None, is_video: bool):
+    def _linkedin_payload(self, message: str, media_url: str | None, is_video: bool,
+                          thumbnail_url: str | None = None) -> dict:
         if not self.make_webhook_url:
             raise RuntimeError("MAKE_WEBHOOK_URL not set")
         payload = {
@@ -89,35 +119,102 @@ class LinkedInPoster:
             "media_type": "video" if is_video else "image",
             "filename": (media_url or "").split("?")[0].split("/")[-1] if media_url else ""
         }
-        r = requests.post(self.make_webhook_url, json=payload, timeout=120)
+        if thumbnail_url:
+            payload["thumbnail_url"] = thumbnail_url
+        return payload
+
+
+    def post_linkedin(self, message: str, media_url: str | None, is_video: bool, thumbnail_url: str | None = None):
+        payload = self._linkedin_payload(message, media_url, is_video, thumbnail_url)
+        with self.tracer.span("linkedin_post", video=is_video) as sp:
+            r = shared_session().post(self.make_webhook_url, json=payload, timeout=120)
+            sp.set(status=r.status_code)
         safe_print("💼 LinkedIn (via Make):", r.status_code, r.text)
         
         return r.status_code
 
 
+    async def post_linkedin_async(self, message: str, media_url: str | None, is_video: bool,
+                                  thumbnail_url: str | None = None):
+        """post_linkedin() on an httpx.AsyncClient (the webhook can take a while to answer)."""
+        payload = self._linkedin_payload(message, media_url, is_video, thumbnail_url)
+        if self._async_client is None:
+            self._async_client = make_async_client()
+        with self.tracer.span("linkedin_post", video=is_video) as sp:
+            r = await self._async_client.post(self.make_webhook_url, json=payload, timeout=120)
+            sp.set(status=r.status_code)
+        safe_print("💼 LinkedIn (via Make):", r.status_code, r.text)
+        return r.status_code
+
+
+    async def aclose(self):
+        """Close the async client (if this poster built it) before its loop ends."""
+        if self._async_client is not None and self._owns_async_client:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
     # ------------------------------------------------------------------
     # Post ONE item (main.py orchestrates calls)
     # ------------------------------------------------------------------
     def post_one(self):
+        with self.tracer.span("post", poster="linkedin"):
+            return self._post_one()
+
+
+    def _post_one(self):
         safe_print(f"LinkedInPoster.post_one")
-        keys = self.list_post_files()
-        media_files = [k for k in keys if k.lower().endswith((".jpg", ".jpeg", ".png", ".mp4"))]
-        if not media_files:
+        current = self.source.current()
+        if not current:
             safe_print("✅ No media files to post.")
             return
 
-        media_files.sort()
-        media_key = media_files[0]
-        base, ext = os.path.splitext(media_key)
-        is_video = ext.lower() == ".mp4"
-        txt_key = base + ".txt"
+        media_key = current.key
+        if not current.targets("linkedin"):
+            safe_print(f"⏭️ linkedin: {media_key} is not meant for LinkedIn (manifest), skipping.")
+            return
+        item = PostJournal.item_id(media_key, self.source.meta(media_key).get("etag"))
+        if self.journal and self.journal.done(item, "linkedin"):
+            safe_print(f"↩️ linkedin: {media_key} already posted, skipping.")
+            return
 
-        caption = self.read_caption(txt_key) or DEFAULT_CAPTION
-        media_url = self.public_url(media_key)
+        if self.content_index and self.dedup != "off":
+            self.content_index.sync_queue(self.queue)
+            dups = self.content_index.posted_duplicates(media_key, current.etag, current.size)
+            if dups:
+                safe_print(f"♻️ {media_key} has the same content as {', '.join(dups)}")
+                if self.dedup == "skip":
+                    # SocialPoster sets the item aside; nothing to send to LinkedIn.
+                    safe_print(f"⏭️ linkedin: skipping duplicate {media_key}.")
+                    return
+
+        is_video = current.is_video
+        caption = current.caption_for("linkedin") or DEFAULT_CAPTION
+        media_url = current.public_url
+        thumbnail_url = None
+        if self.preflight:
+            prepared = self.preflight.prepare(current, ["linkedin"])
+            try:
+                r = self.preflight.rendition_for(prepared, "linkedin", media_key)
+            except PreflightError as e:
+                # Out of LinkedIn's spec with no rendition: leave the item to the other platforms.
+                safe_print(f"⏭️ linkedin: {media_key} not sent: {e}")
+                if self.journal:
+                    self.journal.record(item, "linkedin", "failed", detail=str(e))
+                return
+            if r.key != media_key:
+                media_url = self.public_url(r.key)
+            if is_video:
+                thumb = self.preflight.thumbnail(current)
+                thumbnail_url = self.public_url(thumb) if thumb else None
 
         safe_print(f"\n🚀 Posting {media_key} ({'video' if is_video else 'image'})")
         safe_print(f"   URL : {media_url}")
         safe_print(f"   Text: {caption}")
 
-        li_res = self.post_linkedin(caption, media_url, is_video)
+        li_res = self.post_linkedin(caption, media_url, is_video, thumbnail_url)
+        if self.journal:
+            ok = 200 <= li_res < 300
+            self.journal.record(item, "linkedin", "posted" if ok else "failed", ref=str(li_res))
+        return li_res
 
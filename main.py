@@ -1,13 +1,154 @@
-from social_post import SocialPoster
-from linkedin_post import LinkedInPoster
+import time
+_T0 = time.perf_counter()
+
 import sys
-from safio import get_env, safe_print
-from dotenv import load_dotenv
+import argparse
+from safio import get_env, load_env, safe_print
+from s3_queue import cached_media_count
 
-load_dotenv()
+# Heavy SDKs (boto3, requests, tweepy) are imported inside build_posters(), so an
+# empty-queue run can finish without paying for them.
 
 
-def main():
+class Timer:
+    """Named phase durations for --timing."""
+
+    def __init__(self):
+        self.last = _T0
+        self.phases = []
+
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+
+    def report(self):
+        parts = ", ".join(f"{name} {secs:.3f}s" for name, secs in self.phases)
+        safe_print(f"⏱️ {parts}, total {time.perf_counter() - _T0:.3f}s")
+        if "telemetry" in sys.modules:
+            from telemetry import shared_tracer
+            spans = shared_tracer().snapshot()
+            for name, st in sorted(spans.items(), key=lambda kv: -kv[1]["seconds"]):
+                safe_print(f"   {name:<14} {st['count']:>3}x {st['seconds']:8.3f}s"
+                           + (f"  ({st['errors']} failed)" if st["errors"] else ""))
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Post the next queued item(s) to LinkedIn, Facebook and Instagram.")
+    ap.add_argument("--batch", type=int, default=0, metavar="N",
+                    help="catch-up mode: post the next N items to FB/IG with Graph batch requests")
+    ap.add_argument("--schedule", type=int, default=0, metavar="N",
+                    help="pre-stage the next N items as scheduled FB posts; daily runs then skip FB for them")
+    ap.add_argument("--schedule-start", metavar="WHEN",
+                    help="first slot for --schedule, ISO date/time in local time (default: 15 minutes from now)")
+    ap.add_argument("--schedule-every", type=float, default=24.0, metavar="HOURS",
+                    help="hours between --schedule slots (default 24)")
+    ap.add_argument("--aio", action="store_true",
+                    help="run FB/IG on an asyncio event loop (httpx) instead of one thread per platform")
+    ap.add_argument("--timing", action="store_true",
+                    help="report startup/setup/run durations")
+    ap.add_argument("--no-fast-path", action="store_true",
+                    help="always build the full clients, even when the queue looks empty")
+    return ap.parse_args(argv)
+
+
+def queue_is_empty() -> bool:
+    """
+    Empty-queue check without boto3: a recent cached listing answers it for free,
+    otherwise one SigV4-signed ListObjectsV2 request does. Any doubt -> False.
+    With a manifest the listing snapshot is not kept current, so it is not used.
+    """
+    if get_env("MANIFEST_KEY"):
+        return False
+    cached = cached_media_count(get_env("QUEUE_CACHE_PATH", "./.post_queue.json"))
+    if cached:
+        count, age = cached
+        if count:
+            return False
+        if age < float(get_env("QUEUE_FAST_PATH_TTL", 300)):
+            return True
+
+    from s3_fast import queue_has_media
+    try:
+        return not queue_has_media(
+            get_env("S3_ENDPOINT"),
+            get_env("S3_BUCKET"),
+            get_env("S3_KEY"),
+            get_env("S3_SECRET"),
+            region=get_env("S3_REGION", "us-east-1"),
+        )
+    except Exception as e:
+        safe_print(f"⚠️ Fast queue check failed, using the full path: {e}")
+        return False
+
+
+def build_posters():
+    from social_post import SocialPoster
+    from linkedin_post import LinkedInPoster
+    from token_cache import TokenCache
+    from media_source import MediaSource
+    from content_index import ContentIndex
+    from preflight import Preflight
+
+    token_cache = TokenCache(
+        get_env("TOKEN_CACHE_PATH", "./.fb_tokens.json"),
+        app_id = get_env("FB_APP_ID"),
+        app_secret = get_env("FB_APP_SECRET"),
+    )
+
+    # One S3 client, one listing and one caption read shared by both posters
+    source = MediaSource(
+        s3_bucket = get_env("S3_BUCKET"),
+        s3_endpoint = get_env("S3_ENDPOINT"),
+        s3_key = get_env("S3_KEY"),
+        s3_secret = get_env("S3_SECRET"),
+        media_base_url = get_env("MEDIA_BASE_URL", "https://media.andysabo.com"),
+        queue_cache_path = get_env("QUEUE_CACHE_PATH", "./.post_queue.json"),
+        # Uploader-maintained order/captions/targets: one conditional GET, no listing
+        manifest_key = get_env("MANIFEST_KEY") or None,
+        manifest_cache_path = get_env("MANIFEST_CACHE_PATH", "./.post_manifest.json"),
+        # Several hosts draining one bucket: lease each item (claims/<key>.lock) first
+        claim_ttl = float(get_env("CLAIM_TTL", 900)) if get_env("QUEUE_CLAIMS", "").lower() in ("1", "true", "yes") else None,
+        worker_id = get_env("WORKER_ID") or None,
+    )
+
+    # Same bytes already under posted/ -> flag (default), skip or ignore (DEDUP_MODE)
+    content_index = ContentIndex(
+        get_env("CONTENT_INDEX_PATH", "./.content_index.sqlite3"),
+        s3 = source.s3,
+        bucket = source.s3_bucket,
+    )
+    dedup = get_env("DEDUP_MODE", "flag").lower()
+
+    # Header-only spec checks before posting. Renditions (Pillow/ffmpeg) are built once
+    # per ETag + profile: PREFLIGHT_TRANSCODE=1 stores them under derived/ for the URL
+    # platforms, DERIVATIVE_CACHE_DIR keeps X's locally (LRU, DERIVATIVE_CACHE_MB).
+    preflight = None
+    if get_env("PREFLIGHT", "1").lower() in ("1", "true", "yes"):
+        from derivatives import DerivativeCache, LocalLRUStore, S3Store
+        derivatives = local_derivatives = None
+        if get_env("PREFLIGHT_TRANSCODE", "").lower() in ("1", "true", "yes"):
+            derivatives = DerivativeCache(
+                s3 = source.s3,
+                bucket = source.s3_bucket,
+                store = S3Store(s3=source.s3, bucket=source.s3_bucket,
+                                prefix=get_env("DERIVED_PREFIX", "derived/")),
+            )
+        if get_env("DERIVATIVE_CACHE_DIR"):
+            local_derivatives = DerivativeCache(
+                s3 = source.s3,
+                bucket = source.s3_bucket,
+                store = LocalLRUStore(get_env("DERIVATIVE_CACHE_DIR"),
+                                      max_bytes=int(float(get_env("DERIVATIVE_CACHE_MB", 2048)) * 1024 * 1024)),
+            )
+        preflight = Preflight(
+            s3 = source.s3,
+            bucket = source.s3_bucket,
+            derivatives = derivatives,
+            local_derivatives = local_derivatives,
+        )
 
     poster = SocialPoster(
         fb_app_id = get_env("FB_APP_ID"),
@@ -17,29 +158,97 @@ def main():
         fb_page_token = get_env("FB_PAGE_TOKEN"),
         ig_user_id = get_env("IG_USER_ID"),
         ig_page_token = get_env("IG_PAGE_TOKEN"),
-        s3_bucket = get_env("S3_BUCKET"),
-        s3_endpoint = get_env("S3_ENDPOINT"),
-        s3_key = get_env("S3_KEY"),
-        s3_secret = get_env("S3_SECRET"),
-        media_base_url = get_env("MEDIA_BASE_URL", "https://media.andysabo.com"),
+        media_source = source,
         posts_folder = get_env("POSTS_FOLDER", "./post"),
+        journal_path = get_env("JOURNAL_PATH", "./.post_journal.sqlite3"),
+        ig_poll_image_budget = float(get_env("IG_POLL_IMAGE_BUDGET", 60)),
+        ig_poll_video_budget = float(get_env("IG_POLL_VIDEO_BUDGET", 300)),
+        token_cache = token_cache,
+        content_index = content_index,
+        dedup = dedup,
+        preflight = preflight,
     )
+    # Checks expiry (debug_token) and refreshes ahead of time, off the posting path.
+    token_cache.start_background()
 
     li_poster = LinkedInPoster(
         make_webhook_url = get_env("MAKE_WEBHOOK_URL"),
-        s3_bucket = get_env("S3_BUCKET"),
-        s3_endpoint = get_env("S3_ENDPOINT"),
-        s3_key = get_env("S3_KEY"),
-        s3_secret = get_env("S3_SECRET"),
-        media_base_url = get_env("MEDIA_BASE_URL", "https://media.andysabo.com"),
+        media_source = source,
+        journal_path = get_env("JOURNAL_PATH", "./.post_journal.sqlite3"),
+        content_index = content_index,
+        dedup = dedup,
+        preflight = preflight,
     )
 
+    if get_env("X_IN_PROCESS", "").lower() in ("1", "true", "yes"):
+        # Post to X from S3 in this run instead of copying to POSTS_FOLDER for xpost.
+        from x_post import XPoster
+        poster.x_poster = XPoster(
+            api_key = get_env("X_API_KEY"),
+            api_secret = get_env("X_API_SECRET"),
+            access_token = get_env("X_ACCESS_TOKEN"),
+            access_token_secret = get_env("X_ACCESS_TOKEN_SECRET"),
+            s3 = poster.s3,
+            s3_bucket = poster.s3_bucket,
+            chunk_size = int(float(get_env("X_UPLOAD_CHUNK_MB", 4)) * 1024 * 1024),
+            state_dir = get_env("X_UPLOAD_STATE_DIR", "./.x_uploads"),
+        )
+
+    return poster, li_poster
+
+
+def main():
+    args = parse_args()
+    load_env()
+    timer = Timer()
+    timer.mark("startup")
+
     try:
-        li_poster.post_one()
-        poster.post_one()
+        if not (args.no_fast_path or args.batch or args.schedule):
+            empty = queue_is_empty()
+            timer.mark("queue check")
+            if empty:
+                safe_print("✅ No media files to post.")
+                return
+
+        poster, li_poster = build_posters()
+        timer.mark("setup")
+
+        if args.schedule > 0:
+            from datetime import datetime
+            start = datetime.fromisoformat(args.schedule_start).timestamp() if args.schedule_start else None
+            results = poster.schedule_facebook(args.schedule, start=start, every=args.schedule_every * 3600)
+            timer.mark("schedule")
+            if not all(r["ok"] for r in results):
+                sys.exit(1)
+            return
+
+        # LinkedIn goes first but on its own: a webhook or spec failure there must
+        # not keep the item from FB/IG/X (it would stay queued and fail every run).
+        li_failed = None
+        try:
+            li_poster.post_one()
+        except Exception as e:
+            li_failed = e
+            safe_print(f"❌ LinkedIn failed: {e}")
+        if args.batch > 0:
+            poster.post_many(args.batch)
+        else:
+            poster.post_one(aio=args.aio)
+        timer.mark("run")
+        if li_failed:
+            sys.exit(1)
     except Exception as e:
         safe_print(f"❌ Fatal error: {e}")
         sys.exit(1)
+    finally:
+        if args.timing:
+            timer.report()
+        # Per-step spans go to TELEMETRY_PATH as they finish; the counters and
+        # histograms of this run go to a Prometheus textfile when asked for.
+        if get_env("TELEMETRY_PROM_PATH") and "telemetry" in sys.modules:
+            from telemetry import shared_tracer
+            shared_tracer().write_prometheus(get_env("TELEMETRY_PROM_PATH"))
 
 
 if __name__ == "__main__":
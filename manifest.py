@@ -0,0 +1,254 @@
+# manifest.py — post/manifest.json: publish order, per-platform captions, targets and not-before times
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class ManifestEntry:
+    key: str                                   # post/<name>.<ext>
+    captions: dict = field(default_factory=dict)  # platform -> caption; "default" for the rest
+    platforms: tuple | None = None             # None = every platform
+    not_before: float | None = None            # epoch seconds; not posted before then
+    caption_key: str | None = None             # post/<name>.txt, if the uploader also wrote one
+    size: int | None = None
+    etag: str | None = None
+
+
+    def caption_for(self, platform: str) -> str | None:
+        return self.captions.get(platform) or self.captions.get("default")
+
+
+def _timestamp(value) -> float | None:
+    """Epoch seconds from a number or an ISO 8601 string (naive = UTC)."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def entry_from_dict(d: dict) -> ManifestEntry:
+    captions = dict(d.get("captions") or {})
+    if d.get("caption") and "default" not in captions:
+        captions["default"] = d["caption"]
+    platforms = d.get("platforms")
+    return ManifestEntry(
+        key=d["key"],
+        captions=captions,
+        platforms=tuple(p.lower() for p in platforms) if platforms else None,
+        not_before=_timestamp(d.get("not_before")),
+        caption_key=d.get("caption_key"),
+        size=d.get("size"),
+        etag=(d.get("etag") or "").strip('"') or None,
+    )
+
+
+def entry_to_dict(e: ManifestEntry) -> dict:
+    d = {"key": e.key}
+    if e.captions:
+        d["captions"] = e.captions
+    if e.platforms:
+        d["platforms"] = list(e.platforms)
+    if e.not_before is not None:
+        d["not_before"] = datetime.fromtimestamp(e.not_before, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    for name in ("caption_key", "size", "etag"):
+        if getattr(e, name) is not None:
+            d[name] = getattr(e, name)
+    return d
+
+
+def parse_manifest(body: bytes | str) -> list[dict]:
+    """
+    Item dicts in publish order. Accepts {"version": 1, "items": [...]} or
+    JSON lines (one item per line; lines without a "key" are skipped).
+    """
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        doc = None
+    if isinstance(doc, dict) and "items" in doc:
+        version = int(doc.get("version") or MANIFEST_VERSION)
+        if version > MANIFEST_VERSION:
+            raise ValueError(f"manifest version {version} is newer than {MANIFEST_VERSION}")
+        items = doc["items"]
+    elif isinstance(doc, list):
+        items = doc
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [d for d in items if isinstance(d, dict) and d.get("key")]
+
+
+def dump_manifest(entries: list[ManifestEntry]) -> bytes:
+    doc = {
+        "version": MANIFEST_VERSION,
+        "generated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "items": [entry_to_dict(e) for e in entries],
+    }
+    return json.dumps(doc, ensure_ascii=False, indent=1).encode("utf-8")
+
+
+class PublishManifest:
+    """
+    The uploader's post/manifest.json, read with one conditional GET per run
+    (If-None-Match against the ETag of the local copy; a 304 costs no body).
+
+    Keys this host has archived are remembered in the local copy until the
+    uploader drops them from the manifest, so a 304 never re-serves them.
+    load() returns None when there is no manifest; callers then fall back
+    to listing post/.
+    """
+
+    def __init__(self, *, s3, bucket: str, key: str = "post/manifest.json", cache_path: str | None = None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._etag: str | None = None
+        self._items: list[dict] = []
+        self._done: set[str] = set()
+        self._loaded = False
+        self._fetched = False
+        self.present = False
+
+
+    # ------------------------------------------------------------------
+    # Local copy
+    # ------------------------------------------------------------------
+    def _load_cache(self):
+        self._loaded = True
+        if not (self.cache_path and os.path.exists(self.cache_path)):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError) as e:
+            safe_print(f"⚠️ Ignoring unreadable manifest cache {self.cache_path}: {e}")
+            return
+        if snap.get("bucket") != self.bucket or snap.get("key") != self.key:
+            return
+        self._etag = snap.get("etag")
+        self._items = snap.get("items") or []
+        self._done = set(snap.get("done") or [])
+
+
+    def save(self):
+        if not self.cache_path:
+            return
+        snap = {"bucket": self.bucket, "key": self.key, "etag": self._etag,
+                "items": self._items, "done": sorted(self._done)}
+        folder = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".manifest-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp, self.cache_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    # ------------------------------------------------------------------
+    # Fetch
+    # ------------------------------------------------------------------
+    def load(self, force: bool = False) -> list[ManifestEntry] | None:
+        """Pending entries in order (once per run unless force), or None without a manifest."""
+        with self._lock:
+            if not self._loaded:
+                self._load_cache()
+            if force or not self._fetched:
+                self._fetch()
+            if not self.present:
+                return None
+            return [entry_from_dict(d) for d in self._items if d["key"] not in self._done]
+
+
+    def expire(self):
+        """Revalidate on the next load() (long-running callers, between items)."""
+        self._fetched = False
+
+
+    def _fetch(self):
+        from botocore.exceptions import ClientError
+
+        with shared_tracer().span("manifest_get", key=self.key) as sp:
+            kwargs = {"Bucket": self.bucket, "Key": self.key}
+            if self._etag and self._items:
+                kwargs["IfNoneMatch"] = f'"{self._etag}"'
+            try:
+                obj = self.s3.get_object(**kwargs)
+            except ClientError as e:
+                code = str(e.response.get("Error", {}).get("Code"))
+                status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+                sp.set(status=status or code)
+                if status == 304 or code in ("304", "NotModified"):
+                    self._fetched = self.present = True
+                    return
+                if code in ("404", "NoSuchKey", "NotFound"):
+                    self._fetched, self.present = True, False
+                    self._etag, self._items = None, []
+                    self.save()
+                    return
+                raise
+            body = obj["Body"].read()
+            sp.set(status=200, bytes=len(body))
+            try:
+                items = parse_manifest(body)
+            except ValueError as e:
+                safe_print(f"⚠️ Unreadable {self.key} ({e}); listing post/ instead.")
+                self._fetched, self.present = True, False
+                return
+            self._etag = (obj.get("ETag") or "").strip('"') or None
+            self._items = items
+            self._done &= {d["key"] for d in items}  # the uploader dropped the rest
+            self._fetched = self.present = True
+            self.save()
+            safe_print(f"🗒️ Manifest {self.key}: {len(items)} items ({len(self._done)} already posted here)")
+
+
+    # ------------------------------------------------------------------
+    # Queries / bookkeeping
+    # ------------------------------------------------------------------
+    def entry(self, key: str) -> ManifestEntry | None:
+        with self._lock:
+            for d in self._items:
+                if d["key"] == key:
+                    return entry_from_dict(d)
+        return None
+
+
+    def next_entry(self, now: float | None = None, skip=()) -> ManifestEntry | None:
+        """First pending entry whose not_before has passed (keys in skip are passed over)."""
+        now = time.time() if now is None else now
+        for e in self.load() or []:
+            if e.key in skip:
+                continue
+            if e.not_before is None or e.not_before <= now:
+                return e
+        return None
+
+
+    def mark_done(self, keys):
+        """Record archived (or set-aside) keys so they are skipped until the uploader drops them."""
+        with self._lock:
+            before = len(self._done)
+            self._done.update(k for k in keys if any(d["key"] == k for d in self._items))
+            if len(self._done) != before:
+                self.save()
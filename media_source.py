@@ -0,0 +1,366 @@
+# media_source.py — one S3 client, one listing and one caption read per run, shared by all posters
+import contextvars
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import boto3
+from botocore.client import Config
+from botocore.exceptions import ClientError
+
+from claims import QueueClaims
+from content_index import content_digest
+from manifest import PublishManifest
+from s3_queue import S3QueueIndex
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+@dataclass
+class MediaItem:
+    key: str                                   # post/<name>.<ext>
+    caption_key: str | None                    # post/<name>.txt, if present
+    caption: str | None                        # None = no caption (posters use DEFAULT_CAPTION)
+    is_video: bool
+    public_url: str
+    size: int | None = None
+    etag: str | None = None
+    captions: dict | None = None               # per-platform captions from the manifest
+    platforms: tuple | None = None             # manifest targets; None = every platform
+    not_before: float | None = None            # manifest schedule (epoch seconds)
+
+
+    def caption_for(self, platform: str) -> str | None:
+        if self.captions:
+            return self.captions.get(platform) or self.captions.get("default") or self.caption
+        return self.caption
+
+
+    def targets(self, platform: str) -> bool:
+        return self.platforms is None or platform in self.platforms
+
+
+def make_s3_client(endpoint: str, key: str, secret: str, **config):
+    endpoint = endpoint if str(endpoint).startswith("http") else f"https://{endpoint}"
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=key,
+        aws_secret_access_key=secret,
+        config=Config(signature_version="s3v4", **config),
+    )
+
+
+class S3RangeSource:
+    """
+    Ranged-read view of an S3 object (X chunked upload, media pre-flight).
+    Each read is one ranged GET, so memory stays bounded by the read size and
+    nothing touches the local disk.
+    """
+
+    def __init__(self, s3, bucket: str, key: str, size: int | None = None, etag: str | None = None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        if size is None or etag is None:
+            head = s3.head_object(Bucket=bucket, Key=key)
+            size = head["ContentLength"]
+            etag = (head.get("ETag") or "").strip('"')
+        self.size = int(size)
+        self.etag = etag
+        self.name = f"s3://{bucket}/{key}"
+        self.digest = content_digest(etag, self.size)
+        self.media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+    def read(self, offset: int, length: int) -> bytes:
+        end = min(offset + length, self.size) - 1
+        if end < offset:
+            return b""
+        obj = self.s3.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{end}")
+        return obj["Body"].read()
+
+
+    def fingerprint(self) -> dict:
+        return {"name": self.name, "size": self.size, "etag": self.etag}
+
+
+class MediaSource:
+    """
+    Owns the S3 client and the post/ queue index. current() resolves the head of
+    the queue once — HEAD check and caption GET run concurrently — and hands the
+    same MediaItem to every poster until advance() is called.
+
+    With manifest_key set, order, captions and targets come from the uploader's
+    manifest (one conditional GET) instead: no listing, no caption GETs, only
+    the HEAD that guards against posting an item that is already gone.
+    """
+
+    def __init__(
+        self,
+        *,
+        s3_bucket: str,
+        s3_endpoint: str | None = None,
+        s3_key: str | None = None,
+        s3_secret: str | None = None,
+        media_base_url: str,                  # e.g. https://media.andysabo.com
+        queue_cache_path: str | None = None,
+        s3_client=None,                       # reuse an existing client instead
+        manifest_key: str | None = None,      # e.g. post/manifest.json; None = list post/
+        manifest_cache_path: str | None = None,
+        claim_ttl: float | None = None,       # seconds; None = single worker, no leases
+        worker_id: str | None = None,         # lease owner; default hostname:pid
+    ):
+        self.s3_bucket = s3_bucket
+        self.s3 = s3_client or make_s3_client(s3_endpoint, s3_key, s3_secret)
+        self.media_base_url = media_base_url.rstrip("/")
+        self.queue = S3QueueIndex(s3=self.s3, bucket=s3_bucket, prefix="post/", cache_path=queue_cache_path)
+        self.manifest = PublishManifest(s3=self.s3, bucket=s3_bucket, key=manifest_key,
+                                        cache_path=manifest_cache_path) if manifest_key else None
+        self.claims = QueueClaims(s3=self.s3, bucket=s3_bucket, owner=worker_id,
+                                  ttl=claim_ttl) if claim_ttl else None
+        self._current: MediaItem | None = None
+        self._resolved = False
+
+
+    # ------------------------------------------------------------------
+    # Utilities
+    # ------------------------------------------------------------------
+    def read_caption(self, key: str) -> str | None:
+        """Read optional post/<name>.txt from iDrive."""
+        with shared_tracer().span("caption_read", key=key) as sp:
+            try:
+                obj = self.s3.get_object(Bucket=self.s3_bucket, Key=key)
+                body = obj["Body"].read()
+            except ClientError as e:
+                sp.set(status=e.response.get("Error", {}).get("Code"))
+                return None
+            sp.set(bytes=len(body))
+            return body.decode("utf-8", errors="replace").strip() or None
+
+
+    def public_url(self, key: str) -> str:
+        """Public URL served by media-service (what FB/IG will fetch)."""
+        return f"{self.media_base_url}/media/{key}"
+
+
+    def meta(self, key: str) -> dict:
+        """{"etag", "size"} from the queue index, else from the manifest."""
+        meta = self.queue.meta(key)
+        if meta:
+            return meta
+        entry = self.manifest.entry(key) if self.manifest else None
+        return {"etag": entry.etag, "size": entry.size} if entry else {}
+
+
+    def caption_key_for(self, media_key: str) -> str | None:
+        entry = self.manifest.entry(media_key) if self.manifest else None
+        if entry:
+            return entry.caption_key
+        return self.queue.caption_key_for(media_key)
+
+
+    def forget(self, keys):
+        """Keys that left post/ (archived or set aside): drop them from the index and the manifest."""
+        for k in keys:
+            self.queue.discard(k)
+        self.queue.save()
+        if self.manifest:
+            self.manifest.mark_done(keys)
+        if self.claims:
+            self.claims.release(keys)
+
+
+    def claim(self, key: str) -> bool:
+        """Lease key for this worker (always True without claims)."""
+        return self.claims is None or self.claims.try_claim(key)
+
+
+    def release(self, keys):
+        """Give up the leases on keys that stay queued (the post failed), so any worker can retry them."""
+        if self.claims:
+            self.claims.release(keys)
+
+
+    def refresh(self):
+        """Revalidate the manifest (conditional GET), or refresh the listing without one."""
+        if self.manifest and self.manifest.load(force=True) is not None:
+            return
+        self.queue.refresh()
+
+
+    def depth(self) -> int:
+        """Items ready to post: due manifest entries, else media keys in the listing."""
+        if self.manifest and self.manifest.present:
+            now = time.time()
+            return sum(1 for e in self.manifest.load() or [] if e.not_before is None or e.not_before <= now)
+        return len(self.queue.media_keys())
+
+
+    def _head(self, key: str) -> dict | None:
+        try:
+            return self.s3.head_object(Bucket=self.s3_bucket, Key=key)
+        except ClientError as e:
+            if str(e.response.get("Error", {}).get("Code")) in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+
+    # ------------------------------------------------------------------
+    # Current item (one resolution per run)
+    # ------------------------------------------------------------------
+    def current(self) -> MediaItem | None:
+        if self._resolved:
+            return self._current
+
+        if self.manifest and self.manifest.load() is not None:
+            self._current = self._current_from_manifest()
+            self._resolved = True
+            return self._current
+
+        self.queue.refresh()
+        skip = set()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="media") as pool:
+            while True:
+                media_key, txt_key = self._next_queued(skip)
+                if not media_key:
+                    item = None
+                    break
+                if not self.claim(media_key):
+                    skip.add(media_key)
+                    continue
+                # The incremental listing misses a .txt uploaded after its media:
+                # without one in the index, GET the expected name (a 404 is cheap).
+                probe_key = txt_key or os.path.splitext(media_key)[0] + ".txt"
+                head = pool.submit(contextvars.copy_context().run, self._head, media_key)
+                caption = pool.submit(contextvars.copy_context().run, self.read_caption, probe_key)
+                meta = head.result()
+                if meta is None:
+                    safe_print(f"⚠️ {media_key} is gone from S3; dropping it from the queue index.")
+                    self.forget([media_key, txt_key] if txt_key else [media_key])
+                    continue
+                text = caption.result()
+                if text is not None and not txt_key:
+                    txt_key = probe_key
+                    self.queue.note(txt_key)          # so archiving moves it along
+                item = MediaItem(
+                    key=media_key,
+                    caption_key=txt_key,
+                    caption=text,
+                    is_video=os.path.splitext(media_key)[1].lower() == ".mp4",
+                    public_url=self.public_url(media_key),
+                    size=meta.get("ContentLength"),
+                    etag=(meta.get("ETag") or "").strip('"') or None,
+                )
+                break
+
+        self._current = item
+        self._resolved = True
+        return item
+
+
+    def _next_queued(self, skip) -> tuple[str | None, str | None]:
+        if not skip:
+            return self.queue.next_item(verify=False)
+        for media_key in self.queue.media_keys():
+            if media_key not in skip:
+                return media_key, self.queue.caption_key_for(media_key)
+        return None, None
+
+
+    def _current_from_manifest(self) -> MediaItem | None:
+        skip = set()
+        while True:
+            entry = self.manifest.next_entry(skip=skip)
+            if not entry:
+                return None
+            if not self.claim(entry.key):
+                skip.add(entry.key)
+                continue
+            meta = self._head(entry.key)
+            if meta is None:
+                safe_print(f"⚠️ {entry.key} is in the manifest but gone from S3; skipping it.")
+                self.forget([entry.key])
+                continue
+            return MediaItem(
+                key=entry.key,
+                caption_key=entry.caption_key,
+                caption=entry.caption_for("default"),
+                is_video=os.path.splitext(entry.key)[1].lower() == ".mp4",
+                public_url=self.public_url(entry.key),
+                size=meta.get("ContentLength"),
+                etag=(meta.get("ETag") or "").strip('"') or entry.etag,
+                captions=entry.captions or None,
+                platforms=entry.platforms,
+                not_before=entry.not_before,
+            )
+
+
+    def upcoming(self, n: int, skip=None, due_only: bool = False) -> list[MediaItem]:
+        """
+        The next n items in queue (or manifest) order, for batch runs and
+        scheduling ahead. Nothing is HEAD-checked or leased; due_only leaves out
+        manifest entries whose not_before has not passed. skip(item) is asked
+        before the caption is read (manifest items already carry theirs).
+
+        Without a manifest post/ is listed in full: an incremental listing would
+        miss captions uploaded after their media and ETags of replaced files.
+        """
+        items = []
+        if self.manifest and self.manifest.load(force=True) is not None:
+            now = time.time()
+            for entry in self.manifest.load():
+                if len(items) == n:
+                    break
+                if due_only and entry.not_before is not None and entry.not_before > now:
+                    continue
+                item = MediaItem(
+                    key=entry.key,
+                    caption_key=entry.caption_key,
+                    caption=entry.caption_for("default"),
+                    is_video=os.path.splitext(entry.key)[1].lower() == ".mp4",
+                    public_url=self.public_url(entry.key),
+                    size=entry.size,
+                    etag=entry.etag,
+                    captions=entry.captions or None,
+                    platforms=entry.platforms,
+                    not_before=entry.not_before,
+                )
+                if not (skip and skip(item)):
+                    items.append(item)
+            return items
+
+        self.queue.refresh(full=True)
+        for media_key in self.queue.media_keys():
+            if len(items) == n:
+                break
+            meta = self.queue.meta(media_key) or {}
+            item = MediaItem(
+                key=media_key,
+                caption_key=self.queue.caption_key_for(media_key),
+                caption=None,
+                is_video=os.path.splitext(media_key)[1].lower() == ".mp4",
+                public_url=self.public_url(media_key),
+                size=meta.get("size"),
+                etag=meta.get("etag") or None,
+            )
+            if not (skip and skip(item)):
+                items.append(item)
+        with_caption = [item for item in items if item.caption_key]
+        if with_caption:
+            with ThreadPoolExecutor(max_workers=min(8, len(with_caption)), thread_name_prefix="media") as pool:
+                futures = [pool.submit(contextvars.copy_context().run, self.read_caption, item.caption_key)
+                           for item in with_caption]
+                for item, fut in zip(with_caption, futures):
+                    item.caption = fut.result()
+        return items
+
+
+    def advance(self):
+        """Forget the resolved item (after it was archived, or to start a new run)."""
+        self._current = None
+        self._resolved = False
+        if self.manifest:
+            self.manifest.expire()
@@ -0,0 +1,374 @@
+# preflight.py — media checks from ranged header reads against per-platform specs
+import struct
+from dataclasses import dataclass
+
+from safio import safe_print
+
+
+MB = 1024 * 1024
+BLOCK = 64 * 1024                              # bytes per ranged read while walking headers
+MAX_MOOV = 32 * MB                             # don't pull absurd moov boxes into memory
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class PreflightError(RuntimeError):
+    """The media does not meet a platform's spec and no compliant derivative exists."""
+
+
+@dataclass
+class MediaInfo:
+    format: str | None                         # jpeg | png | gif | webp | mp4 | mov | None
+    size: int
+    width: int | None = None                   # display size (rotation applied)
+    height: int | None = None
+    duration: float | None = None              # seconds
+    video_codec: str | None = None             # avc1 | hvc1 | ...
+    audio_codec: str | None = None             # mp4a | ...
+    faststart: bool | None = None              # moov before mdat
+
+    @property
+    def is_video(self) -> bool:
+        return self.format in ("mp4", "mov")
+
+    @property
+    def aspect(self) -> float | None:
+        return self.width / self.height if self.width and self.height else None
+
+
+# ----------------------------------------------------------------------
+# Probing — a handful of ranged reads, never the whole object
+# ----------------------------------------------------------------------
+class _Reader:
+    """read(offset, length) over a source, fetching at least BLOCK bytes per request."""
+
+    def __init__(self, source):
+        self.source = source
+        self.size = source.size
+        self._ranges: list[tuple[int, bytes]] = []
+        self.requests = 0
+
+
+    def read(self, offset: int, length: int) -> bytes:
+        for start, data in self._ranges:
+            if start <= offset and offset + length <= start + len(data):
+                return data[offset - start:offset - start + length]
+        data = self.source.read(offset, max(length, BLOCK))
+        self.requests += 1
+        self._ranges.append((offset, data))
+        return data[:length]
+
+
+def _jpeg(r: _Reader, info: MediaInfo):
+    off = 2
+    while off + 4 <= r.size:
+        seg = r.read(off, 4)
+        if len(seg) < 4 or seg[0] != 0xFF:
+            return
+        marker = seg[1]
+        if marker == 0xFF:                     # fill byte
+            off += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            off += 2
+            continue
+        if marker in SOF_MARKERS:
+            sof = r.read(off + 4, 5)
+            info.height, info.width = struct.unpack(">HH", sof[1:5])
+            return
+        if marker == 0xDA:                     # start of scan without a frame header
+            return
+        off += 2 + struct.unpack(">H", seg[2:4])[0]
+
+
+def _boxes(buf: bytes, start: int, end: int):
+    """Yield (type, payload start, box end) for the ISO-BMFF boxes in buf[start:end]."""
+    off = start
+    while off + 8 <= end:
+        size, typ = struct.unpack_from(">I4s", buf, off)
+        head = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", buf, off + 8)[0]
+            head = 16
+        elif size == 0:
+            size = end - off
+        if size < head or off + size > end:
+            return
+        yield typ, off + head, off + size
+        off += size
+
+
+def _find(buf: bytes, start: int, end: int, *path: bytes):
+    for typ, a, b in _boxes(buf, start, end):
+        if typ == path[0]:
+            return (a, b) if len(path) == 1 else _find(buf, a, b, *path[1:])
+    return None
+
+
+def _mp4(r: _Reader, info: MediaInfo):
+    off, moov, mdat_seen = 0, None, False
+    while off + 8 <= r.size:
+        hdr = r.read(off, 16)
+        size, typ = struct.unpack(">I4s", hdr[:8])
+        head = 8
+        if size == 1:
+            size, head = struct.unpack(">Q", hdr[8:16])[0], 16
+        elif size == 0:
+            size = r.size - off
+        if size < head:
+            return
+        if typ == b"moov":
+            moov = (off + head, size - head)
+            break
+        if typ == b"mdat":
+            mdat_seen = True
+        off += size
+    if not moov or moov[1] > MAX_MOOV:
+        return
+    info.faststart = not mdat_seen
+
+    m = r.read(*moov)
+    for typ, a, b in _boxes(m, 0, len(m)):
+        if typ == b"mvhd":
+            if m[a] == 1:
+                timescale, duration = struct.unpack_from(">IQ", m, a + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", m, a + 12)
+            info.duration = duration / timescale if timescale else None
+        elif typ == b"trak":
+            hdlr = _find(m, a, b, b"mdia", b"hdlr")
+            stsd = _find(m, a, b, b"mdia", b"minf", b"stbl", b"stsd")
+            handler = m[hdlr[0] + 8:hdlr[0] + 12] if hdlr else None
+            codec = m[stsd[0] + 12:stsd[0] + 16].decode("latin-1") if stsd else None
+            if handler == b"vide" and not info.video_codec:
+                info.video_codec = codec
+                tkhd = _find(m, a, b, b"tkhd")
+                if tkhd:
+                    matrix = tkhd[0] + (52 if m[tkhd[0]] == 1 else 40)
+                    ma, mb = struct.unpack_from(">ii", m, matrix)
+                    w, h = (v >> 16 for v in struct.unpack_from(">II", m, matrix + 36))
+                    if ma == 0 and mb != 0:    # rotated 90/270 degrees
+                        w, h = h, w
+                    info.width, info.height = w, h
+            elif handler == b"soun" and not info.audio_codec:
+                info.audio_codec = codec
+
+
+def probe(source) -> MediaInfo:
+    """Identify source (anything with size + read(offset, length)) from its headers."""
+    r = _Reader(source)
+    head = r.read(0, 32)
+    info = MediaInfo(format=None, size=r.size)
+    if head[:3] == b"\xff\xd8\xff":
+        info.format = "jpeg"
+        _jpeg(r, info)
+    elif head[:8] == b"\x89PNG\r\n\x1a\n":
+        info.format = "png"
+        info.width, info.height = struct.unpack(">II", head[16:24])
+    elif head[:4] == b"GIF8":
+        info.format = "gif"
+        info.width, info.height = struct.unpack("<HH", head[6:10])
+    elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        info.format = "webp"
+    elif head[4:8] == b"ftyp":
+        info.format = "mov" if head[8:12] == b"qt  " else "mp4"
+        _mp4(r, info)
+    return info
+
+
+# ----------------------------------------------------------------------
+# Platform specs
+# ----------------------------------------------------------------------
+@dataclass(frozen=True)
+class Spec:
+    formats: tuple
+    max_bytes: int
+    min_aspect: float | None = None
+    max_aspect: float | None = None
+    min_width: int | None = None
+    max_long_side: int | None = None
+    max_short_side: int | None = None
+    min_duration: float | None = None
+    max_duration: float | None = None
+    video_codecs: tuple = ()
+    audio_codecs: tuple = ()
+    faststart: bool = False                    # moov must come before mdat
+
+    def problems(self, info: MediaInfo) -> list[str]:
+        out = []
+        if info.format not in self.formats:
+            out.append(f"format {info.format or 'unknown'} not in {'/'.join(self.formats)}")
+        if info.size > self.max_bytes:
+            out.append(f"{info.size / MB:.1f} MB > {self.max_bytes / MB:.0f} MB")
+        a = info.aspect
+        if a and self.min_aspect and a < self.min_aspect - 0.005:
+            out.append(f"aspect {a:.2f} < {self.min_aspect:.2f}")
+        if a and self.max_aspect and a > self.max_aspect + 0.005:
+            out.append(f"aspect {a:.2f} > {self.max_aspect:.2f}")
+        if info.width and self.min_width and info.width < self.min_width:
+            out.append(f"width {info.width} < {self.min_width}")
+        if info.width and info.height:
+            long_side, short_side = max(info.width, info.height), min(info.width, info.height)
+            if self.max_long_side and long_side > self.max_long_side:
+                out.append(f"{info.width}x{info.height} exceeds {self.max_long_side}px")
+            if self.max_short_side and short_side > self.max_short_side:
+                out.append(f"{info.width}x{info.height} exceeds {self.max_short_side}px on the short side")
+        if info.duration is not None:
+            if self.min_duration and info.duration < self.min_duration:
+                out.append(f"duration {info.duration:.1f}s < {self.min_duration:.0f}s")
+            if self.max_duration and info.duration > self.max_duration:
+                out.append(f"duration {info.duration:.0f}s > {self.max_duration:.0f}s")
+        if self.video_codecs and info.video_codec and info.video_codec not in self.video_codecs:
+            out.append(f"video codec {info.video_codec}")
+        if self.audio_codecs and info.audio_codec and info.audio_codec not in self.audio_codecs:
+            out.append(f"audio codec {info.audio_codec}")
+        if self.faststart and info.faststart is False:
+            out.append("moov atom after mdat (not faststart)")
+        return out
+
+
+H264 = ("avc1", "avc3")
+SPECS = {
+    ("instagram", "image"): Spec(("jpeg",), 8 * MB, min_aspect=0.8, max_aspect=1.91, min_width=320),
+    ("instagram", "video"): Spec(("mp4", "mov"), 1024 * MB, min_aspect=0.01, max_aspect=10, max_long_side=1920,
+                                 min_duration=3, max_duration=900, video_codecs=H264 + ("hvc1", "hev1"),
+                                 audio_codecs=("mp4a",), faststart=True),
+    ("facebook", "image"): Spec(("jpeg", "png", "gif", "webp"), 10 * MB),
+    ("facebook", "video"): Spec(("mp4", "mov"), 1024 * MB, max_duration=240 * 60),
+    ("x", "image"): Spec(("jpeg", "png", "gif", "webp"), 5 * MB),
+    ("x", "video"): Spec(("mp4", "mov"), 512 * MB, min_aspect=1 / 3, max_aspect=3, max_long_side=1920,
+                         max_short_side=1200, min_duration=0.5, max_duration=140, video_codecs=H264,
+                         audio_codecs=("mp4a",)),
+    ("linkedin", "image"): Spec(("jpeg", "png", "gif"), 10 * MB),
+    ("linkedin", "video"): Spec(("mp4",), 500 * MB, min_duration=3, max_duration=30 * 60),
+}
+
+# ----------------------------------------------------------------------
+# Stage
+# ----------------------------------------------------------------------
+@dataclass
+class Rendition:
+    key: str                                   # S3 key to publish (original or derived/...)
+    path: str | None = None                    # local file, when the rendition lives in the local cache
+    profile: str | None = None                 # None = the original
+
+
+class Preflight:
+    """
+    Check the queued item against each platform's spec before anything is sent.
+    The probe reads only headers (JPEG SOF / PNG IHDR / MP4 moov) with ranged
+    GETs. A platform whose spec fails gets a rendition from the derivative
+    cache (derivatives.DerivativeCache), otherwise a PreflightError for just
+    that platform. Profiles with shrink_above also get a rendition when the
+    original is in spec but needlessly large.
+
+    derivatives serves renditions by URL (S3 store); local_derivatives (local
+    LRU store) serves those for local_platforms, whose bytes we upload ourselves.
+    """
+
+    def __init__(
+        self,
+        *,
+        s3,
+        bucket: str,
+        derivatives=None,
+        local_derivatives=None,
+        local_platforms: tuple = ("x",),
+        specs: dict | None = None,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.derivatives = derivatives
+        self.local_derivatives = local_derivatives
+        self.local_platforms = local_platforms
+        self.specs = specs or SPECS
+        self._probes: dict[tuple, MediaInfo] = {}
+
+
+    def probe(self, key: str, size: int | None = None, etag: str | None = None) -> MediaInfo:
+        from media_source import S3RangeSource  # boto3; the parsers above need none
+
+        source = S3RangeSource(self.s3, self.bucket, key, size=size, etag=etag)
+        cache_key = (key, source.etag)
+        if cache_key not in self._probes:
+            self._probes[cache_key] = probe(source)
+        return self._probes[cache_key]
+
+
+    def _cache_for(self, platform: str):
+        if platform in self.local_platforms and self.local_derivatives:
+            return self.local_derivatives
+        return self.derivatives
+
+
+    def prepare(self, item, platforms) -> dict:
+        """
+        {platform: Rendition} for each platform, or a PreflightError in its place
+        when the media is out of spec and cannot be fixed. item is a MediaItem.
+        """
+        from derivatives import profile_for    # derivatives imports this module
+
+        try:
+            info = self.probe(item.key, item.size, item.etag)
+        except Exception as e:
+            # A probe problem must not block posting; the platforms get the original.
+            safe_print(f"⚠️ Pre-flight probe failed for {item.key}: {e}")
+            return {p: Rendition(item.key) for p in platforms}
+
+        kind = "video" if info.is_video else "image"
+        out, wanted = {}, {}                   # wanted: platform -> (profile, required)
+        for platform in platforms:
+            spec = self.specs.get((platform, kind))
+            problems = spec.problems(info) if spec else []
+            profile = profile_for(platform, kind)
+            cache = self._cache_for(platform)
+            if problems:
+                safe_print(f"🔎 {platform}: {item.key} out of spec: {'; '.join(problems)}")
+                if cache and profile:
+                    wanted[platform] = (profile.name, "; ".join(problems))
+                else:
+                    out[platform] = PreflightError(f"{platform}: {'; '.join(problems)}")
+            elif cache and profile and profile.shrink_above and info.size > profile.shrink_above:
+                wanted[platform] = (profile.name, None)
+            else:
+                out[platform] = Rendition(item.key)
+
+        for cache in {id(self._cache_for(p)): self._cache_for(p) for p in wanted}.values():
+            mine = {p: w for p, w in wanted.items() if self._cache_for(p) is cache}
+            refs, error = {}, None
+            try:
+                refs = cache.get_many(item, info, [name for name, _ in mine.values()])
+            except Exception as e:
+                error = e
+            for platform, (name, problems) in mine.items():
+                ref = refs.get(name)
+                if ref and cache.local:
+                    out[platform] = Rendition(item.key, path=ref, profile=name)
+                elif ref:
+                    out[platform] = Rendition(ref, profile=name)
+                elif problems:
+                    out[platform] = PreflightError(f"{platform}: {problems} (rendition failed: {error})")
+                else:
+                    # Only an optimisation: fall back to the original.
+                    safe_print(f"⚠️ {platform}: rendition {name} failed, using the original: {error}")
+                    out[platform] = Rendition(item.key)
+        return out
+
+
+    def thumbnail(self, item) -> str | None:
+        """S3 key of the item's thumbnail rendition, when the S3 derivative cache is on."""
+        if not (self.derivatives and not self.derivatives.local):
+            return None
+        try:
+            return self.derivatives.get(item, self.probe(item.key, item.size, item.etag), "thumbnail")
+        except Exception as e:
+            safe_print(f"⚠️ Thumbnail for {item.key} failed: {e}")
+            return None
+
+
+    @staticmethod
+    def rendition_for(prepared: dict, platform: str, default: str) -> Rendition:
+        """The rendition to publish for platform; raises the platform's PreflightError."""
+        v = prepared.get(platform) or Rendition(default)
+        if isinstance(v, Exception):
+            raise v
+        return v
@@ -0,0 +1,235 @@
+# rate_limit.py — token buckets per app / page / IG user / X account, tuned from usage headers
+import asyncio
+import json
+import threading
+import time
+
+from safio import safe_print
+
+
+class RateLimitExceeded(RuntimeError):
+    """The wait for quota would exceed the limiter's max_wait."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens/second, at most `capacity` banked.
+    Tokens are reserved before the caller sleeps, so concurrent callers queue
+    up behind each other instead of all waking at once.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0               # monotonic; set when the platform says "stop"
+        self.info: dict = {}                   # last parsed usage, for snapshot()
+
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def reserve(self, n: float = 1) -> float:
+        """Take n tokens; returns how long the caller has to wait before using them."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= n
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Paces calls per key ("graph:app", "graph:<page or IG user id>", "x:<account>")
+    and re-tunes each bucket from the usage the platform reports:
+
+    - Graph X-App-Usage / X-Business-Use-Case-Usage: percentages of the rolling
+      quota. Below soft_pct the bucket runs at its base rate; from there it slows
+      linearly and stops at target_pct (or for estimated_time_to_regain_access).
+    - X x-rate-limit-remaining / -reset: the remaining calls are spread evenly
+      over the rest of the window; at zero the bucket waits for the reset.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = 1.0,                     # base calls/second per key
+        capacity: float = 50.0,                # burst (one full Graph batch)
+        soft_pct: float = 75.0,
+        target_pct: float = 95.0,
+        cooldown: float = 60.0,                # pause once usage reaches target_pct
+        max_wait: float = 120.0,               # longer waits raise RateLimitExceeded
+        sleep=time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.soft_pct = soft_pct
+        self.target_pct = target_pct
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            return b
+
+
+    def _reserve(self, key: str, n: float, max_wait: float | None) -> float:
+        max_wait = self.max_wait if max_wait is None else max_wait
+        b = self.bucket(key)
+        with self._lock:
+            wait = b.reserve(n)
+            if wait > max_wait:
+                b.tokens += n                  # give the reservation back
+                raise RateLimitExceeded(f"{key}: quota frees up in {wait:.0f}s (max wait {max_wait:.0f}s)")
+        if wait > 0:
+            safe_print(f"🚦 {key}: pacing {wait:.1f}s")
+        return wait
+
+
+    def acquire(self, key: str, n: float = 1, *, max_wait: float | None = None):
+        """Block until n calls may be made under key."""
+        wait = self._reserve(key, n, max_wait)
+        if wait > 0:
+            self.sleep(wait)
+
+
+    async def acquire_async(self, key: str, n: float = 1, *, max_wait: float | None = None):
+        """acquire() for event-loop callers: same buckets, but waits with asyncio.sleep."""
+        wait = self._reserve(key, n, max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+    def throttled(self, key: str):
+        """A call under key was rejected for rate reasons: back off for cooldown."""
+        b = self.bucket(key)
+        with self._lock:
+            b.tokens = min(b.tokens, 0)
+            b.block_for(self.cooldown)
+
+
+    # ------------------------------------------------------------------
+    # Graph API
+    # ------------------------------------------------------------------
+    def _apply_usage(self, key: str, pct: float, regain_s: float = 0.0, **info):
+        b = self.bucket(key)
+        with self._lock:
+            b.info = {"usage_pct": pct, **info}
+            if regain_s > 0:
+                b.block_for(regain_s)
+            if pct >= self.target_pct:
+                b.rate = b.base_rate / 100
+                b.tokens = min(b.tokens, 0)
+                b.block_for(self.cooldown)
+            elif pct >= self.soft_pct:
+                factor = (self.target_pct - pct) / (self.target_pct - self.soft_pct)
+                b.rate = max(b.base_rate / 100, b.base_rate * factor)
+            else:
+                b.rate = b.base_rate
+        if pct >= self.soft_pct or regain_s > 0:
+            safe_print(f"🚦 {key}: {pct:.0f}% of quota used"
+                       + (f", blocked {regain_s:.0f}s" if regain_s > 0 else ""))
+
+
+    def observe_graph(self, headers):
+        """Feed X-App-Usage / X-Business-Use-Case-Usage from any Graph response."""
+        app = headers.get("X-App-Usage")
+        if app:
+            try:
+                u = json.loads(app)
+                self._apply_usage("graph:app", max(float(v) for v in u.values()), **u)
+            except (ValueError, TypeError):
+                pass
+
+        buc = headers.get("X-Business-Use-Case-Usage")
+        if buc:
+            try:
+                for obj_id, entries in json.loads(buc).items():
+                    for e in entries or []:
+                        pct = max(float(e.get(k) or 0) for k in ("call_count", "total_cputime", "total_time"))
+                        regain = float(e.get("estimated_time_to_regain_access") or 0) * 60
+                        self._apply_usage(f"graph:{obj_id}", pct, regain, type=e.get("type"))
+            except (ValueError, TypeError, AttributeError):
+                pass
+
+
+    def graph_hook(self, r, *args, **kwargs):
+        """requests response hook: observe usage headers on every response that has them."""
+        self.observe_graph(r.headers)
+        return r
+
+
+    # ------------------------------------------------------------------
+    # X
+    # ------------------------------------------------------------------
+    def observe_x(self, key: str, headers):
+        """Feed x-rate-limit-remaining / -limit / -reset (epoch seconds)."""
+        if not headers or headers.get("x-rate-limit-remaining") is None:
+            return
+        try:
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset_in = max(1.0, float(headers.get("x-rate-limit-reset") or 0) - time.time())
+            limit = int(headers.get("x-rate-limit-limit") or 0) or None
+        except (ValueError, TypeError):
+            return
+        b = self.bucket(key)
+        with self._lock:
+            b.info = {"remaining": remaining, "limit": limit, "reset_in": round(reset_in)}
+            if remaining <= 0:
+                b.tokens = min(b.tokens, 0)
+                b.block_for(reset_in + 1)
+            else:
+                b.rate = remaining / reset_in
+                b.tokens = min(b.tokens, remaining)
+
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def note(self, key: str, **info):
+        """Attach extra quota facts (e.g. IG content_publishing_limit) to a key."""
+        b = self.bucket(key)
+        with self._lock:
+            b.info = {**b.info, **info}
+
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "rate": round(b.rate, 4),
+                    "tokens": round(min(b.capacity, b.tokens + (now - b.updated) * b.rate), 2),
+                    "blocked_for": round(max(0.0, b.blocked_until - now), 1),
+                    **b.info,
+                }
+                for key, b in self._buckets.items()
+            }
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def shared_limiter() -> RateLimiter:
+    """Process-wide limiter, so every poster paces against the same quotas."""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
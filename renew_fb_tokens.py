@@ -1,6 +1,8 @@
 import os
-import requests
+import tempfile
 from dotenv import load_dotenv
+from graph_api import GraphClient
+from token_cache import USER, TokenCache, page_name
 
 load_dotenv()
 ENV_PATH = ".env"
@@ -12,19 +14,32 @@ FB_APP_ID = os.getenv("FB_APP_ID")
 FB_APP_SECRET = os.getenv("FB_APP_SECRET")
 FB_SHORT_LIVED_USER_TOKEN = os.getenv("FB_SHORT_LIVED_USER_TOKEN")
 
+# One pooled client for every call in this run (keep-alive to graph.facebook.com)
+graph = GraphClient(app_secret=FB_APP_SECRET, version="v19.0")
+
+# Keep the posting side's token cache in step with .env
+token_cache = TokenCache(
+    os.getenv("TOKEN_CACHE_PATH", "./.fb_tokens.json"),
+    app_id=FB_APP_ID,
+    app_secret=FB_APP_SECRET,
+    graph=graph,
+)
+
 
 # ---------------------------------------------------------
 # UTILITIES
 # ---------------------------------------------------------
 def save_env_var(key, value):
-    """Insert or update a variable in the .env file."""
+    """Insert or update a variable in the .env file (written to a temp file, then swapped in)."""
     lines = []
     found = False
     if os.path.exists(ENV_PATH):
         with open(ENV_PATH, "r") as f:
             lines = f.readlines()
 
-    with open(ENV_PATH, "w") as f:
+    folder = os.path.dirname(os.path.abspath(ENV_PATH))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".env-", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
         for line in lines:
             if line.startswith(f"{key}="):
                 f.write(f"{key}={value}\n")
@@ -33,11 +48,24 @@ def save_env_var(key, value):
                 f.write(line)
         if not found:
             f.write(f"{key}={value}\n")
+    if os.path.exists(ENV_PATH):
+        os.chmod(tmp, os.stat(ENV_PATH).st_mode & 0o777)
+    os.replace(tmp, ENV_PATH)
+
+
+def save_token(name, token):
+    """Store a token in the token cache with its debug_token expiry."""
+    try:
+        info = token_cache.inspect(token)
+        token_cache.put(name, token, expires_at=info.get("expires_at"), valid=bool(info.get("is_valid", True)))
+    except Exception as e:
+        print("⚠️ Could not inspect token, caching without expiry:", e)
+        token_cache.put(name, token, valid=None)
 
 
-def graph_get(url, params):
+def graph_get(path, params=None, token=None):
     """Helper to call Graph API with proper error handling."""
-    r = requests.get(url, params=params)
+    r = graph.get(path, token=token, params=params)
     try:
         r.raise_for_status()
     except Exception:
@@ -51,25 +79,23 @@ def graph_get(url, params):
 # ---------------------------------------------------------
 def get_long_lived_user_token():
     print("🔄 Exchanging short-lived token for long-lived token...")
-    url = "https://graph.facebook.com/v19.0/oauth/access_token"
     params = {
         "grant_type": "fb_exchange_token",
         "client_id": FB_APP_ID,
         "client_secret": FB_APP_SECRET,
         "fb_exchange_token": FB_SHORT_LIVED_USER_TOKEN,
     }
-    data = graph_get(url, params)
+    data = graph_get("oauth/access_token", params)
     token = data["access_token"]
     save_env_var("FB_LONG_LIVED_USER_TOKEN", token)
+    save_token(USER, token)
     print("✅ Long-lived user token saved as FB_LONG_LIVED_USER_TOKEN")
     return token
 
 
 def get_pages(user_token):
     print("📄 Fetching Facebook Pages...")
-    url = "https://graph.facebook.com/v19.0/me/accounts"
-    params = {"access_token": user_token}
-    data = graph_get(url, params).get("data", [])
+    data = graph_get("me/accounts", token=user_token).get("data", [])
     if not data:
         raise RuntimeError("No pages found. Check permissions.")
     for p in data:
@@ -79,9 +105,7 @@ def get_pages(user_token):
 
 def get_instagram_account(page_id, page_token):
     print(f"📷 Checking Instagram account for page {page_id}...")
-    url = f"https://graph.facebook.com/v19.0/{page_id}"
-    params = {"fields": "instagram_business_account", "access_token": page_token}
-    data = graph_get(url, params)
+    data = graph_get(page_id, {"fields": "instagram_business_account"}, token=page_token)
     return data.get("instagram_business_account", {}).get("id")
 
 
@@ -107,6 +131,7 @@ if __name__ == "__main__":
     page_token = target_page["access_token"]
 
     save_env_var("FB_PAGE_TOKEN", page_token)
+    save_token(page_name(page_id), page_token)
 
     ig_user_id = get_instagram_account(page_id, page_token)
     if ig_user_id:
@@ -0,0 +1,97 @@
+# s3_fast.py — stdlib-only SigV4 ListObjectsV2, for the empty-queue fast path (no boto3 import)
+import datetime
+import hashlib
+import hmac
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+
+from s3_queue import MEDIA_EXTS
+
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+def _sign(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def signed_list(
+    endpoint: str,
+    bucket: str,
+    access_key: str,
+    secret_key: str,
+    *,
+    prefix: str = "",
+    region: str = "us-east-1",
+    max_keys: int = 1000,
+    continuation_token: str | None = None,
+    timeout: float = 10,
+) -> tuple[list[str], str | None]:
+    """One path-style ListObjectsV2 page. Returns (keys, next continuation token or None)."""
+    endpoint = endpoint if str(endpoint).startswith("http") else f"https://{endpoint}"
+    parsed = urllib.parse.urlparse(endpoint)
+    host = parsed.netloc
+    path = f"/{urllib.parse.quote(bucket)}"
+
+    query = {"list-type": "2", "max-keys": str(max_keys), "prefix": prefix}
+    if continuation_token:
+        query["continuation-token"] = continuation_token
+    canonical_query = "&".join(
+        f"{urllib.parse.quote(k, safe='-_.~')}={urllib.parse.quote(v, safe='-_.~')}"
+        for k, v in sorted(query.items())
+    )
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+    headers = {"host": host, "x-amz-content-sha256": EMPTY_SHA256, "x-amz-date": amz_date}
+    signed_headers = ";".join(sorted(headers))
+    canonical_request = "\n".join([
+        "GET",
+        path,
+        canonical_query,
+        "".join(f"{k}:{headers[k]}\n" for k in sorted(headers)),
+        signed_headers,
+        EMPTY_SHA256,
+    ])
+    scope = f"{date}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    k = _sign(("AWS4" + secret_key).encode("utf-8"), date)
+    k = _sign(k, region)
+    k = _sign(k, "s3")
+    k = _sign(k, "aws4_request")
+    signature = hmac.new(k, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    req = urllib.request.Request(f"{parsed.scheme}://{host}{path}?{canonical_query}", method="GET")
+    req.add_header("x-amz-date", amz_date)
+    req.add_header("x-amz-content-sha256", EMPTY_SHA256)
+    req.add_header("Authorization",
+                   f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+                   f"SignedHeaders={signed_headers}, Signature={signature}")
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        root = ET.fromstring(resp.read())
+
+    ns = root.tag.split("}")[0] + "}" if root.tag.startswith("{") else ""
+    keys = [el.text for el in root.iter(f"{ns}Key") if el.text]
+    truncated = (root.findtext(f"{ns}IsTruncated") or "").lower() == "true"
+    token = root.findtext(f"{ns}NextContinuationToken") if truncated else None
+    return keys, token
+
+
+def queue_has_media(endpoint: str, bucket: str, access_key: str, secret_key: str,
+                    *, prefix: str = "post/", region: str = "us-east-1") -> bool:
+    """True as soon as one media key shows up under prefix."""
+    token = None
+    while True:
+        keys, token = signed_list(endpoint, bucket, access_key, secret_key,
+                                  prefix=prefix, region=region, continuation_token=token)
+        if any(k.lower().endswith(MEDIA_EXTS) for k in keys):
+            return True
+        if not token:
+            return False
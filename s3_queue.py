@@ -0,0 +1,302 @@
+# s3_queue.py — paginated, cached index of the S3 post/ queue
+import bisect
+import json
+import os
+import tempfile
+import time
+
+from safio import safe_print
+from telemetry import shared_tracer
+
+
+MEDIA_EXTS = (".jpg", ".jpeg", ".png", ".mp4")
+
+
+def cached_media_count(cache_path: str | None) -> tuple[int, float] | None:
+    """(media keys in the snapshot, snapshot age in seconds), or None without a snapshot."""
+    if not (cache_path and os.path.exists(cache_path)):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            objects = json.load(f).get("objects") or {}
+        age = time.time() - os.path.getmtime(cache_path)
+    except (OSError, ValueError):
+        return None
+    return sum(1 for k in objects if k.lower().endswith(MEDIA_EXTS)), age
+
+
+class S3QueueIndex:
+    """
+    Sorted snapshot of the objects under post/ (key -> ETag/LastModified/Size).
+
+    The first run pages through the whole prefix; later runs load the snapshot
+    from disk, re-read the first listing page (the head of the queue) and then
+    only ask S3 for keys after the last one we know (StartAfter). A new key on
+    the first page means something was uploaded out of name order, so the
+    whole prefix is relisted; when the prefix fits on one page that page is the
+    full listing. Keys between the first page and the last known key are only
+    checked by the periodic full refresh — a caption uploaded after its media,
+    or a media file replaced in place there, can be missing or stale until
+    then; callers that post read those directly (see MediaSource).
+    """
+
+    def __init__(
+        self,
+        *,
+        s3,
+        bucket: str,
+        prefix: str = "post/",
+        cache_path: str | None = None,        # local JSON snapshot; None = memory only
+        full_refresh_after: float = 6 * 3600,  # seconds before a full relist is forced
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_path = cache_path
+        self.full_refresh_after = full_refresh_after
+
+        self._meta: dict[str, dict] = {}      # key -> {"etag", "last_modified", "size"}
+        self._keys: list[str] = []            # every key, sorted
+        self._media: list[str] = []           # media keys only, sorted (queue order)
+        self._full_listed_at = 0.0
+        self._loaded = False
+
+
+    # ------------------------------------------------------------------
+    # Snapshot persistence
+    # ------------------------------------------------------------------
+    def load(self) -> bool:
+        """Load the local snapshot (if any). Returns True when one was found."""
+        self._loaded = True
+        if not (self.cache_path and os.path.exists(self.cache_path)):
+            return False
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError) as e:
+            safe_print(f"⚠️ Ignoring unreadable queue snapshot {self.cache_path}: {e}")
+            return False
+        if snap.get("bucket") != self.bucket or snap.get("prefix") != self.prefix:
+            return False
+
+        self._reset()
+        for key, meta in (snap.get("objects") or {}).items():
+            self._add(key, meta)
+        self._full_listed_at = float(snap.get("full_listed_at") or 0)
+        return True
+
+
+    def save(self):
+        """Atomically write the snapshot next to cache_path."""
+        if not self.cache_path:
+            return
+        snap = {
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+            "full_listed_at": self._full_listed_at,
+            "objects": self._meta,
+        }
+        folder = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".queue-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp, self.cache_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    # ------------------------------------------------------------------
+    # Listing
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _entries(resp: dict):
+        for c in resp.get("Contents") or []:
+            key = c["Key"]
+            if key.endswith("/"):
+                continue
+            lm = c.get("LastModified")
+            yield key, {
+                "etag": (c.get("ETag") or "").strip('"'),
+                "last_modified": lm.isoformat() if hasattr(lm, "isoformat") else lm,
+                "size": c.get("Size"),
+            }
+
+
+    def _list(self, start_after: str | None = None):
+        """Yield (key, meta) for every object under prefix, following IsTruncated."""
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        while True:
+            resp = self.s3.list_objects_v2(**kwargs)
+            yield from self._entries(resp)
+            if not resp.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+            kwargs.pop("StartAfter", None)
+
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Bring the index up to date. Returns the number of new or changed keys.
+        Incremental by default; falls back to a full listing when there is no
+        snapshot, it is older than full_refresh_after, or the queue looks empty.
+        """
+        with shared_tracer().span("s3_list", prefix=self.prefix) as sp:
+            changed = self._refresh(full)
+            sp.set(changed=changed, keys=len(self._keys))
+            return changed
+
+
+    def _refresh(self, full: bool) -> int:
+        if not self._loaded:
+            self.load()
+
+        stale = time.time() - self._full_listed_at > self.full_refresh_after
+        if full or stale or not self._keys:
+            return self._full_refresh()
+
+        # The head of the queue decides what posts next: check it on every run.
+        resp = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=self.prefix)
+        first = dict(self._entries(resp))
+        if not resp.get("IsTruncated"):
+            return self._replace(first.items())     # the first page is the whole prefix
+        if any(key not in self._meta for key in first):
+            return self._full_refresh()             # uploaded out of name order
+
+        page_end = resp["Contents"][-1]["Key"]
+        changed = 0
+        for key in self._keys[:bisect.bisect_right(self._keys, page_end)]:
+            if key not in first:
+                self.discard(key)                   # moved or deleted since the snapshot
+                changed += 1
+        for key, meta in first.items():
+            if self._meta.get(key) != meta:
+                changed += 1
+            self._add(key, meta)
+
+        for key, meta in self._list(start_after=max(self._keys[-1], page_end)):
+            if self._meta.get(key) != meta:
+                changed += 1
+            self._add(key, meta)
+
+        if not self._media:
+            # Something may have been uploaded that sorts before our last key.
+            return changed + self._full_refresh()
+
+        self.save()
+        return changed
+
+
+    def _full_refresh(self) -> int:
+        return self._replace(self._list())
+
+
+    def _replace(self, listing) -> int:
+        """Rebuild the index from a complete listing; returns new or changed keys."""
+        old = self._meta
+        self._reset()
+        for key, meta in listing:
+            self._add(key, meta)
+        self._full_listed_at = time.time()
+        self.save()
+        return sum(1 for k, m in self._meta.items() if old.get(k) != m)
+
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+    def _reset(self):
+        self._meta = {}
+        self._keys = []
+        self._media = []
+
+
+    def _add(self, key: str, meta: dict):
+        if key not in self._meta:
+            bisect.insort(self._keys, key)
+            if key.lower().endswith(MEDIA_EXTS):
+                bisect.insort(self._media, key)
+        self._meta[key] = meta
+
+
+    @staticmethod
+    def _remove_sorted(items: list[str], key: str):
+        i = bisect.bisect_left(items, key)
+        if i < len(items) and items[i] == key:
+            del items[i]
+
+
+    def note(self, key: str, meta: dict | None = None):
+        """Index a key found outside a listing (e.g. a caption read directly)."""
+        self._add(key, meta or {"etag": None, "last_modified": None, "size": None})
+
+
+    def discard(self, key: str):
+        """Forget a key (e.g. after it was moved to posted/)."""
+        if self._meta.pop(key, None) is None:
+            return
+        self._remove_sorted(self._keys, key)
+        self._remove_sorted(self._media, key)
+
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def keys(self) -> list[str]:
+        return list(self._keys)
+
+
+    def media_keys(self) -> list[str]:
+        return list(self._media)
+
+
+    def meta(self, key: str) -> dict | None:
+        return self._meta.get(key)
+
+
+    def caption_key_for(self, media_key: str) -> str | None:
+        """post/<name>.txt if it is in the index, else None."""
+        base, _ = os.path.splitext(media_key)
+        txt_key = base + ".txt"
+        return txt_key if txt_key in self._meta else None
+
+
+    def peek(self, n: int) -> list[tuple[str, str | None]]:
+        """The first n (media_key, caption_key) pairs in queue order, without HEAD checks."""
+        return [(k, self.caption_key_for(k)) for k in self._media[:n]]
+
+
+    def next_item(self, verify: bool = True) -> tuple[str | None, str | None]:
+        """
+        Return (media_key, caption_key) for the head of the queue.
+        With verify=True the candidate is HEAD-checked so that an item already
+        moved by another poster is dropped instead of being posted again.
+        """
+        while self._media:
+            media_key = self._media[0]
+            if verify and not self._exists(media_key):
+                safe_print(f"⚠️ {media_key} is gone from S3; dropping it from the queue index.")
+                caption_key = self.caption_key_for(media_key)
+                self.discard(media_key)
+                if caption_key:
+                    self.discard(caption_key)
+                self.save()
+                continue
+            return media_key, self.caption_key_for(media_key)
+        return None, None
+
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception as e:
+            code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
@@ -2,9 +2,17 @@
 import os
 import sys
 import platform
-from dotenv import load_dotenv
 
-load_dotenv()
+_dotenv_loaded = False
+
+
+def load_env():
+    """Load .env once, on first use (keeps `import safio` cheap for cron entry points)."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
 
 
 def safe_print(*args, sep=" ", end="\n", file=sys.stdout, flush=False):
@@ -54,6 +62,7 @@ def get_env(name: str, default=None):
         #   Linux  .env → DROPBOX_APP_KEY=xxxx
         val = get_env("DROPBOX_APP_KEY")
     """
+    load_env()
     system_name = platform.system().lower()
     env_name = f"WIN_{name}" if "windows" in system_name else name
     # safe_print(f"env_name: {env_name}")
@@ -1,19 +1,29 @@
 # social_post.py — class-based; FB/IG by URL
 import os
+import asyncio
+import contextvars
+import json
+import shutil
 import time
 import mimetypes
 import tempfile
-import hmac
-import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-import requests
-import boto3
-from botocore.client import Config
-from botocore.exceptions import ClientError
 from safio import safe_print
+from media_source import MediaSource
+from archive import S3Archiver
+from ig_poll import IGContainerPoller, READY
+from graph_api import AsyncGraphClient, GraphBatch, GraphClient, run_sync
+from journal import FINAL_STATES, PostJournal
+from preflight import PreflightError
+from telemetry import shared_tracer
+from token_cache import USER, page_name
 
 
 DEFAULT_CAPTION = "#MortgageWithAndy #LowMortgageRates #RealEstateInvesting #HomePurchase DM me today."
+FB_SCHEDULE_MIN_AHEAD = 15 * 60              # Graph wants scheduled_publish_time >= 10 min ahead
+FB_SCHEDULE_MAX_AHEAD = 30 * 86400           # ... and at most 30 days ahead
 
 
 class SocialPoster:
@@ -29,13 +39,43 @@ class SocialPoster:
         ig_user_id: str,
         ig_page_token: str,                   # can be same as FB Page token
         # ---- Storage (for listing/captions only; NOT used for X media bytes) ----
-        s3_bucket: str,
-        s3_endpoint: str,
-        s3_key: str,
-        s3_secret: str,
+        s3_bucket: str | None = None,
+        s3_endpoint: str | None = None,
+        s3_key: str | None = None,
+        s3_secret: str | None = None,
         # ---- Media URL service (stable public URL for FB/IG) ----
-        media_base_url: str,                  # e.g. https://media.andysabo.com
+        media_base_url: str | None = None,    # e.g. https://media.andysabo.com
         posts_folder: str,
+        # ---- Queue index snapshot (optional; shared by all posters) ----
+        queue_cache_path: str | None = None,
+        # ---- Publish manifest (post/manifest.json); None = list post/ ----
+        manifest_key: str | None = None,
+        manifest_cache_path: str | None = None,
+        # ---- Shared bucket: lease items (claims/<key>.lock) so workers never double-post ----
+        claim_ttl: float | None = None,       # seconds; None = single worker
+        worker_id: str | None = None,
+        # ---- IG container polling budgets (seconds) ----
+        ig_poll_image_budget: float = 60.0,
+        ig_poll_video_budget: float = 300.0,
+        # ---- Shared Graph API client (pooled session); built if not given ----
+        graph: GraphClient | None = None,
+        # ---- Shared boto3 S3 client (thread-safe); built if not given ----
+        s3_client=None,
+        # ---- Posting journal (SQLite) for idempotent resume; None = off ----
+        journal_path: str | None = None,
+        # ---- X in-process (x_post.XPoster); None = local copy for the xpost script ----
+        x_poster=None,
+        # ---- Token cache (token_cache.TokenCache); None = tokens as passed ----
+        token_cache=None,
+        # ---- Shared media source (media_source.MediaSource); replaces the S3 args ----
+        media_source: MediaSource | None = None,
+        # ---- Duplicate content (content_index.ContentIndex); "flag" | "skip" | "off" ----
+        content_index=None,
+        dedup: str = "flag",
+        # ---- Media pre-flight (preflight.Preflight); None = publish the original as is ----
+        preflight=None,
+        # ---- httpx.AsyncClient shared by the *_async methods; built on first use if not given ----
+        async_client=None,
     ):
         # Store exactly what you pass (no env reads here)
         self.fb_app_id = fb_app_id
@@ -45,107 +85,150 @@ class SocialPoster:
         self.fb_page_token = fb_page_token
         self.ig_user_id = ig_user_id
         self.ig_page_token = ig_page_token
-        # S3 client (for listing keys and reading captions ONLY)
-        endpoint = s3_endpoint if str(s3_endpoint).startswith("http") else f"https://{s3_endpoint}"
-        self.s3_bucket = s3_bucket
-        self.s3 = boto3.client(
-            "s3",
-            endpoint_url=endpoint,
-            aws_access_key_id=s3_key,
-            aws_secret_access_key=s3_secret,
-            config=Config(signature_version="s3v4"),
+        self._token_lock = threading.Lock()       # one /me/accounts refresh at a time (FB/IG threads)
+        self._atoken_lock = None                  # the same for coroutines, bound to the running loop
+        self.graph = graph or GraphClient(app_secret=fb_app_secret)
+        self.tracer = shared_tracer()
+        self._async_client = async_client
+        self._agraph = None
+        self.journal = PostJournal(journal_path) if journal_path else None
+        self.x_poster = x_poster
+        self.token_cache = token_cache
+        if token_cache:
+            token_cache.seed(USER, fb_long_lived_user_token)
+            token_cache.seed(page_name(fb_page_id), fb_page_token)
+            self._apply_cached_tokens()
+        # S3 client + queue (for listing keys and reading captions ONLY)
+        self.source = media_source or MediaSource(
+            s3_bucket=s3_bucket,
+            s3_endpoint=s3_endpoint,
+            s3_key=s3_key,
+            s3_secret=s3_secret,
+            media_base_url=media_base_url,
+            queue_cache_path=queue_cache_path,
+            manifest_key=manifest_key,
+            manifest_cache_path=manifest_cache_path,
+            claim_ttl=claim_ttl,
+            worker_id=worker_id,
+            s3_client=s3_client,
         )
+        self.s3_bucket = self.source.s3_bucket
+        self.s3 = self.source.s3
+        self.queue = self.source.queue
+        self.archiver = S3Archiver(s3=self.s3, bucket=self.s3_bucket)
+        self.content_index = content_index
+        self.dedup = dedup
+        self.preflight = preflight
 
         # Media URL base and local cache root
-        self.media_base_url = media_base_url.rstrip("/")
+        self.media_base_url = self.source.media_base_url
         self.posts_folder = posts_folder.rstrip("/")
 
+        self.ig_poller = IGContainerPoller(
+            image_budget=ig_poll_image_budget,
+            video_budget=ig_poll_video_budget,
+            session=self.graph.session,
+            limiter=self.graph.limiter,
+            graph_base=self.graph.url(""),
+        )
+
 
 
     # ------------------------------------------------------------------
     # Utilities
     # ------------------------------------------------------------------
     def list_post_files(self):
-        """List objects under post/ on iDrive (used to pick ‘next’)."""
-        resp = self.s3.list_objects_v2(Bucket=self.s3_bucket, Prefix="post/")
-        return [c["Key"] for c in (resp.get("Contents") or []) if not c["Key"].endswith("/")]
+        """List objects under post/ on iDrive (all pages, via the cached queue index)."""
+        self.queue.refresh()
+        return self.queue.keys()
 
 
     def read_caption(self, key: str) -> str | None:
         """Read optional post/<name>.txt from iDrive."""
-        try:
-            obj = self.s3.get_object(Bucket=self.s3_bucket, Key=key)
-            return obj["Body"].read().decode("utf-8", errors="replace").strip() or None
-        except ClientError:
-            return None
+        return self.source.read_caption(key)
 
 
     def public_url(self, key: str) -> str:
         """Public URL served by media-service (what FB/IG will fetch)."""
-        return f"{self.media_base_url}/media/{key}"
+        return self.source.public_url(key)
 
 
     def _poll_ig_container_ready(self, container_id: str, token: str, appsecret_func, printer, is_video: bool = False):
         """
         Poll Instagram Graph API until media container status_code == FINISHED.
-        Avoids 'Media ID is not available' (error 9007).
+        Avoids 'Media ID is not available' (error 9007). Reels are polled too,
+        with their own (longer) budget.
         """
-        if is_video:
-            return  # IG handles longer video processing internally
+        with self.tracer.span("ig_wait", container=container_id, video=is_video):
+            self.ig_poller.wait(container_id, token, appsecret_func, is_video=is_video, printer=printer)
 
-        status_url = f"https://graph.facebook.com/v21.0/{container_id}"
-        for attempt in range(10):  # wait up to ~50 seconds
-            time.sleep(5)
-            params = {"fields": "status_code", "access_token": token}
-            proof = appsecret_func(token)
-            if proof:
-                params["appsecret_proof"] = proof
 
-            try:
-                rs = requests.get(status_url, params=params, timeout=30)
-                if not rs.ok:
-                    printer(f"⚠️ IG poll {attempt+1}/10 failed ({rs.status_code}): {rs.text}")
-                    continue
+    async def _poll_ig_container_ready_async(self, container_id: str, token: str, appsecret_func, printer,
+                                             is_video: bool = False):
+        with self.tracer.span("ig_wait", container=container_id, video=is_video):
+            await self.ig_poller.wait_many_async(self.agraph.client, [container_id], token, appsecret_func,
+                                                 is_video=is_video, printer=printer)
 
-                status = rs.json().get("status_code")
-                printer(f"⏳ IG poll {attempt+1}/10: {status}")
 
-                if status in ("FINISHED", "PUBLISHED"):
-                    return
-                if status in ("ERROR", "FAILED"):
-                    raise RuntimeError(f"IG processing failed: {rs.text}")
+    # ------------------------------------------------------------------
+    # Async Graph client (httpx; one per poster, bound to the running loop)
+    # ------------------------------------------------------------------
+    @property
+    def agraph(self) -> AsyncGraphClient:
+        if self._agraph is None:
+            self._agraph = AsyncGraphClient(self.graph, client=self._async_client)
+        return self._agraph
 
-            except Exception as e:
-                printer(f"⚠️ IG polling error: {e}")
 
-        raise TimeoutError(f"IG container {container_id} not ready after polling.")
-    
+    async def aclose(self):
+        """Close the async client (if this poster built it) before its loop ends."""
+        if self._agraph is not None:
+            await self._agraph.aclose()
+            self._agraph = None
+        self._atoken_lock = None
+
 
     # ------------------------------------------------------------------
     # S3 File Management (local copy + move to posted)
     # ------------------------------------------------------------------
-    def copy_current_to_local(self, media_key: str, local_dir: str):
+    def copy_current_to_local(self, media_key: str, local_dir: str, rendition=None, caption: str | None = None):
         """
         Download the active media file and its caption (.txt) to a local directory.
-        Used by the Raspberry Pi X-post script.
+        Used by the Raspberry Pi X-post script. With an X rendition (preflight.Rendition)
+        its bytes are copied instead, under the original's name stem. Without a .txt
+        in S3, caption (e.g. the manifest's X caption) is written in its place.
         """
         os.makedirs(local_dir, exist_ok=True)
 
         filename = os.path.basename(media_key)
+        if rendition and rendition.profile:
+            ext = os.path.splitext(rendition.path or rendition.key)[1]
+            filename = os.path.splitext(filename)[0] + ext
         local_media_path = os.path.join(local_dir, filename)
 
         # Download media file
-        self.s3.download_file(self.s3_bucket, media_key, local_media_path)
-        safe_print(f"📥 Copied media {media_key} to {local_media_path}")
+        with self.tracer.span("local_copy", key=media_key) as sp:
+            if rendition and rendition.path:
+                shutil.copyfile(rendition.path, local_media_path)
+                safe_print(f"📥 Copied rendition {rendition.profile} to {local_media_path}")
+            else:
+                source_key = rendition.key if rendition else media_key
+                self.s3.download_file(self.s3_bucket, source_key, local_media_path)
+                safe_print(f"📥 Copied media {source_key} to {local_media_path}")
+            sp.set(bytes=os.path.getsize(local_media_path))
 
-        # Download corresponding text file (if exists)
+        # Download corresponding text file (if the queue index / manifest has one)
         base, _ = os.path.splitext(media_key)
         txt_key = base + ".txt"
         local_txt_path = os.path.join(local_dir, os.path.basename(txt_key))
-        try:
+        if self.source.caption_key_for(media_key):
             self.s3.download_file(self.s3_bucket, txt_key, local_txt_path)
             safe_print(f"📥 Copied caption {txt_key} to {local_txt_path}")
-        except self.s3.exceptions.NoSuchKey:
+        elif caption:
+            with open(local_txt_path, "w", encoding="utf-8") as f:
+                f.write(caption)
+            safe_print(f"📝 Wrote manifest caption to {local_txt_path}")
+        else:
             safe_print("⚠️ No caption file found for this media.")
 
         return local_media_path, local_txt_path
@@ -156,30 +239,61 @@ class SocialPoster:
         Move the media file and matching .txt from post/ → posted/.
         Called after successful posts to all platforms.
         """
-        def move_one(key):
-            filename = os.path.basename(key)
-            dest_key = f"posted/{filename}"
-            self.s3.copy_object(
-                Bucket=self.s3_bucket,
-                CopySource={"Bucket": self.s3_bucket, "Key": key},
-                Key=dest_key,
-            )
-            self.s3.delete_object(Bucket=self.s3_bucket, Key=key)
-            safe_print(f"📤 Moved {key} → {dest_key}")
-
-        # Move media
-        move_one(media_key)
-
-        # Move caption (if present)
-        base, _ = os.path.splitext(media_key)
-        txt_key = base + ".txt"
-        try:
-            move_one(txt_key)
-        except self.s3.exceptions.ClientError as e:
-            if e.response["Error"]["Code"] == "NoSuchKey":
-                safe_print("⚠️ No caption file found to move.")
-            else:
-                raise
+        res = self.archive_many([media_key])
+        if res["failed"]:
+            raise RuntimeError(f"Archiving {media_key} failed: {res['failed'][media_key]}")
+
+
+    def archive_many(self, media_keys: list[str]) -> dict:
+        """
+        Archive several items at once: copies run concurrently, sources are removed
+        with one DeleteObjects call. Captions are only copied when the queue index
+        has them, so a missing .txt costs nothing.
+        """
+        items, sizes = {}, {}
+        for media_key in media_keys:
+            keys = [media_key]
+            txt_key = self.source.caption_key_for(media_key)
+            if txt_key:
+                keys.append(txt_key)
+            elif not self.source.manifest:
+                safe_print(f"⚠️ No caption file found to move for {media_key}.")
+            items[media_key] = keys
+            for k in keys:
+                size = self.source.meta(k).get("size")
+                if size is not None:
+                    sizes[k] = size
+
+        res = self.archiver.archive(items, sizes)
+        self.source.forget([k for media_key in res["moved"] for k in items[media_key]])
+        if self.content_index and res["moved"]:
+            self.content_index.record_moves({k: self.archiver.dest_key(k) for k in res["moved"]})
+        return res
+
+
+    # ------------------------------------------------------------------
+    # Duplicate content (same bytes already under posted/)
+    # ------------------------------------------------------------------
+    def find_duplicates(self, media_key: str, etag: str | None, size: int | None = None) -> list[str]:
+        if not self.content_index or self.dedup == "off":
+            return []
+        self.content_index.sync_queue(self.queue)
+        dups = self.content_index.posted_duplicates(media_key, etag, size)
+        if dups:
+            safe_print(f"♻️ {media_key} has the same content as {', '.join(dups)}")
+        return dups
+
+
+    def set_aside_duplicate(self, media_key: str):
+        """dedup="skip": move the item (and caption) to duplicates/ instead of posting it."""
+        keys = [media_key]
+        txt_key = self.source.caption_key_for(media_key)
+        if txt_key:
+            keys.append(txt_key)
+        res = S3Archiver(s3=self.s3, bucket=self.s3_bucket, dest_prefix="duplicates/").archive({media_key: keys})
+        if res["failed"]:
+            raise RuntimeError(f"Could not set aside duplicate {media_key}: {res['failed'][media_key]}")
+        self.source.forget(keys)
 
 
     @staticmethod
@@ -192,30 +306,49 @@ class SocialPoster:
     # Facebook (Page) — by URL (v21.0) with appsecret_proof + code 190 refresh
     # ------------------------------------------------------------------
     def _appsecret_proof(self, token: str) -> str | None:
-        if not (token and self.fb_app_secret):
-            return None
-        mac = hmac.new(self.fb_app_secret.encode("utf-8"),
-                       msg=token.encode("utf-8"),
-                       digestmod=hashlib.sha256)
-        return mac.hexdigest()
+        return self.graph.proof(token)
+
+
+    def _apply_cached_tokens(self):
+        """Pick up tokens the cache refreshed in the background (memory only, no HTTP)."""
+        if not self.token_cache:
+            return
+        user_tok = self.token_cache.get(USER)
+        if user_tok:
+            self.fb_ll_user_token = user_tok
+        page_tok = self.token_cache.get(page_name(self.fb_page_id))
+        if page_tok and page_tok != self.fb_page_token:
+            if not self.ig_page_token or self.ig_page_token == self.fb_page_token:
+                self.ig_page_token = page_tok
+            self.fb_page_token = page_tok
 
 
     def fb_refresh_page_token_if_needed(self) -> bool:
         """Use long-lived user token to fetch Page token via /me/accounts; update fb_page_token."""
         if not (self.fb_ll_user_token and self.fb_page_id):
             return False
-        params = {"access_token": self.fb_ll_user_token}
-        proof = self._appsecret_proof(self.fb_ll_user_token)
-        if proof:
-            params["appsecret_proof"] = proof
 
-        r = requests.get("https://graph.facebook.com/v21.0/me/accounts", params=params, timeout=30)
+        r = self.graph.get("me/accounts", token=self.fb_ll_user_token, timeout=30)
         if not r.ok:
             safe_print("FB /me/accounts error:", r.status_code, r.text)
             return False
+        return self._adopt_page_token(r.json())
+
+
+    async def fb_refresh_page_token_if_needed_async(self) -> bool:
+        if not (self.fb_ll_user_token and self.fb_page_id):
+            return False
+
+        r = await self.agraph.get("me/accounts", token=self.fb_ll_user_token, timeout=30)
+        if not r.is_success:
+            safe_print("FB /me/accounts error:", r.status_code, r.text)
+            return False
+        return self._adopt_page_token(r.json())
+
 
+    def _adopt_page_token(self, accounts: dict) -> bool:
         new_tok = None
-        for acc in r.json().get("data", []):
+        for acc in accounts.get("data", []):
             if acc.get("id") == self.fb_page_id and acc.get("access_token"):
                 new_tok = acc["access_token"]
                 break
@@ -223,15 +356,71 @@ class SocialPoster:
             safe_print("FB: could not find page token for", self.fb_page_id)
             return False
 
+        old_tok = self.fb_page_token
         self.fb_page_token = new_tok
-        # mirror to IG if you share tokens and it’s not set:
-        if not self.ig_page_token:
+        if self.token_cache:
+            self.token_cache.put(page_name(self.fb_page_id), new_tok)
+        # mirror to IG if you share tokens (or it’s not set):
+        if not self.ig_page_token or self.ig_page_token == old_tok:
             self.ig_page_token = new_tok
         safe_print("FB: refreshed page token.")
         return True
 
 
-    def post_facebook(self, message: str, media_url: str | None, is_video: bool):
+    def _on_page_token_expired(self, old_token: str) -> str | None:
+        """
+        GraphClient code-190 hook: refresh via /me/accounts and hand back the new
+        token. FB and IG run in parallel and can both hit 190 with the same token;
+        the second caller reuses the token the first one fetched.
+        """
+        with self._token_lock:
+            if old_token != self.fb_page_token:
+                return self.fb_page_token
+            if not self.fb_refresh_page_token_if_needed():
+                return None
+            if old_token == self.fb_page_token:
+                return None
+            return self.fb_page_token
+
+
+    async def _on_page_token_expired_async(self, old_token: str) -> str | None:
+        if self._atoken_lock is None:
+            self._atoken_lock = asyncio.Lock()
+        async with self._atoken_lock:
+            if old_token != self.fb_page_token:
+                return self.fb_page_token
+            if not await self.fb_refresh_page_token_if_needed_async():
+                return None
+            if old_token == self.fb_page_token:
+                return None
+            return self.fb_page_token
+
+
+    def _ig_shares_page_token(self) -> bool:
+        return not self.ig_page_token or self.ig_page_token == self.fb_page_token
+
+
+    def _on_ig_token_expired(self, old_token: str) -> str | None:
+        """
+        Code-190 hook for IG calls. A shared token is refreshed like the Page's;
+        a separate IG token cannot be minted from /me/accounts, so the call only
+        retries if the token was replaced meanwhile (e.g. from the token cache).
+        """
+        if self._ig_shares_page_token():
+            return self._on_page_token_expired(old_token)
+        self._apply_cached_tokens()
+        return self.ig_page_token if self.ig_page_token != old_token else None
+
+
+    async def _on_ig_token_expired_async(self, old_token: str) -> str | None:
+        if self._ig_shares_page_token():
+            return await self._on_page_token_expired_async(old_token)
+        self._apply_cached_tokens()
+        return self.ig_page_token if self.ig_page_token != old_token else None
+
+
+    def _fb_request(self, message: str, media_url: str | None, is_video: bool) -> tuple[str, str, dict]:
+        """(token, path, data) for a Page post."""
         token = self.fb_page_token
         if not (self.fb_page_id and token):
             raise RuntimeError("FB missing page_id or page_token")
@@ -239,132 +428,869 @@ class SocialPoster:
         # endpoint + data
         if media_url:
             if is_video:
-                url = f"https://graph.facebook.com/v21.0/{self.fb_page_id}/videos"
-                data = {"description": message[:2000], "file_url": media_url, "access_token": token}
+                path = f"{self.fb_page_id}/videos"
+                data = {"description": message[:2000], "file_url": media_url}
             else:
-                url = f"https://graph.facebook.com/v21.0/{self.fb_page_id}/photos"
-                data = {"caption": message[:2000], "url": media_url, "access_token": token}
+                path = f"{self.fb_page_id}/photos"
+                data = {"caption": message[:2000], "url": media_url}
         else:
-            url = f"https://graph.facebook.com/v21.0/{self.fb_page_id}/feed"
-            data = {"message": message[:2000], "access_token": token}
+            path = f"{self.fb_page_id}/feed"
+            data = {"message": message[:2000]}
+        return token, path, data
 
-        params = {}
-        proof = self._appsecret_proof(token)
-        if proof:
-            params["appsecret_proof"] = proof
 
-        r = requests.post(url, params=params, data=data, timeout=90)
-        if r.ok:
+    @staticmethod
+    def _fb_result(r, ok: bool):
+        if ok:
             safe_print("📘 Facebook:", r.status_code, r.text)
             return r.json()
 
-        # code 190 -> refresh once
-        try:
-            code = (r.json().get("error") or {}).get("code")
-        except Exception:
-            code = None
-
-        if code == 190 and self.fb_refresh_page_token_if_needed():
-            token = self.fb_page_token
-            data["access_token"] = token
-            params = {}
-            proof = self._appsecret_proof(token)
-            if proof:
-                params["appsecret_proof"] = proof
-            r2 = requests.post(url, params=params, data=data, timeout=90)
-            safe_print("📘 Facebook retry:", r2.status_code, r2.text)
-            r2.raise_for_status()
-            return r2.json()
-
         safe_print("📘 Facebook FAIL:", r.status_code, r.text)
         r.raise_for_status()
         return r.json()
 
 
+    def post_facebook(self, message: str, media_url: str | None, is_video: bool):
+        token, path, data = self._fb_request(message, media_url, is_video)
+        with self.tracer.span("fb_post", video=is_video) as sp:
+            r = self.graph.post(path, token=token, data=data, timeout=90,
+                                on_token_expired=self._on_page_token_expired)
+            sp.set(status=r.status_code)
+            return self._fb_result(r, r.ok)
+
+
+    async def post_facebook_async(self, message: str, media_url: str | None, is_video: bool):
+        token, path, data = self._fb_request(message, media_url, is_video)
+        with self.tracer.span("fb_post", video=is_video) as sp:
+            r = await self.agraph.post(path, token=token, data=data, timeout=90,
+                                       on_token_expired=self._on_page_token_expired_async)
+            sp.set(status=r.status_code)
+            return self._fb_result(r, r.is_success)
+
+
     # ------------------------------------------------------------------
     # Instagram — by URL (container -> poll -> publish, v21.0)
     # ------------------------------------------------------------------
-    def post_instagram(self, message: str, media_url: str, is_video: bool):
+    def post_instagram(
+        self,
+        message: str,
+        media_url: str,
+        is_video: bool,
+        *,
+        container_id: str | None = None,      # resume: skip creation, poll + publish this one
+        on_container=None,                    # callable(container_id) once it is created
+    ):
         token = self.ig_page_token or self.fb_page_token
         if not (self.ig_user_id and token):
             raise RuntimeError("IG missing ig_user_id or token")
 
-        proof = self._appsecret_proof(token)
-
         # Step 1: Create IG media container
-        ig_endpoint = f"https://graph.facebook.com/v21.0/{self.ig_user_id}/media"
-        params = {"access_token": token}
-        if proof:
-            params["appsecret_proof"] = proof
-
-        data = {"caption": message[:2200]}
-        if is_video:
-            data.update({"video_url": media_url, "media_type": "REELS", "share_to_feed": "true"})
+        if container_id:
+            safe_print("📤 IG Container (resumed):", container_id)
         else:
-            data.update({"image_url": media_url})
-
-        rc = requests.post(ig_endpoint, params=params, data=data, timeout=90)
-        safe_print("📤 IG Container:", rc.status_code, rc.text)
-        rc.raise_for_status()
-
-        container_id = rc.json().get("id")
-        if not container_id:
-            raise RuntimeError(f"IG container creation failed: {rc.text}")
+            data = {"caption": message[:2200]}
+            if is_video:
+                data.update({"video_url": media_url, "media_type": "REELS", "share_to_feed": "true"})
+            else:
+                data.update({"image_url": media_url})
+
+            with self.tracer.span("ig_container", video=is_video) as sp:
+                rc = self.graph.post(f"{self.ig_user_id}/media", token=token, data=data, timeout=90,
+                                     on_token_expired=self._on_ig_token_expired)
+                sp.set(status=rc.status_code)
+                safe_print("📤 IG Container:", rc.status_code, rc.text)
+                rc.raise_for_status()
+
+            container_id = rc.json().get("id")
+            if not container_id:
+                raise RuntimeError(f"IG container creation failed: {rc.text}")
+            if on_container:
+                on_container(container_id)
+            # The create call may have refreshed the token.
+            token = self.ig_page_token or self.fb_page_token
 
         # Step 2: Poll for readiness
         self._poll_ig_container_ready(container_id, token, self._appsecret_proof, safe_print, is_video)
 
         # Step 3: Publish when ready
-        pub_endpoint = f"https://graph.facebook.com/v21.0/{self.ig_user_id}/media_publish"
-        pub_params = {"access_token": token}
-        if proof:
-            pub_params["appsecret_proof"] = proof
-
-        pub = requests.post(
-            pub_endpoint,
-            params=pub_params,
-            data={"creation_id": container_id},
-            timeout=90,
-        )
+        with self.tracer.span("ig_publish", container=container_id) as sp:
+            pub = self.graph.post(f"{self.ig_user_id}/media_publish", token=token,
+                                  data={"creation_id": container_id}, timeout=90)
+            sp.set(status=pub.status_code)
+
+            safe_print("📣 IG Publish:", pub.status_code, pub.text)
+            pub.raise_for_status()
+            return pub.json()
+
+
+    async def post_instagram_async(
+        self,
+        message: str,
+        media_url: str,
+        is_video: bool,
+        *,
+        container_id: str | None = None,
+        on_container=None,
+    ):
+        """post_instagram() on the event loop: the container wait holds no thread."""
+        token = self.ig_page_token or self.fb_page_token
+        if not (self.ig_user_id and token):
+            raise RuntimeError("IG missing ig_user_id or token")
 
-        safe_print("📣 IG Publish:", pub.status_code, pub.text)
-        pub.raise_for_status()
-        return pub.json()
+        if container_id:
+            safe_print("📤 IG Container (resumed):", container_id)
+        else:
+            data = self._ig_container_body({"caption": message, "media_url": media_url, "is_video": is_video})
+            with self.tracer.span("ig_container", video=is_video) as sp:
+                rc = await self.agraph.post(f"{self.ig_user_id}/media", token=token, data=data, timeout=90,
+                                            on_token_expired=self._on_ig_token_expired_async)
+                sp.set(status=rc.status_code)
+                safe_print("📤 IG Container:", rc.status_code, rc.text)
+                rc.raise_for_status()
+
+            container_id = rc.json().get("id")
+            if not container_id:
+                raise RuntimeError(f"IG container creation failed: {rc.text}")
+            if on_container:
+                on_container(container_id)
+            token = self.ig_page_token or self.fb_page_token
+
+        await self._poll_ig_container_ready_async(container_id, token, self._appsecret_proof, safe_print, is_video)
+
+        with self.tracer.span("ig_publish", container=container_id) as sp:
+            pub = await self.agraph.post(f"{self.ig_user_id}/media_publish", token=token,
+                                         data={"creation_id": container_id}, timeout=90)
+            sp.set(status=pub.status_code)
+            safe_print("📣 IG Publish:", pub.status_code, pub.text)
+            pub.raise_for_status()
+            return pub.json()
+
+
+    def ig_publishing_quota(self) -> dict | None:
+        """
+        Remaining IG content-publishing budget (rolling 24h):
+        {"used", "total", "remaining", "window_s"}, or None if it cannot be read.
+        """
+        token = self.ig_page_token or self.fb_page_token
+        if not (self.ig_user_id and token):
+            return None
+        r = self.graph.get(f"{self.ig_user_id}/content_publishing_limit", token=token,
+                           params={"fields": "config,quota_usage"}, timeout=30)
+        if not r.ok:
+            safe_print(f"⚠️ IG publishing limit unavailable: {r.status_code} {r.text}")
+            return None
+        data = (r.json().get("data") or [{}])[0]
+        config = data.get("config") or {}
+        used = int(data.get("quota_usage") or 0)
+        total = int(config.get("quota_total") or 0)
+        quota = {
+            "used": used,
+            "total": total,
+            "remaining": max(0, total - used),
+            "window_s": int(config.get("quota_duration") or 86400),
+        }
+        self.graph.limiter.note(f"graph:{self.ig_user_id}", ig_publishing=quota)
+        safe_print(f"📊 IG publishing budget: {quota['remaining']}/{total} left in 24h")
+        return quota
+
+
+    # ------------------------------------------------------------------
+    # Batch mode — many items in a handful of Graph `batch` round trips
+    # ------------------------------------------------------------------
+    def _fb_batch_op(self, item: dict) -> tuple[str, dict]:
+        message = (item.get("fb_caption") or item["caption"])[:2000]
+        if item["is_video"]:
+            return f"{self.fb_page_id}/videos", {"description": message, "file_url": item["media_url"]}
+        return f"{self.fb_page_id}/photos", {"caption": message, "url": item["media_url"]}
+
+
+    def _ig_container_body(self, item: dict) -> dict:
+        data = {"caption": (item.get("ig_caption") or item["caption"])[:2200]}
+        if item["is_video"]:
+            data.update({"video_url": item["media_url"], "media_type": "REELS", "share_to_feed": "true"})
+        else:
+            data.update({"image_url": item["media_url"]})
+        return data
+
+
+    def post_batch(
+        self,
+        items: list[dict],
+        *,
+        facebook: bool = True,
+        instagram: bool = True,
+        chain_publish: bool = False,
+        ig_limit: int | None = None,          # IG publishes left; None = ask content_publishing_limit
+    ) -> list[dict]:
+        """
+        Post many items ({"caption", "media_url", "is_video"}) with Graph batch requests.
+        An item's optional "journal_item" has each outcome journaled (FB post, IG
+        container, IG publish) and skips platforms the journal already has final;
+        optional "fb_caption"/"ig_caption" override the caption and "platforms"
+        (manifest targets) leaves the other platforms out of its result.
+
+        1. FB posts + IG container creates go out together (50 ops per call).
+        2. IG containers are polled together (one ?ids= read per round).
+        3. IG publishes go out as one more batch.
+
+        chain_publish=True publishes image containers inside the first batch via
+        {result=...} references instead (no polling; may hit 9007 if IG is slow).
+        Returns one {"facebook": {...}, "instagram": {...}} per item.
+        """
+        self._apply_cached_tokens()
+        fb_token = self.fb_page_token
+        ig_token = self.ig_page_token or self.fb_page_token
+        if facebook and not (self.fb_page_id and fb_token):
+            raise RuntimeError("FB missing page_id or page_token")
+        if instagram and not (self.ig_user_id and ig_token):
+            raise RuntimeError("IG missing ig_user_id or token")
+
+        results = [{} for _ in items]
+        batches: dict[str, GraphBatch] = {}
+
+        ig_allowed = len(items)
+        if instagram:
+            if ig_limit is None:
+                quota = self.ig_publishing_quota()
+                ig_limit = quota["remaining"] if quota else len(items)
+            if ig_limit < len(items):
+                ig_allowed = max(0, ig_limit)
+                safe_print(f"⚠️ IG publishing limit: only the first {ig_allowed} of {len(items)} items go to IG.")
+                for n in range(ig_allowed, len(items)):
+                    results[n]["instagram"] = {"ok": False, "code": None,
+                                               "body": {"error": "content_publishing_limit reached"}}
+
+        def batch_for(token):
+            if token not in batches:
+                # A separate IG token must not be "refreshed" into the Page's token.
+                hook = self._on_page_token_expired if token == fb_token else self._on_ig_token_expired
+                batches[token] = GraphBatch(self.graph, token, on_token_expired=hook)
+            return batches[token]
+
+        def record(n, platform, state, ref=None, detail=None):
+            if self.journal and items[n].get("journal_item"):
+                self.journal.record(items[n]["journal_item"], platform, state, ref=ref, detail=detail)
+
+        # Skip what an earlier run already finished for an item — including FB
+        # posts schedule_facebook() staged ("scheduled"), which must not go out twice.
+        for n, item in enumerate(items):
+            past = self.journal.state(item["journal_item"]) if self.journal and item.get("journal_item") else {}
+            for platform in ("facebook", "instagram"):
+                st = past.get(platform)
+                if st and st["state"] in FINAL_STATES:
+                    results[n][platform] = {"ok": True, "code": None, "body": {"id": st["ref"]}, "resumed": True}
+                    safe_print(f"↩️ {platform}: {item.get('media_key', n)} already {st['state']} ({st['ref']}), skipping.")
+
+        def targets(item, platform):
+            return item.get("platforms") is None or platform in item["platforms"]
+
+        # Phase 1: FB posts + IG containers (+ chained image publishes)
+        slots = []                              # (item index, platform, token, op index)
+        for n, item in enumerate(items):
+            if facebook and "facebook" not in results[n] and targets(item, "facebook"):
+                path, body = self._fb_batch_op(item)
+                slots.append((n, "facebook", fb_token, batch_for(fb_token).add("POST", path, body=body)))
+            if instagram and n < ig_allowed and "instagram" not in results[n] and targets(item, "instagram"):
+                b = batch_for(ig_token)
+                name = f"ig{n}"
+                slots.append((n, "ig_container", ig_token,
+                              b.add("POST", f"{self.ig_user_id}/media", body=self._ig_container_body(item), name=name)))
+                if chain_publish and not item["is_video"]:
+                    slots.append((n, "instagram", ig_token,
+                                  b.add("POST", f"{self.ig_user_id}/media_publish",
+                                        body={"creation_id": f"{{result={name}:$.id}}"}, depends_on=name)))
+
+        replies = {token: b.execute() for token, b in batches.items()}
+        for n, platform, token, op in slots:
+            res = results[n][platform] = replies[token][op]
+            if platform == "facebook":
+                record(n, "facebook", "posted" if res["ok"] else "failed",
+                       ref=self._result_id(res["body"]), detail=None if res["ok"] else res["body"])
+            elif platform == "ig_container" and res["ok"]:
+                record(n, "instagram", "container", ref=self._result_id(res["body"]))
+            elif platform == "ig_container":
+                record(n, "instagram", "failed", detail=res["body"])
+            else:
+                record(n, "instagram", "published" if res["ok"] else "failed",
+                       ref=self._result_id(res["body"]), detail=None if res["ok"] else res["body"])
+
+        safe_print(f"🧺 Batch phase 1: {len(slots)} ops for {len(items)} items")
+        if not instagram:
+            return results
+
+        # Phase 2: wait for containers that still need publishing
+        ig_token = self.ig_page_token or self.fb_page_token   # phase 1 may have refreshed it
+        to_publish = {}
+        for n, item in enumerate(items):
+            container = results[n].get("ig_container") or {}
+            if "instagram" in results[n] or not container.get("ok"):
+                continue
+            to_publish[n] = (container["body"] or {}).get("id")
+
+        for is_video in (False, True):
+            ids = [cid for n, cid in to_publish.items() if cid and items[n]["is_video"] == is_video]
+            if not ids:
+                continue
+            try:
+                self.ig_poller.wait_many(ids, ig_token, self._appsecret_proof, is_video=is_video)
+            except (RuntimeError, TimeoutError) as e:
+                safe_print(f"⚠️ IG batch polling: {e}")
+                try:
+                    ready = self.ig_poller.fetch_statuses(ids, ig_token, self._appsecret_proof)
+                except Exception as e:
+                    # Unknown state: keep the containers journaled for the next run to resume.
+                    safe_print(f"⚠️ IG status read failed: {e}")
+                    ready = {cid: None for cid in ids}
+                for n, cid in list(to_publish.items()):
+                    if cid in ready and ready[cid] not in READY:
+                        results[n]["instagram"] = {"ok": False, "code": None, "body": {"status_code": ready[cid]}}
+                        if ready[cid] is not None:
+                            record(n, "instagram", "failed", ref=cid, detail={"status_code": ready[cid]})
+                        del to_publish[n]
+
+        # Phase 3: publish the ready containers
+        pub = GraphBatch(self.graph, ig_token, on_token_expired=self._on_ig_token_expired)
+        ops = {n: pub.add("POST", f"{self.ig_user_id}/media_publish", body={"creation_id": cid})
+               for n, cid in to_publish.items() if cid}
+        published = pub.execute() if ops else []
+        for n, op in ops.items():
+            res = results[n]["instagram"] = published[op]
+            error = (res["body"] or {}).get("error") if isinstance(res["body"], dict) else None
+            if res["ok"] or (error or {}).get("code") != 9007:
+                record(n, "instagram", "published" if res["ok"] else "failed",
+                       ref=self._result_id(res["body"]) if res["ok"] else to_publish[n],
+                       detail=None if res["ok"] else res["body"])
+            # 9007 (not ready yet): the container stays journaled and is published next run.
+        for n, item in enumerate(items):
+            if targets(item, "instagram"):
+                results[n].setdefault("instagram", {"ok": False, "code": None, "body": None})
+
+        return results
+
+
+    def post_many(self, count: int, **batch_kwargs) -> list[dict]:
+        """
+        Catch-up run: post the next `count` due items (manifest order, captions and
+        targets when there is one) via post_batch, send each successful one to X
+        (in-process or via the local copy) and move it to posted/.
+        """
+        if batch_kwargs.get("instagram", True) and "ig_limit" not in batch_kwargs:
+            # Items IG cannot take would be posted to FB only and then stay queued.
+            quota = self.ig_publishing_quota()
+            if quota:
+                if quota["remaining"] < count:
+                    safe_print(f"⚠️ IG publishing limit: posting {quota['remaining']} of {count} items this run.")
+                count = min(count, quota["remaining"])
+                batch_kwargs["ig_limit"] = count
+                if not count:
+                    return []
+
+        claimed = []
+
+        def skip(item):
+            # Shared bucket: pass over items another worker holds.
+            if not self.source.claim(item.key):
+                return True
+            claimed.append(item.key)
+            if self.find_duplicates(item.key, item.etag, item.size) and self.dedup == "skip":
+                self.set_aside_duplicate(item.key)
+                return True
+            return False
+
+        try:
+            picked = self.source.upcoming(count, skip=skip, due_only=True)
+            if not picked:
+                safe_print("✅ No media files to post.")
+                return []
+
+            items = []
+            for item in picked:
+                items.append({
+                    "media_key": item.key,
+                    "caption": item.caption or DEFAULT_CAPTION,
+                    "fb_caption": item.caption_for("facebook") or DEFAULT_CAPTION,
+                    "ig_caption": item.caption_for("instagram") or DEFAULT_CAPTION,
+                    "x_caption": item.caption_for("x") or DEFAULT_CAPTION,
+                    "platforms": item.platforms,
+                    "media_url": item.public_url,
+                    "is_video": item.is_video,
+                    "journal_item": self._journal_item(item.key),
+                })
+
+            results = self.post_batch(items, **batch_kwargs)
+            done = []
+            for item, res in zip(items, results):
+                res["media_key"] = item["media_key"]
+                platforms = [p for p in ("facebook", "instagram") if p in res]
+                ok = all(res[p].get("ok") for p in platforms)
+                safe_print("SUMMARY:", item["media_key"], {p: res[p].get("ok") for p in platforms})
+                if not ok:
+                    continue
+                journal_item = item["journal_item"]
+                if item["platforms"] is not None and "x" not in item["platforms"]:
+                    done.append(item["media_key"])  # manifest: not for X
+                    continue
+                if self.x_poster:
+                    name, state = "x", "posted"
+                    step = lambda: self.x_poster.post_x(item["x_caption"], item["media_key"])
+                    ref_of = self._result_id
+                else:
+                    name, state = "local", "copied"
+                    step = lambda: self.copy_current_to_local(item["media_key"], self.posts_folder,
+                                                              caption=item["x_caption"])
+                    ref_of = lambda paths: json.dumps(list(paths))
+                past = self.journal.done(journal_item, name) if self.journal else None
+                if past:
+                    safe_print(f"↩️ {name}: already {past['state']} ({past['ref']}), skipping.")
+                else:
+                    try:
+                        out = self._journaled(journal_item, name, step, state, ref_of)()
+                    except Exception as e:
+                        safe_print(f"❌ X step failed for {item['media_key']}; leaving it queued: {e}")
+                        continue
+                    if name == "x":
+                        res["x"] = out
+                done.append(item["media_key"])
+
+            # One archive pass for the whole run.
+            moved = self.archive_many(done)["moved"] if done else []
+            if self.journal:
+                for item in items:
+                    if item["media_key"] in moved:
+                        self.journal.record(item["journal_item"], "archive", "moved",
+                                            ref=f"posted/{os.path.basename(item['media_key'])}")
+            self.source.release([item["media_key"] for item in items if item["media_key"] not in moved])
+            self.source.advance()
+            return results
+        except BaseException:
+            self.source.release(claimed)        # still queued: let any worker retry them
+            raise
+
+
+    # ------------------------------------------------------------------
+    # Facebook scheduled publishing — pre-stage many days in one run
+    # ------------------------------------------------------------------
+    def schedule_facebook(self, count: int, *, start: float | None = None, every: float = 86400.0) -> list[dict]:
+        """
+        Create the next `count` queued items' FB posts now, unpublished, with
+        scheduled_publish_time start, start+every, ... (a manifest not_before
+        pushes its slot later). All go out in Graph batch requests.
+
+        Each post id is journaled as facebook/"scheduled", so the daily run
+        later posts the item to IG/X/LinkedIn and skips FB; cancel_scheduled()
+        deletes one again. Needs the journal, and the daily runs must use the
+        same one. Returns one {"media_key", "when", "ok", "id"|"error"} per item.
+        """
+        if not self.journal:
+            raise RuntimeError("Scheduling needs a journal (journal_path) to record the FB post ids")
+        self._apply_cached_tokens()
+        token = self.fb_page_token
+        if not (self.fb_page_id and token):
+            raise RuntimeError("FB missing page_id or page_token")
+
+        now = time.time()
+        earliest, latest = now + FB_SCHEDULE_MIN_AHEAD, now + FB_SCHEDULE_MAX_AHEAD
+        start = max(start or earliest, earliest)
+
+        def skip(item):
+            return not item.targets("facebook") or \
+                self.journal.done(self._journal_item(item.key), "facebook") is not None
+
+        items = self.source.upcoming(count, skip=skip)
+        if not items:
+            safe_print("✅ Nothing to schedule.")
+            return []
+
+        batch = GraphBatch(self.graph, token, on_token_expired=self._on_page_token_expired)
+        slots = []                              # (item, when, op index)
+        when = start
+        for item in items:
+            when = max(when, item.not_before or 0)
+            if when > latest:
+                safe_print(f"⚠️ {item.key}: {time.strftime('%Y-%m-%d %H:%M', time.localtime(when))} is past "
+                           f"FB's scheduling window; leaving it and the rest for a later run.")
+                break
+            path, body = self._fb_batch_op({"caption": item.caption_for("facebook") or DEFAULT_CAPTION,
+                                            "media_url": item.public_url, "is_video": item.is_video})
+            body.update({"published": "false", "scheduled_publish_time": str(int(when))})
+            slots.append((item, when, batch.add("POST", path, body=body)))
+            when += every
+
+        with self.tracer.span("fb_schedule", items=len(slots)) as sp:
+            replies = batch.execute() if slots else []
+            results = []
+            for item, when, op in slots:
+                reply = replies[op]
+                journal_item = self._journal_item(item.key)
+                res = {"media_key": item.key, "when": when, "ok": reply["ok"]}
+                if reply["ok"]:
+                    res["id"] = self._result_id(reply["body"])
+                    self.journal.record(journal_item, "facebook", "scheduled", ref=res["id"],
+                                        detail={"scheduled_publish_time": int(when)})
+                else:
+                    res["error"] = reply["body"]
+                    self.journal.record(journal_item, "facebook", "failed", detail=reply["body"])
+                safe_print(f"🗓️ {item.key} → {time.strftime('%a %Y-%m-%d %H:%M', time.localtime(when))}: "
+                           + (f"scheduled ({res['id']})" if reply["ok"] else f"FAILED {reply['body']}"))
+                results.append(res)
+            sp.set(scheduled=sum(1 for r in results if r["ok"]))
+        return results
+
+
+    def cancel_scheduled(self, media_key: str) -> bool:
+        """Delete the scheduled FB post of media_key; the next daily run then posts FB normally."""
+        if not self.journal:
+            raise RuntimeError("Scheduling needs a journal (journal_path) to record the FB post ids")
+        item = self._journal_item(media_key)
+        if (self.journal.state(item).get("facebook") or {}).get("state") != "scheduled":
+            return False
+        ref = self.journal.last_ref(item, "facebook", "scheduled")
+        self._apply_cached_tokens()
+        r = self.graph.request("DELETE", ref, token=self.fb_page_token,
+                               on_token_expired=self._on_page_token_expired)
+        if not r.ok:
+            safe_print(f"❌ Could not cancel scheduled FB post {ref}: {r.status_code} {r.text}")
+            return False
+        self.journal.record(item, "facebook", "cancelled", ref=ref)
+        safe_print(f"🗑️ Cancelled scheduled FB post {ref} for {media_key}")
+        return True
+
+
+    # ------------------------------------------------------------------
+    # Platform fan-out (FB / IG / local copy run side by side)
+    # ------------------------------------------------------------------
+    def _run_platforms(self, jobs: dict, fanout: bool = True) -> dict:
+        """
+        Run {platform: callable} and collect {platform: {"ok", "result"|"error", "seconds"}}.
+        With fanout=True every job runs on its own thread, so the wall-clock cost is
+        the slowest platform (usually IG polling) instead of the sum of all of them.
+        """
+        def run(name, fn):
+            t0 = time.monotonic()
+            try:
+                res = fn()
+                return {"ok": True, "result": res, "seconds": round(time.monotonic() - t0, 2)}
+            except Exception as e:
+                safe_print(f"❌ {name} failed: {e}")
+                return {"ok": False, "error": str(e), "seconds": round(time.monotonic() - t0, 2)}
+
+        if not fanout or len(jobs) < 2:
+            return {name: run(name, fn) for name, fn in jobs.items()}
+
+        with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="post") as pool:
+            futures = {name: pool.submit(contextvars.copy_context().run, run, name, fn)
+                       for name, fn in jobs.items()}
+            return {name: fut.result() for name, fut in futures.items()}
+
+
+    async def _run_platforms_async(self, jobs: dict, async_jobs: dict) -> dict:
+        """
+        _run_platforms() on the event loop: jobs with a coroutine form (FB/IG) run
+        on the loop itself, the rest (X upload, local copy) via asyncio.to_thread.
+        """
+        async def run(name):
+            t0 = time.monotonic()
+            try:
+                if name in async_jobs:
+                    res = await async_jobs[name]()
+                else:
+                    res = await asyncio.to_thread(jobs[name])
+                return {"ok": True, "result": res, "seconds": round(time.monotonic() - t0, 2)}
+            except Exception as e:
+                safe_print(f"❌ {name} failed: {e}")
+                return {"ok": False, "error": str(e), "seconds": round(time.monotonic() - t0, 2)}
+
+        names = list(jobs)
+        return dict(zip(names, await asyncio.gather(*(run(name) for name in names))))
+
+
+    @staticmethod
+    def _discard_local_copy(paths):
+        """Remove a local copy made for the X poster when the item is not being archived."""
+        for path in paths or ():
+            if path and os.path.exists(path):
+                os.remove(path)
+                safe_print(f"🗑️ Removed local copy {path}")
+
+
+    # ------------------------------------------------------------------
+    # Journal (resume outstanding steps only)
+    # ------------------------------------------------------------------
+    def _journal_item(self, media_key: str) -> str:
+        return PostJournal.item_id(media_key, self.source.meta(media_key).get("etag"))
+
+
+    def _journaled(self, item: str, platform: str, fn, state: str, ref_of=None):
+        """Wrap fn so its outcome is appended to the journal (no-op without one)."""
+        if not self.journal:
+            return fn
+
+        def run():
+            try:
+                res = fn()
+            except Exception as e:
+                # A timeout leaves any created container usable on the next run.
+                failed = "timeout" if isinstance(e, TimeoutError) else "failed"
+                self.journal.record(item, platform, failed, detail=str(e))
+                raise
+            self.journal.record(item, platform, state, ref=ref_of(res) if ref_of else None)
+            return res
+        return run
+
+
+    def _journaled_async(self, item: str, platform: str, fn, state: str, ref_of=None):
+        """_journaled() for a coroutine function."""
+        if not self.journal:
+            return fn
+
+        async def run():
+            try:
+                res = await fn()
+            except Exception as e:
+                failed = "timeout" if isinstance(e, TimeoutError) else "failed"
+                self.journal.record(item, platform, failed, detail=str(e))
+                raise
+            self.journal.record(item, platform, state, ref=ref_of(res) if ref_of else None)
+            return res
+        return run
+
+
+    @staticmethod
+    def _result_id(res) -> str | None:
+        if not isinstance(res, dict):
+            return None
+        rid = res.get("post_id") or res.get("id")
+        return str(rid) if rid else None
 
 
     # ------------------------------------------------------------------
     # Post ONE item (main.py orchestrates calls)
     # ------------------------------------------------------------------
-    def post_one(self):
-        keys = self.list_post_files()
-        media_files = [k for k in keys if k.lower().endswith((".jpg", ".jpeg", ".png", ".mp4"))]
-        if not media_files:
-            safe_print("✅ No media files to post.")
-            return
+    def post_one(
+        self,
+        *,
+        fanout: bool = True,
+        required: tuple[str, ...] | None = None,
+        aio: bool = False,
+    ):
+        """
+        Post the head of the queue to FB + IG, plus X: in-process when an x_poster
+        is attached, otherwise by copying to posts_folder for the xpost script.
+        Platforms run concurrently (fanout=True); the item is only moved to posted/
+        when every platform in `required` (default: all of them) succeeded.
+        aio=True runs post_one_async() on a fresh event loop instead of threads.
+        """
+        if aio:
+            return run_sync(self._closing(self.post_one_async(required=required)))
 
-        media_files.sort()
-        media_key = media_files[0]
-        base, ext = os.path.splitext(media_key)
-        is_video = ext.lower() == ".mp4"
-        txt_key = base + ".txt"
+        with self.tracer.span("post", poster="social") as sp:
+            self._apply_cached_tokens()
+            current = self.source.current()
+            if not current:
+                safe_print("✅ No media files to post.")
+                return
+            sp.set(key=current.key, bytes=current.size)
 
-        caption = self.read_caption(txt_key) or DEFAULT_CAPTION
-        media_url = self.public_url(media_key)
+            try:
+                plan = self._plan_post(current, required)
+                if "done" in plan:
+                    return plan["done"]
+                results = {**plan["resumed"], **self._run_platforms(plan["jobs"], fanout=fanout)}
+                return self._finish_post(plan, results)
+            except BaseException:
+                self.source.release([current.key])  # stays queued: let any worker retry it
+                raise
 
-        safe_print(f"\n🚀 Posting {media_key} ({'video' if is_video else 'image'})")
-        safe_print(f"   URL : {media_url}")
-        safe_print(f"   Text: {caption}")
 
-        fb_res = self.post_facebook(caption, media_url, is_video)
-        ig_res = self.post_instagram(caption, media_url, is_video)
+    async def post_one_async(self, *, required: tuple[str, ...] | None = None):
+        """
+        post_one() for callers with an event loop: FB and IG (container polls
+        included) run as coroutines, so one loop can keep many accounts' posts
+        in flight. S3 work, X and the local copy stay blocking and go to threads.
+        """
+        with self.tracer.span("post", poster="social") as sp:
+            self._apply_cached_tokens()
+            current = await asyncio.to_thread(self.source.current)
+            if not current:
+                safe_print("✅ No media files to post.")
+                return
+            sp.set(key=current.key, bytes=current.size)
+
+            try:
+                plan = await asyncio.to_thread(self._plan_post, current, required)
+                if "done" in plan:
+                    return plan["done"]
+                results = {**plan["resumed"], **await self._run_platforms_async(plan["jobs"], plan["async_jobs"])}
+                return await asyncio.to_thread(self._finish_post, plan, results)
+            except BaseException:
+                self.source.release([current.key])
+                raise
+
 
-        safe_print("SUMMARY:", {"facebook": bool(fb_res), "instagram": bool(ig_res)})        
+    async def _closing(self, coro):
+        try:
+            return await coro
+        finally:
+            await self.aclose()
+
+
+    def _plan_post(self, current, required: tuple[str, ...] | None) -> dict:
         """
-        Copy the files from the S3 bucket to the POST_FOLDER
-        xpost script runs after this script. Posts to X, then deletes the files.
-        Move the files on the S3 bucket to the posted folder.
+        Everything decided before a platform is contacted: journal state, duplicate
+        handling, renditions and the per-platform jobs (plus the coroutine form of
+        FB/IG). Returns {"done": result} when the item was set aside as a duplicate.
         """
-        self.copy_current_to_local(media_key, self.posts_folder)
+        media_key = current.key
+        is_video = current.is_video
+        caption = current.caption or DEFAULT_CAPTION
+        fb_caption = current.caption_for("facebook") or DEFAULT_CAPTION
+        ig_caption = current.caption_for("instagram") or DEFAULT_CAPTION
+        x_caption = current.caption_for("x") or DEFAULT_CAPTION
+        media_url = current.public_url
+
+        safe_print(f"\n🚀 Posting {media_key} ({'video' if is_video else 'image'})")
+        safe_print(f"   URL : {media_url}")
+        safe_print(f"   Text: {caption}")
+
+        item = self._journal_item(media_key)
+        past = self.journal.state(item) if self.journal else {}
+
+        dups = self.find_duplicates(media_key, current.etag, current.size)
+        if dups and self.dedup == "skip" and not past:
+            self.set_aside_duplicate(media_key)
+            self.source.advance()
+            if self.journal:
+                self.journal.record(item, "archive", "duplicate", ref=dups[0])
+            safe_print(f"⏭️ Skipped {media_key} (duplicate); moved to duplicates/.")
+            return {"done": {"duplicate_of": dups}}
+        if dups and self.journal:
+            self.journal.record(item, "dedup", "flagged", ref=dups[0])
+
+        # Catch out-of-spec media before any container is created (headers only).
+        # X is only checked when we post it ourselves: the local copy feeds the
+        # xpost script with the original.
+        prepared = {}
+        if self.preflight:
+            platforms = ("facebook", "instagram", "x") if self.x_poster else ("facebook", "instagram")
+            prepared = self.preflight.prepare(current, [p for p in platforms if current.targets(p)])
+
+        def rendition(platform):
+            return self.preflight.rendition_for(prepared, platform, media_key) if prepared else None
+
+        def url_for(platform):
+            r = rendition(platform)
+            return media_url if not r or r.key == media_key else self.public_url(r.key)
+
+        def post_x():
+            r = rendition("x")
+            if r and r.path:
+                return self.x_poster.post_x(x_caption, path=r.path)
+            if r and r.key != media_key:
+                return self.x_poster.post_x(x_caption, r.key)
+            return self.x_poster.post_x(x_caption, media_key, size=current.size, etag=current.etag)
+
+        resume_container = None
+        if (past.get("instagram") or {}).get("state") in ("container", "timeout"):
+            resume_container = self.journal.last_ref(item, "instagram", "container")
+
+        def on_container(cid):
+            if self.journal:
+                self.journal.record(item, "instagram", "container", ref=cid)
+
+        jobs = {
+            "facebook": self._journaled(
+                item, "facebook", lambda: self.post_facebook(fb_caption, url_for("facebook"), is_video),
+                "posted", self._result_id),
+            "instagram": self._journaled(
+                item, "instagram",
+                lambda: self.post_instagram(ig_caption, url_for("instagram"), is_video,
+                                            container_id=resume_container, on_container=on_container),
+                "published", self._result_id),
+        }
+        async_jobs = {
+            "facebook": self._journaled_async(
+                item, "facebook", lambda: self.post_facebook_async(fb_caption, url_for("facebook"), is_video),
+                "posted", self._result_id),
+            "instagram": self._journaled_async(
+                item, "instagram",
+                lambda: self.post_instagram_async(ig_caption, url_for("instagram"), is_video,
+                                                  container_id=resume_container, on_container=on_container),
+                "published", self._result_id),
+        }
+        if self.x_poster:
+            jobs["x"] = self._journaled(item, "x", post_x, "posted", self._result_id)
+        else:
+            # The local copy feeds the xpost script, which runs after this one,
+            # posts to X and then deletes the files.
+            jobs["local"] = self._journaled(
+                item, "local",
+                lambda: self.copy_current_to_local(media_key, self.posts_folder,
+                                                   caption=x_caption if current.captions else None),
+                "copied", lambda paths: json.dumps(list(paths)))
+
+        # X cannot take this media and no rendition fixes it: skip X rather than
+        # hold the item (and the queue) back after FB/IG went out.
+        if "x" in jobs and (past.get("x") or {}).get("state") not in FINAL_STATES:
+            try:
+                rendition("x")
+            except PreflightError as e:
+                safe_print(f"⏭️ x: {media_key} not sent: {e}")
+                if self.journal:
+                    self.journal.record(item, "x", "failed", detail=str(e))
+                del jobs["x"]
+                if required is not None:
+                    required = tuple(name for name in required if name != "x")
+
+        # Manifest targets: platforms the item is not meant for are left out entirely.
+        target = lambda name: current.targets("x" if name == "local" else name)
+        for name in [n for n in jobs if not target(n)]:
+            del jobs[name]
+            async_jobs.pop(name, None)
+        if required is None:
+            required = tuple(jobs)
+        else:
+            required = tuple(name for name in required if target(name))
+
+        # Skip whatever an earlier (failed) run already finished for this item.
+        resumed = {}
+        for name in list(jobs):
+            st = past.get(name)
+            if st and st["state"] in FINAL_STATES:
+                ref = json.loads(st["ref"]) if name == "local" and st["ref"] else st["ref"]
+                resumed[name] = {"ok": True, "result": ref, "seconds": 0.0, "resumed": True}
+                del jobs[name]
+                async_jobs.pop(name, None)
+                safe_print(f"↩️ {name}: already {st['state']} ({st['ref']}), skipping.")
+
+        return {
+            "item": item,
+            "media_key": media_key,
+            "required": required,
+            "jobs": jobs,
+            "async_jobs": async_jobs,
+            "resumed": resumed,
+        }
+
+
+    def _finish_post(self, plan: dict, results: dict):
+        """Archive the item when every required platform succeeded; otherwise raise."""
+        item, media_key = plan["item"], plan["media_key"]
+        safe_print("SUMMARY:", {name: (r["ok"], r["seconds"]) for name, r in results.items()})
+
+        failed = [name for name in plan["required"] if not results.get(name, {}).get("ok")]
+        if failed:
+            # Keep X from posting an item that stays in post/ and will be retried.
+            local = results.get("local") or {}
+            if local.get("ok"):
+                self._discard_local_copy(local.get("result"))
+                if self.journal:
+                    self.journal.record(item, "local", "removed")
+            raise RuntimeError(f"Not archiving {media_key}; failed: {', '.join(failed)}")
+
+        # Move the files on the S3 bucket to the posted folder.
         safe_print("Move the S3 files to posted.")
         self.move_to_posted(media_key)
-
+        self.source.advance()
+        if self.journal:
+            self.journal.record(item, "archive", "moved", ref=f"posted/{os.path.basename(media_key)}")
+        return results
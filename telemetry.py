@@ -0,0 +1,204 @@
+# telemetry.py — timing spans for the posting hot path: JSON lines + Prometheus counters/histograms
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from safio import get_env
+
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class Span:
+    """One timed step. set() attaches facts (bytes, status, ids) as the step learns them."""
+
+    def __init__(self, name: str, trace: str, parent, attrs: dict):
+        self.name = name
+        self.trace = trace                     # shared by every span of one post
+        self.id = uuid.uuid4().hex[:8]
+        self.parent = parent
+        self.attrs = attrs
+        self.retries = 0
+        self.started = time.time()
+        self.t0 = time.monotonic()
+
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+class Telemetry:
+    """
+    span(name, **attrs) times a block and records it twice:
+
+    - one JSON line per span in `path` (if set): ts, trace, span, parent,
+      seconds, ok, error, retries and whatever the step set() — grep a trace
+      id to see where one post's time went;
+    - in-memory Prometheus series: spans_total{span,ok}, a span_seconds
+      histogram, bytes_total, retries_total{span,reason} and
+      http_responses_total{span,status}, for /metrics or a textfile.
+
+    Spans nest through contextvars, so they follow asyncio tasks; thread
+    pools have to run jobs in a copied context (contextvars.copy_context()).
+    """
+
+    def __init__(self, path: str | None = None, *, prefix: str = "socialpost", buckets=BUCKETS):
+        self.path = path
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._file = None
+        self.spans: dict[tuple, int] = {}      # (span, ok) -> n
+        self.hist: dict[str, list] = {}        # span -> [bucket counts..., +Inf count, sum]
+        self.bytes: dict[str, int] = {}
+        self.retries: dict[tuple, int] = {}    # (span, reason) -> n
+        self.statuses: dict[tuple, int] = {}   # (span, status) -> n
+
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    @contextmanager
+    def span(self, name: str, /, **attrs):
+        parent = _current.get()
+        trace = attrs.pop("trace", None) or (parent.trace if parent else uuid.uuid4().hex[:12])
+        s = Span(name, trace, parent, attrs)
+        token = _current.set(s)
+        error = None
+        try:
+            yield s
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(s, error)
+
+
+    def retry(self, reason: str):
+        """Count a retry against the innermost open span."""
+        s = _current.get()
+        name = s.name if s else "none"
+        if s:
+            s.retries += 1
+        with self._lock:
+            self.retries[(name, reason)] = self.retries.get((name, reason), 0) + 1
+
+
+    def _finish(self, s: Span, error: str | None):
+        seconds = time.monotonic() - s.t0
+        ok = error is None
+        status = s.attrs.get("status")
+        nbytes = s.attrs.get("bytes")
+        with self._lock:
+            self.spans[(s.name, ok)] = self.spans.get((s.name, ok), 0) + 1
+            h = self.hist.setdefault(s.name, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    h[i] += 1
+            h[len(self.buckets)] += 1
+            h[-1] += seconds
+            if nbytes:
+                self.bytes[s.name] = self.bytes.get(s.name, 0) + int(nbytes)
+            if status is not None:
+                self.statuses[(s.name, str(status))] = self.statuses.get((s.name, str(status)), 0) + 1
+            if self.path:
+                self._write({
+                    "ts": round(s.started, 3),
+                    "trace": s.trace,
+                    "span": s.name,
+                    "id": s.id,
+                    "parent": s.parent.id if s.parent else None,
+                    "seconds": round(seconds, 4),
+                    "ok": ok,
+                    **({"error": error} if error else {}),
+                    **({"retries": s.retries} if s.retries else {}),
+                    **s.attrs,
+                })
+
+
+    def _write(self, record: dict):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        self._file.write(json.dumps(record, default=str) + "\n")
+
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def snapshot(self) -> dict:
+        """{span: {"count", "errors", "seconds", "mean_s"}} for /healthz and --timing."""
+        with self._lock:
+            out = {}
+            for name, h in self.hist.items():
+                count = h[len(self.buckets)]
+                out[name] = {
+                    "count": count,
+                    "errors": self.spans.get((name, False), 0),
+                    "seconds": round(h[-1], 3),
+                    "mean_s": round(h[-1] / count, 3) if count else 0.0,
+                }
+            return out
+
+
+    def prometheus(self) -> str:
+        p = self.prefix
+        with self._lock:
+            lines = [f"# TYPE {p}_spans_total counter"]
+            lines += [f'{p}_spans_total{{span="{n}",ok="{str(ok).lower()}"}} {v}'
+                      for (n, ok), v in sorted(self.spans.items())]
+            lines.append(f"# TYPE {p}_span_seconds histogram")
+            for name, h in sorted(self.hist.items()):
+                lines += [f'{p}_span_seconds_bucket{{span="{name}",le="{le}"}} {h[i]}'
+                          for i, le in enumerate(self.buckets)]
+                lines.append(f'{p}_span_seconds_bucket{{span="{name}",le="+Inf"}} {h[len(self.buckets)]}')
+                lines.append(f'{p}_span_seconds_sum{{span="{name}"}} {h[-1]:.6f}')
+                lines.append(f'{p}_span_seconds_count{{span="{name}"}} {h[len(self.buckets)]}')
+            lines.append(f"# TYPE {p}_bytes_total counter")
+            lines += [f'{p}_bytes_total{{span="{n}"}} {v}' for n, v in sorted(self.bytes.items())]
+            lines.append(f"# TYPE {p}_retries_total counter")
+            lines += [f'{p}_retries_total{{span="{n}",reason="{r}"}} {v}'
+                      for (n, r), v in sorted(self.retries.items())]
+            lines.append(f"# TYPE {p}_http_responses_total counter")
+            lines += [f'{p}_http_responses_total{{span="{n}",status="{s}"}} {v}'
+                      for (n, s), v in sorted(self.statuses.items())]
+        return "\n".join(lines) + "\n"
+
+
+    def write_prometheus(self, path: str):
+        """Atomic textfile (node_exporter textfile collector) for one-shot cron runs."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+_shared_tracer = None
+_shared_lock = threading.Lock()
+
+
+def shared_tracer() -> Telemetry:
+    """Process-wide tracer; JSON lines go to $TELEMETRY_PATH when it is set."""
+    global _shared_tracer
+    with _shared_lock:
+        if _shared_tracer is None:
+            _shared_tracer = Telemetry(get_env("TELEMETRY_PATH") or None)
+        return _shared_tracer
@@ -0,0 +1,5 @@
+# conftest.py — the modules live at the repo root, next to tests/
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
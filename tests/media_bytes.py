@@ -0,0 +1,49 @@
+# media_bytes.py — hand-built JPEG / MP4 headers for the tests
+import struct
+
+
+def box(typ: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), typ) + payload
+
+
+IDENTITY = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+ROTATE_90 = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+
+
+def mvhd(timescale: int, duration: int, version: int = 0) -> bytes:
+    if version == 1:
+        head = struct.pack(">I QQ I Q", 1 << 24, 0, 0, timescale, duration)
+    else:
+        head = struct.pack(">I II I I", 0, 0, 0, timescale, duration)
+    return box(b"mvhd", head + bytes(80))
+
+
+def tkhd(width: int, height: int, matrix=IDENTITY, version: int = 0) -> bytes:
+    if version == 1:
+        head = struct.pack(">I QQ II Q", 1 << 24, 0, 0, 1, 0, 0)
+    else:
+        head = struct.pack(">I II II I", 0, 0, 0, 1, 0, 0)
+    head += bytes(8) + struct.pack(">hhhh", 0, 0, 0, 0)
+    return box(b"tkhd", head + struct.pack(">9i", *matrix) + struct.pack(">II", width << 16, height << 16))
+
+
+def trak(handler: bytes, codec: bytes, tkhd_box: bytes = b"") -> bytes:
+    hdlr = box(b"hdlr", struct.pack(">II4s", 0, 0, handler) + bytes(12))
+    stsd = box(b"stsd", struct.pack(">II", 0, 1) + box(codec, bytes(8)))
+    return box(b"trak", tkhd_box + box(b"mdia", hdlr + box(b"minf", box(b"stbl", stsd))))
+
+
+def mp4(*, faststart: bool = True, mvhd_box: bytes | None = None, video_tkhd: bytes | None = None) -> bytes:
+    ftyp = box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomavc1")
+    moov = box(b"moov", (mvhd_box or mvhd(1000, 12_500))
+               + trak(b"vide", b"avc1", video_tkhd or tkhd(1080, 1920))
+               + trak(b"soun", b"mp4a"))
+    mdat = box(b"mdat", bytes(64))
+    return ftyp + (moov + mdat if faststart else mdat + moov)
+
+
+def jpeg(width: int, height: int) -> bytes:
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + bytes(9)
+    sof0 = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    sos = b"\xff\xda" + struct.pack(">H", 8) + bytes(6)
+    return b"\xff\xd8" + app0 + sof0 + sos + bytes(32) + b"\xff\xd9"
@@ -0,0 +1,64 @@
+# test_archive.py — S3Archiver bookkeeping with a stubbed s3 client
+import pytest
+
+pytest.importorskip("boto3")
+
+from archive import S3Archiver
+
+
+class StubS3:
+    """copy_object / delete_objects over a dict; fail_copy / fail_delete name keys that error."""
+
+    def __init__(self, keys, fail_copy=(), fail_delete=()):
+        self.objects = dict.fromkeys(keys, b"")
+        self.fail_copy = set(fail_copy)
+        self.fail_delete = set(fail_delete)
+        self.delete_calls = 0
+
+
+    def copy_object(self, Bucket, CopySource, Key):
+        if CopySource["Key"] in self.fail_copy:
+            raise RuntimeError("copy refused")
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+
+    def delete_objects(self, Bucket, Delete):
+        self.delete_calls += 1
+        errors = []
+        for obj in Delete["Objects"]:
+            if obj["Key"] in self.fail_delete:
+                errors.append({"Key": obj["Key"], "Code": "AccessDenied", "Message": "no"})
+            else:
+                self.objects.pop(obj["Key"], None)
+        return {"Errors": errors}
+
+
+ITEMS = {
+    "post/a.jpg": ["post/a.jpg", "post/a.txt"],
+    "post/b.jpg": ["post/b.jpg"],
+    "post/c.mp4": ["post/c.mp4", "post/c.txt"],
+}
+
+
+def test_moves_everything_with_one_delete():
+    s3 = StubS3([k for keys in ITEMS.values() for k in keys])
+    res = S3Archiver(s3=s3, bucket="b").archive(ITEMS)
+    assert res == {"moved": list(ITEMS), "failed": {}}
+    assert sorted(s3.objects) == ["posted/a.jpg", "posted/a.txt", "posted/b.jpg", "posted/c.mp4", "posted/c.txt"]
+    assert s3.delete_calls == 1
+
+
+def test_failed_copy_keeps_the_whole_item_queued():
+    s3 = StubS3([k for keys in ITEMS.values() for k in keys], fail_copy=["post/a.txt"])
+    res = S3Archiver(s3=s3, bucket="b").archive(ITEMS)
+    assert res["moved"] == ["post/b.jpg", "post/c.mp4"]
+    assert list(res["failed"]) == ["post/a.jpg"]
+    assert "post/a.jpg" in s3.objects and "post/a.txt" in s3.objects
+
+
+def test_failed_delete_is_not_reported_moved():
+    s3 = StubS3([k for keys in ITEMS.values() for k in keys], fail_delete=["post/c.txt"])
+    res = S3Archiver(s3=s3, bucket="b").archive(ITEMS)
+    assert res["moved"] == ["post/a.jpg", "post/b.jpg"]
+    assert "AccessDenied" in res["failed"]["post/c.mp4"]
+    assert "post/c.txt" in s3.objects
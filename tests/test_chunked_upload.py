@@ -0,0 +1,102 @@
+# test_chunked_upload.py — INIT/APPEND/FINALIZE progress state against a stub tweepy API
+import json
+import os
+
+import pytest
+
+from xpost.chunked_upload import ChunkedUploader
+
+
+class Media:
+    def __init__(self, media_id, processing_info=None):
+        self.media_id_string = media_id
+        self.expires_after_secs = 86400
+        self.processing_info = processing_info
+
+
+class StubAPI:
+    """Records every call; APPEND of the segments in fail_at raises once each."""
+
+    def __init__(self, fail_at=()):
+        self.fail_at = set(fail_at)
+        self.calls = []
+        self.segments = {}
+
+
+    def chunked_upload_init(self, size, media_type, media_category=None):
+        self.calls.append("INIT")
+        return Media(f"m{self.calls.count('INIT')}")
+
+
+    def chunked_upload_append(self, media_id, chunk, index):
+        self.calls.append(f"APPEND {index}")
+        if index in self.fail_at:
+            self.fail_at.discard(index)
+            raise ConnectionError("reset by peer")
+        self.segments[index] = chunk
+
+
+    def chunked_upload_finalize(self, media_id):
+        self.calls.append("FINALIZE")
+        return Media(media_id)
+
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(bytes(range(256)) * 10)      # 2560 bytes: 3 segments of 1000
+    return str(path)
+
+
+def uploader(api, chunk_size=1000, max_retries=0):
+    return ChunkedUploader(api, chunk_size=chunk_size, max_retries=max_retries, sleep=lambda s: None)
+
+
+def state_path(media):
+    return os.path.join(os.path.dirname(media), ".clip.mp4.upload.json")
+
+
+def test_upload_sends_every_segment_and_clears_its_state(media):
+    api = StubAPI()
+    assert uploader(api).upload_file(media) == "m1"
+    assert api.calls == ["INIT", "APPEND 0", "APPEND 1", "APPEND 2", "FINALIZE"]
+    assert b"".join(api.segments[i] for i in range(3)) == open(media, "rb").read()
+    assert not os.path.exists(state_path(media))
+
+
+def test_interrupted_upload_resumes_at_the_failed_segment(media):
+    api = StubAPI(fail_at={2})
+    with pytest.raises(ConnectionError):
+        uploader(api).upload_file(media)
+    with open(state_path(media), encoding="utf-8") as f:
+        assert json.load(f)["next_segment"] == 2
+
+    api.calls.clear()
+    assert uploader(api).upload_file(media) == "m1"
+    assert api.calls == ["APPEND 2", "FINALIZE"]
+
+
+def test_changed_file_or_chunk_size_starts_over(media):
+    api = StubAPI(fail_at={1})
+    with pytest.raises(ConnectionError):
+        uploader(api).upload_file(media)
+
+    api.calls.clear()
+    uploader(api, chunk_size=2000).upload_file(media)
+    assert api.calls[0] == "INIT"
+
+    api.fail_at = {1}
+    with pytest.raises(ConnectionError):
+        uploader(api).upload_file(media)
+    with open(media, "ab") as f:
+        f.write(b"more")
+    os.utime(media, (1, 1))
+    api.calls.clear()
+    uploader(api).upload_file(media)
+    assert api.calls[:2] == ["INIT", "APPEND 0"]
+
+
+def test_retries_a_segment_before_giving_up(media):
+    api = StubAPI(fail_at={1})
+    assert uploader(api, max_retries=1).upload_file(media) == "m1"
+    assert api.calls == ["INIT", "APPEND 0", "APPEND 1", "APPEND 1", "APPEND 2", "FINALIZE"]
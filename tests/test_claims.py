@@ -0,0 +1,141 @@
+# test_claims.py — QueueClaims leases against a stubbed s3 with conditional PUTs
+import itertools
+import json
+import time
+
+import pytest
+
+pytest.importorskip("botocore")
+
+from botocore.exceptions import ClientError
+
+from claims import QueueClaims
+
+
+def _error(status: int, code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "PutObject")
+
+
+class StubS3:
+    """Objects with ETags; put_object honours IfNoneMatch="*" and IfMatch like S3 does."""
+
+    def __init__(self):
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        self._etags = itertools.count(1)
+
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfNoneMatch=None, IfMatch=None):
+        current = self.objects.get(Key)
+        if IfNoneMatch == "*" and current:
+            raise _error(412, "PreconditionFailed")
+        if IfMatch and (not current or f'"{current[1]}"' != IfMatch):
+            raise _error(412, "PreconditionFailed")
+        etag = f"e{next(self._etags)}"
+        self.objects[Key] = (Body, etag)
+        return {"ETag": f'"{etag}"'}
+
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise _error(404, "NoSuchKey")
+        body, etag = self.objects[Key]
+
+        class Body:
+            def read(self):
+                return body
+
+        return {"Body": Body(), "ETag": f'"{etag}"'}
+
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+
+    def lease(self, key: str) -> dict:
+        return json.loads(self.objects[f"claims/{key}.lock"][0])
+
+
+def claims(s3, owner, **kwargs):
+    return QueueClaims(s3=s3, bucket="b", owner=owner, ttl=kwargs.pop("ttl", 600), **kwargs)
+
+
+def test_first_claim_wins_and_the_other_worker_backs_off():
+    s3 = StubS3()
+    a, b = claims(s3, "A"), claims(s3, "B")
+    assert a.try_claim("post/1.jpg")
+    assert not b.try_claim("post/1.jpg")
+    assert b.try_claim("post/2.jpg")
+    assert s3.lease("post/1.jpg")["owner"] == "A"
+    assert a.holds("post/1.jpg") and not b.holds("post/1.jpg")
+
+
+def test_expired_lease_is_taken_over():
+    s3 = StubS3()
+    s3.put_object(Bucket="b", Key="claims/post/1.jpg.lock",
+                  Body=json.dumps({"owner": "dead", "expires": time.time() - 5}).encode())
+    b = claims(s3, "B")
+    assert b.try_claim("post/1.jpg")
+    assert s3.lease("post/1.jpg")["owner"] == "B"
+
+
+def test_only_one_of_two_takeovers_succeeds():
+    s3 = StubS3()
+    s3.put_object(Bucket="b", Key="claims/post/1.jpg.lock",
+                  Body=json.dumps({"owner": "dead", "expires": time.time() - 5}).encode())
+    a, b = claims(s3, "A"), claims(s3, "B")
+    stale_read = s3.get_object
+
+    # Both read the same stale lease; A's If-Match write lands first.
+    def read_then_let_a_win(Bucket, Key):
+        obj = stale_read(Bucket=Bucket, Key=Key)
+        s3.get_object = stale_read
+        assert a.try_claim("post/1.jpg")
+        return obj
+
+    s3.get_object = read_then_let_a_win
+    assert not b.try_claim("post/1.jpg")
+    assert s3.lease("post/1.jpg")["owner"] == "A"
+
+
+def test_same_owner_takes_back_its_own_lease():
+    s3 = StubS3()
+    assert claims(s3, "A").try_claim("post/1.jpg")
+    restarted = claims(s3, "A")
+    assert restarted.try_claim("post/1.jpg")
+    assert not claims(s3, "B").try_claim("post/1.jpg")
+
+
+def test_renew_extends_and_fails_once_the_lease_is_lost():
+    s3 = StubS3()
+    a = claims(s3, "A")
+    assert a.try_claim("post/1.jpg")
+    before = s3.lease("post/1.jpg")["expires"]
+    time.sleep(0.01)
+    assert a.renew("post/1.jpg")
+    assert s3.lease("post/1.jpg")["expires"] > before
+
+    s3.objects.pop("claims/post/1.jpg.lock")
+    s3.put_object(Bucket="b", Key="claims/post/1.jpg.lock", Body=b"{}")   # someone else's
+    assert not a.renew("post/1.jpg")
+    assert not a.holds("post/1.jpg")
+
+
+def test_release_drops_only_our_leases():
+    s3 = StubS3()
+    a, b = claims(s3, "A"), claims(s3, "B")
+    assert a.try_claim("post/1.jpg") and b.try_claim("post/2.jpg")
+    a.release(["post/1.jpg", "post/2.jpg"])
+    assert sorted(s3.objects) == ["claims/post/2.jpg.lock"]
+    assert b.try_claim("post/2.jpg") and claims(s3, "C").try_claim("post/1.jpg")
+
+
+def test_leases_are_renewed_in_the_background():
+    s3 = StubS3()
+    a = claims(s3, "A", ttl=0.3)
+    assert a.try_claim("post/1.jpg")
+    time.sleep(0.5)                               # past the first TTL
+    assert a.holds("post/1.jpg")
+    assert not claims(s3, "B").try_claim("post/1.jpg")
+    a.release(["post/1.jpg"])
@@ -0,0 +1,84 @@
+# test_daemon.py — posting window parsing and queue refresh pacing
+import datetime
+import time
+
+import pytest
+
+from daemon import PostingDaemon, Slot, parse_windows
+
+
+def test_parse_windows():
+    assert parse_windows("09:00-10:30, 17:00-18:00") == [
+        (datetime.time(9, 0), datetime.time(10, 30)),
+        (datetime.time(17, 0), datetime.time(18, 0)),
+    ]
+
+
+def test_parse_windows_empty():
+    assert parse_windows(None) == []
+    assert parse_windows("") == []
+    assert parse_windows(" , ") == []
+
+
+def test_parse_windows_seconds():
+    assert parse_windows("08:15:30-08:45") == [(datetime.time(8, 15, 30), datetime.time(8, 45))]
+
+
+def test_parse_windows_rejects_malformed():
+    with pytest.raises(ValueError):
+        parse_windows("9am-10am")
+    with pytest.raises(ValueError):
+        parse_windows("09:00")
+
+
+# ----------------------------------------------------------------------
+# Queue refreshes
+# ----------------------------------------------------------------------
+class CountingSource:
+    def __init__(self, depth=0):
+        self.items = depth
+        self.refreshes = 0
+
+
+    def refresh(self):
+        self.refreshes += 1
+
+
+    def depth(self):
+        return self.items
+
+
+    def advance(self):
+        pass
+
+
+def make_daemon(source, posted, slots=()):
+    daemon = PostingDaemon(posters={"p": lambda: posted.append(1)}, windows={"p": []}, source=source,
+                           watch_interval=15, refresh_interval=900)
+    daemon.planned_for = datetime.date.today()
+    daemon.slots = list(slots)
+    return daemon
+
+
+def test_idle_daemon_refreshes_once_per_refresh_interval():
+    source, posted = CountingSource(), []
+    daemon = make_daemon(source, posted, [Slot("p", time.time() + 3600, time.time() + 7200)])
+    for _ in range(10):
+        daemon.tick()
+    assert source.refreshes == 1
+    daemon._refreshed_at -= 900
+    daemon.tick()
+    assert source.refreshes == 2 and posted == []
+
+
+def test_due_slot_refreshes_every_tick_until_media_arrives():
+    source, posted = CountingSource(), []
+    daemon = make_daemon(source, posted, [Slot("p", time.time() - 1, time.time() + 3600)])
+    daemon.tick()
+    daemon.tick()
+    assert source.refreshes == 2 and posted == []
+    source.items = 1
+    daemon.tick()
+    assert posted == [1]
+    daemon.tick()                              # slot done: back to the long interval
+    assert source.refreshes == 3
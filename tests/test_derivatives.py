@@ -0,0 +1,46 @@
+# test_derivatives.py — crop/scale geometry for compliant renditions
+from derivatives import _target_box
+from preflight import SPECS
+
+
+IG_IMAGE = SPECS[("instagram", "image")]
+IG_VIDEO = SPECS[("instagram", "video")]
+X_VIDEO = SPECS[("x", "video")]
+
+
+def test_in_range_is_untouched():
+    assert _target_box(1080, 1350, IG_IMAGE, None) == ((1080, 1350), (1080, 1350))
+
+
+def test_too_tall_is_cropped_to_min_aspect():
+    (cw, ch), (tw, th) = _target_box(1000, 2000, IG_IMAGE, None)
+    assert (cw, ch) == (1000, 1250)                   # 0.8
+    assert (tw, th) == (1000, 1250)
+
+
+def test_too_wide_is_cropped_to_max_aspect():
+    (cw, ch), _ = _target_box(3000, 1000, IG_IMAGE, None)
+    assert (cw, ch) == (1910, 1000)                   # 1.91
+
+
+def test_long_side_cap_scales_to_even_sizes():
+    (cw, ch), (tw, th) = _target_box(2160, 3840, IG_VIDEO, None)
+    assert (cw, ch) == (2160, 3840)
+    assert (tw, th) == (1080, 1920)
+    assert tw % 2 == 0 and th % 2 == 0
+
+
+def test_short_side_cap_wins_when_tighter():
+    _, (tw, th) = _target_box(1920, 1440, X_VIDEO, None)
+    assert min(tw, th) <= 1200
+    assert (tw, th) == (1600, 1200)
+
+
+def test_explicit_long_cap_overrides_spec():
+    _, (tw, th) = _target_box(4000, 3000, IG_IMAGE, 1080)
+    assert (tw, th) == (1080, 810)
+
+
+def test_odd_results_round_down_to_even():
+    _, (tw, th) = _target_box(1001, 1001, IG_IMAGE, 999)
+    assert (tw, th) == (998, 998)
@@ -0,0 +1,44 @@
+# test_journal.py — latest-row-wins state, refs and final states
+from journal import FINAL_STATES, PostJournal
+
+
+def journal(tmp_path):
+    return PostJournal(str(tmp_path / "journal.sqlite3"))
+
+
+def test_item_id_includes_the_etag():
+    assert PostJournal.item_id("post/a.jpg", "abc") == "post/a.jpg#abc"
+    assert PostJournal.item_id("post/a.jpg") == "post/a.jpg"
+
+
+def test_latest_row_per_platform_is_the_state(tmp_path):
+    j = journal(tmp_path)
+    j.record("a", "instagram", "container", ref="c1")
+    j.record("a", "facebook", "failed", detail={"code": 2})
+    j.record("a", "facebook", "posted", ref="p1")
+    j.record("b", "facebook", "failed")
+    state = j.state("a")
+    assert {p: s["state"] for p, s in state.items()} == {"instagram": "container", "facebook": "posted"}
+    assert state["facebook"]["ref"] == "p1"
+    assert j.state("missing") == {}
+
+
+def test_done_only_for_final_states(tmp_path):
+    j = journal(tmp_path)
+    j.record("a", "instagram", "container", ref="c1")
+    j.record("a", "facebook", "scheduled", ref="p1")
+    assert j.done("a", "instagram") is None
+    assert j.done("a", "facebook")["ref"] == "p1"
+    j.record("a", "facebook", "cancelled", ref="p1")
+    assert j.done("a", "facebook") is None
+    assert "cancelled" not in FINAL_STATES
+
+
+def test_last_ref_survives_later_states_and_a_reopen(tmp_path):
+    j = journal(tmp_path)
+    j.record("a", "instagram", "container", ref="c1")
+    j.record("a", "instagram", "failed", detail="9007")
+    j.close()
+    j = journal(tmp_path)
+    assert j.last_ref("a", "instagram", "container") == "c1"
+    assert j.last_ref("a", "instagram", "published") is None
@@ -0,0 +1,70 @@
+# test_manifest.py — post/manifest.json parsing
+import json
+
+import pytest
+
+from manifest import ManifestEntry, dump_manifest, entry_from_dict, entry_to_dict, parse_manifest
+
+
+def test_parse_versioned_document():
+    body = json.dumps({"version": 1, "items": [{"key": "post/a.jpg"}, {"key": "post/b.mp4"}]})
+    assert [d["key"] for d in parse_manifest(body.encode("utf-8"))] == ["post/a.jpg", "post/b.mp4"]
+
+
+def test_parse_bare_list_keeps_order_and_drops_keyless():
+    body = json.dumps([{"key": "post/b.jpg"}, {"caption": "no key"}, "junk", {"key": "post/a.jpg"}])
+    assert [d["key"] for d in parse_manifest(body)] == ["post/b.jpg", "post/a.jpg"]
+
+
+def test_parse_json_lines():
+    body = '{"key": "post/1.jpg"}\n\n{"note": "skipped"}\n{"key": "post/2.jpg", "caption": "two"}\n'
+    items = parse_manifest(body)
+    assert [d["key"] for d in items] == ["post/1.jpg", "post/2.jpg"]
+    assert items[1]["caption"] == "two"
+
+
+def test_parse_rejects_newer_version():
+    with pytest.raises(ValueError):
+        parse_manifest(json.dumps({"version": 99, "items": []}))
+
+
+def test_parse_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_manifest(b"not json at all")
+
+
+def test_entry_from_dict():
+    e = entry_from_dict({
+        "key": "post/a.jpg",
+        "caption": "hello",
+        "captions": {"x": "short"},
+        "platforms": ["Facebook", "X"],
+        "not_before": "2026-01-02T03:04:05Z",
+        "etag": '"abc123"',
+        "size": 42,
+    })
+    assert e.caption_for("x") == "short"
+    assert e.caption_for("instagram") == "hello"
+    assert e.platforms == ("facebook", "x")
+    assert e.not_before == 1767323045.0
+    assert (e.etag, e.size) == ("abc123", 42)
+
+
+def test_entry_from_dict_defaults():
+    e = entry_from_dict({"key": "post/a.jpg", "not_before": 1700000000})
+    assert e.captions == {} and e.caption_for("facebook") is None
+    assert e.platforms is None
+    assert e.not_before == 1700000000.0
+    assert e.etag is None
+
+
+def test_entry_from_dict_naive_time_is_utc():
+    assert entry_from_dict({"key": "k", "not_before": "2026-01-02T03:04:05"}).not_before == 1767323045.0
+
+
+def test_round_trip_through_dump():
+    entries = [ManifestEntry(key="post/a.jpg", captions={"default": "hi"}, platforms=("instagram",),
+                             not_before=1767323045.0, caption_key="post/a.txt", size=7, etag="e")]
+    back = [entry_from_dict(d) for d in parse_manifest(dump_manifest(entries))]
+    assert back == entries
+    assert entry_to_dict(ManifestEntry(key="post/b.jpg")) == {"key": "post/b.jpg"}
@@ -0,0 +1,108 @@
+# test_preflight.py — header probing and spec checks on hand-built bytes
+import struct
+
+from media_bytes import ROTATE_90, jpeg, mp4, mvhd, tkhd
+from preflight import MB, SPECS, MediaInfo, probe
+
+
+class BytesSource:
+    """The read(offset, length) interface of S3RangeSource over a bytes object."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.size = len(data)
+
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self.data[offset:offset + length]
+
+
+# ----------------------------------------------------------------------
+# MP4 box walk
+# ----------------------------------------------------------------------
+def test_mp4_faststart_tracks_and_duration():
+    info = probe(BytesSource(mp4()))
+    assert info.format == "mp4"
+    assert info.faststart is True
+    assert (info.width, info.height) == (1080, 1920)
+    assert info.duration == 12.5
+    assert (info.video_codec, info.audio_codec) == ("avc1", "mp4a")
+
+
+def test_mp4_moov_after_mdat_is_not_faststart():
+    info = probe(BytesSource(mp4(faststart=False)))
+    assert info.faststart is False
+    assert info.video_codec == "avc1"
+
+
+def test_mp4_mvhd_version_1():
+    info = probe(BytesSource(mp4(mvhd_box=mvhd(90_000, 90_000 * 61, version=1))))
+    assert info.duration == 61.0
+
+
+def test_mp4_tkhd_version_1_and_rotation_matrix():
+    info = probe(BytesSource(mp4(video_tkhd=tkhd(1920, 1080, ROTATE_90, version=1))))
+    assert (info.width, info.height) == (1080, 1920)   # displayed portrait
+
+
+def test_mp4_truncated_moov_yields_no_fields():
+    info = probe(BytesSource(mp4()[:40]))
+    assert info.format == "mp4"
+    assert info.duration is None and info.width is None and info.video_codec is None
+
+
+# ----------------------------------------------------------------------
+# Images
+# ----------------------------------------------------------------------
+def test_jpeg_sof_after_app_segment():
+    info = probe(BytesSource(jpeg(1440, 1800)))
+    assert info.format == "jpeg"
+    assert (info.width, info.height) == (1440, 1800)
+
+
+def test_jpeg_without_frame_header():
+    data = b"\xff\xd8" + b"\xff\xda" + struct.pack(">H", 8) + bytes(6)
+    info = probe(BytesSource(data))
+    assert info.format == "jpeg" and info.width is None
+
+
+def test_png_header():
+    data = b"\x89PNG\r\n\x1a\n" + struct.pack(">I4sII", 13, b"IHDR", 640, 480) + bytes(9)
+    info = probe(BytesSource(data))
+    assert (info.format, info.width, info.height) == ("png", 640, 480)
+
+
+# ----------------------------------------------------------------------
+# Spec.problems
+# ----------------------------------------------------------------------
+def test_spec_accepts_compliant_media():
+    assert SPECS[("instagram", "image")].problems(MediaInfo("jpeg", MB, 1080, 1350)) == []
+    video = MediaInfo("mp4", 20 * MB, 1080, 1920, duration=30, video_codec="avc1",
+                      audio_codec="mp4a", faststart=True)
+    assert SPECS[("instagram", "video")].problems(video) == []
+
+
+def test_spec_lists_every_problem():
+    problems = SPECS[("instagram", "image")].problems(MediaInfo("png", 9 * MB, 300, 600))
+    assert len(problems) == 4
+    assert problems[0].startswith("format png")
+    assert any("MB >" in p for p in problems)
+    assert any(p.startswith("aspect 0.50 <") for p in problems)
+    assert any(p.startswith("width 300 <") for p in problems)
+
+
+def test_spec_video_limits():
+    video = MediaInfo("mp4", 20 * MB, 2160, 3840, duration=200, video_codec="hvc1",
+                      audio_codec="opus", faststart=False)
+    problems = SPECS[("x", "video")].problems(video)
+    assert "2160x3840 exceeds 1920px" in problems
+    assert "2160x3840 exceeds 1200px on the short side" in problems
+    assert "duration 200s > 140s" in problems
+    assert "video codec hvc1" in problems
+    assert "audio codec opus" in problems
+    assert "moov atom after mdat (not faststart)" in SPECS[("instagram", "video")].problems(video)
+
+
+def test_spec_aspect_tolerance():
+    # 4:5 rounded down a pixel still passes IG's 0.8 minimum
+    assert SPECS[("instagram", "image")].problems(MediaInfo("jpeg", MB, 1079, 1350)) == []
@@ -0,0 +1,100 @@
+# test_s3_queue.py — S3QueueIndex refreshes against a stubbed, paging list_objects_v2
+import pytest
+
+pytest.importorskip("dotenv")                    # the telemetry span reads TELEMETRY_PATH
+
+from s3_queue import S3QueueIndex
+
+
+class StubS3:
+    """list_objects_v2 over a dict of key -> etag, page_size keys per page, like S3 orders them."""
+
+    def __init__(self, keys=(), page_size=1000):
+        self.objects = {key: "e0" for key in keys}
+        self.page_size = page_size
+        self.calls = []
+
+
+    def list_objects_v2(self, Bucket, Prefix, StartAfter=None, ContinuationToken=None):
+        self.calls.append({"StartAfter": StartAfter, "ContinuationToken": ContinuationToken})
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = [k for k in keys if k > after]
+        page = keys[:self.page_size]
+        resp = {"Contents": [{"Key": k, "ETag": f'"{self.objects[k]}"', "Size": 1} for k in page]}
+        if len(keys) > len(page):
+            resp.update(IsTruncated=True, NextContinuationToken=page[-1])
+        return resp
+
+
+def index(s3, tmp_path=None):
+    path = str(tmp_path / "queue.json") if tmp_path else None
+    return S3QueueIndex(s3=s3, bucket="b", cache_path=path)
+
+
+def test_first_refresh_lists_every_page(tmp_path):
+    s3 = StubS3([f"post/{i:02}.jpg" for i in range(5)], page_size=2)
+    q = index(s3, tmp_path)
+    assert q.refresh() == 5
+    assert q.media_keys() == [f"post/{i:02}.jpg" for i in range(5)]
+    assert len(s3.calls) == 3
+
+
+def test_single_page_prefix_is_relisted_whole(tmp_path):
+    s3 = StubS3(["post/b.jpg", "post/c.jpg"])
+    q = index(s3, tmp_path)
+    q.refresh()
+    s3.objects["post/a.jpg"] = "e0"
+    del s3.objects["post/c.jpg"]
+    assert q.refresh() == 1
+    assert q.media_keys() == ["post/a.jpg", "post/b.jpg"]
+    assert len(s3.calls) == 2
+
+
+def test_upload_sorting_before_the_last_key_forces_a_full_relist(tmp_path):
+    s3 = StubS3([f"post/{i}.jpg" for i in "cdefgh"], page_size=2)
+    q = index(s3, tmp_path)
+    q.refresh()
+    s3.objects["post/a.jpg"] = "e0"
+    s3.calls.clear()
+    assert q.refresh() == 1
+    assert q.next_item(verify=False) == ("post/a.jpg", None)
+    assert s3.calls[0] == {"StartAfter": None, "ContinuationToken": None}
+    assert len(s3.calls) == 1 + 4                # head probe, then every page
+
+
+def test_new_tail_keys_are_listed_incrementally(tmp_path):
+    s3 = StubS3([f"post/{i}.jpg" for i in "abcdef"], page_size=2)
+    q = index(s3, tmp_path)
+    q.refresh()
+    s3.objects["post/g.jpg"] = "e0"
+    s3.objects["post/g.txt"] = "e0"
+    s3.calls.clear()
+    assert q.refresh() == 2
+    assert q.peek(10)[-1] == ("post/g.jpg", "post/g.txt")
+    assert s3.calls[1]["StartAfter"] == "post/f.jpg"
+    assert len(s3.calls) == 2
+
+
+def test_head_changes_are_picked_up_without_a_full_relist(tmp_path):
+    s3 = StubS3([f"post/{i}.jpg" for i in "abcdef"], page_size=2)
+    q = index(s3, tmp_path)
+    q.refresh()
+    del s3.objects["post/a.jpg"]                 # posted by another worker
+    s3.objects["post/b.jpg"] = "e1"              # replaced in place
+    s3.calls.clear()
+    assert q.refresh() == 2
+    assert q.next_item(verify=False) == ("post/b.jpg", None)
+    assert q.meta("post/b.jpg")["etag"] == "e1"
+    assert s3.calls[1]["StartAfter"] == "post/f.jpg" and len(s3.calls) == 2
+
+
+def test_snapshot_survives_a_restart(tmp_path):
+    s3 = StubS3([f"post/{i}.jpg" for i in "abcdef"], page_size=2)
+    index(s3, tmp_path).refresh()
+    s3.calls.clear()
+    q = index(s3, tmp_path)
+    assert q.refresh() == 0
+    assert len(q.media_keys()) == 6
+    assert s3.calls[1]["StartAfter"] == "post/f.jpg"
@@ -0,0 +1,135 @@
+# test_social_post.py — whole posts against the bench's local Graph API and S3 stand-ins
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from bench.fakes import FakeGraph, FakeS3
+from graph_api import GraphClient
+from journal import PostJournal
+from media_bytes import mp4, mvhd
+from media_source import MediaSource, make_s3_client
+from preflight import Preflight
+from social_post import SocialPoster
+
+
+@pytest.fixture
+def servers():
+    graph, s3 = FakeGraph(image_delay=0, video_delay=0).start(), FakeS3().start()
+    yield graph, s3
+    graph.stop()
+    s3.stop()
+
+
+def make_poster(graph, s3_server, tmp_path, claim_ttl=None, **kwargs):
+    s3 = make_s3_client(s3_server.url, "key", "secret", s3={"addressing_style": "path"})
+    return SocialPoster(
+        fb_app_id="app",
+        fb_app_secret="secret",
+        fb_long_lived_user_token=graph.user_token,
+        fb_page_id="10000",
+        fb_page_token="page",
+        ig_user_id="20000",
+        ig_page_token="",
+        media_source=MediaSource(s3_bucket="b", media_base_url=f"{s3_server.url}/b", s3_client=s3,
+                                 claim_ttl=claim_ttl),
+        posts_folder=str(tmp_path / "local"),
+        graph=GraphClient(app_secret="secret", host=graph.url),
+        s3_client=s3,
+        journal_path=str(tmp_path / "journal.sqlite3"),
+        preflight=Preflight(s3=s3, bucket="b"),
+        **kwargs,
+    )
+
+
+class RecordingX:
+    def __init__(self):
+        self.posted = []
+
+
+    def post_x(self, caption, key=None, **kwargs):
+        self.posted.append(key)
+        return {"id": "x1"}
+
+
+# 200 s is fine for FB and IG (Reels) but over X's 140 s limit.
+LONG_VIDEO = mp4(mvhd_box=mvhd(1000, 200_000))
+
+
+def test_video_over_x_spec_is_copied_and_archived(servers, tmp_path):
+    graph, s3 = servers
+    s3.put("b", "post/long.mp4", LONG_VIDEO)
+    results = make_poster(graph, s3, tmp_path).post_one()
+
+    assert results["facebook"]["ok"] and results["instagram"]["ok"] and results["local"]["ok"]
+    assert os.path.exists(tmp_path / "local" / "long.mp4")   # the original, for the xpost script
+    assert s3.keys("b", "post/") == []
+    assert s3.keys("b", "posted/") == ["posted/long.mp4"]
+
+
+def test_video_over_x_spec_skips_x_and_is_archived(servers, tmp_path):
+    graph, s3 = servers
+    s3.put("b", "post/long.mp4", LONG_VIDEO)
+    x = RecordingX()
+    poster = make_poster(graph, s3, tmp_path, x_poster=x)
+    results = poster.post_one()
+
+    assert results["facebook"]["ok"] and results["instagram"]["ok"]
+    assert "x" not in results and x.posted == []
+    assert s3.keys("b", "posted/") == ["posted/long.mp4"]
+    state = poster.journal.state(PostJournal.item_id("post/long.mp4", hashlib.md5(LONG_VIDEO).hexdigest()))
+    assert state["x"]["state"] == "failed"
+    assert state["archive"]["state"] == "moved"
+
+
+def test_batch_failure_releases_the_claimed_items(servers, tmp_path, monkeypatch):
+    graph, s3 = servers
+    for name in ("a", "b"):
+        s3.put("b", f"post/{name}.mp4", LONG_VIDEO)
+    poster = make_poster(graph, s3, tmp_path, claim_ttl=600)
+
+    def broken_batch(items, **kwargs):
+        assert len(s3.keys("b", "claims/")) == 2
+        raise RuntimeError("graph down")
+
+    monkeypatch.setattr(poster, "post_batch", broken_batch)
+    with pytest.raises(RuntimeError):
+        poster.post_many(2, instagram=False)
+    assert s3.keys("b", "claims/") == []
+    assert s3.keys("b", "post/") == ["post/a.mp4", "post/b.mp4"]
+
+
+def test_concurrent_code_190_refreshes_the_page_token_once(servers, tmp_path, monkeypatch):
+    graph, s3 = servers
+    poster = make_poster(graph, s3, tmp_path)
+    refreshes = []
+
+    def slow_refresh():
+        refreshes.append(1)
+        time.sleep(0.05)
+        poster.fb_page_token = f"page.r{len(refreshes)}"
+        return True
+
+    monkeypatch.setattr(poster, "fb_refresh_page_token_if_needed", slow_refresh)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        tokens = list(pool.map(poster._on_page_token_expired, ["page", "page"]))   # FB and IG
+    assert tokens == ["page.r1", "page.r1"]
+    assert len(refreshes) == 1
+
+
+def test_resume_skips_platforms_the_journal_has_final(servers, tmp_path):
+    graph, s3 = servers
+    s3.put("b", "post/long.mp4", LONG_VIDEO)
+    poster = make_poster(graph, s3, tmp_path)
+    item = PostJournal.item_id("post/long.mp4", hashlib.md5(LONG_VIDEO).hexdigest())
+    poster.journal.record(item, "facebook", "posted", ref="fb1")
+    results = poster.post_one()
+
+    assert results["facebook"] == {"ok": True, "result": "fb1", "seconds": 0.0, "resumed": True}
+    assert results["instagram"]["ok"] and not results["instagram"].get("resumed")
+    assert "videos" not in graph.calls and "feed" not in graph.calls
+    assert poster.journal.state(item)["instagram"]["state"] == "published"
@@ -0,0 +1,69 @@
+# test_uploader.py — local ETags and the manifest the uploader writes
+import hashlib
+
+import pytest
+
+from uploader import MB, local_etag
+
+
+def test_single_part_is_plain_md5(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"hello world")
+    assert local_etag(str(path), 8 * MB, 8 * MB) == hashlib.md5(b"hello world").hexdigest()
+
+
+def test_multipart_is_md5_of_part_md5s(tmp_path):
+    data = bytes(range(256)) * (11 * MB // 256)
+    path = tmp_path / "b.mp4"
+    path.write_bytes(data)
+    parts = [data[i:i + 5 * MB] for i in range(0, len(data), 5 * MB)]
+    expected = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts)).hexdigest()
+    assert local_etag(str(path), 5 * MB, 5 * MB) == f"{expected}-3"
+
+
+def test_part_size_is_raised_to_the_s3_minimum(tmp_path):
+    # boto3 never uploads parts under 5 MiB, so a 1 MiB chunksize means 5 MiB parts
+    data = b"x" * (6 * MB)
+    path = tmp_path / "c.mp4"
+    path.write_bytes(data)
+    parts = [data[:5 * MB], data[5 * MB:]]
+    expected = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts)).hexdigest()
+    assert local_etag(str(path), MB, MB) == f"{expected}-2"
+
+
+def test_threshold_is_inclusive(tmp_path):
+    path = tmp_path / "d.jpg"
+    path.write_bytes(b"y" * 1024)
+    assert local_etag(str(path), 1024, 5 * MB).endswith("-1")
+    assert "-" not in local_etag(str(path), 1025, 5 * MB)
+
+
+# ----------------------------------------------------------------------
+# Manifest upkeep
+# ----------------------------------------------------------------------
+def test_queued_items_missing_from_the_manifest_are_adopted(tmp_path):
+    pytest.importorskip("boto3")
+    from bench.fakes import FakeS3
+    from manifest import entry_from_dict, parse_manifest
+    from media_source import make_s3_client
+    from uploader import FolderSync
+
+    server = FakeS3().start()
+    try:
+        server.put("b", "post/a_old.jpg", b"old")
+        server.put("b", "post/a_old.txt", b"queued before the manifest")
+        server.put("b", "post/c_bare.jpg", b"bare")
+        (tmp_path / "b_new.jpg").write_bytes(b"new")
+        s3 = make_s3_client(server.url, "key", "secret", s3={"addressing_style": "path"})
+        sync = FolderSync(s3=s3, bucket="b", folder=str(tmp_path), manifest_key="post/manifest.json")
+        assert sync.run()["uploaded"] == ["b_new.jpg"]
+
+        body = s3.get_object(Bucket="b", Key="post/manifest.json")["Body"].read()
+        entries = [entry_from_dict(d) for d in parse_manifest(body)]
+        assert [e.key for e in entries] == ["post/a_old.jpg", "post/c_bare.jpg", "post/b_new.jpg"]
+        assert entries[0].caption_for("facebook") == "queued before the manifest"
+        assert entries[0].caption_key == "post/a_old.txt"
+        assert entries[1].captions == {} and entries[1].size == 4
+        assert entries[1].etag == hashlib.md5(b"bare").hexdigest()
+    finally:
+        server.stop()
@@ -0,0 +1,230 @@
+# token_cache.py — FB/IG tokens with known expiry, refreshed ahead of time, persisted atomically
+import json
+import os
+import tempfile
+import threading
+import time
+
+from graph_api import GraphClient
+from safio import safe_print
+
+
+USER = "user"                                  # long-lived user token
+
+
+def page_name(page_id: str) -> str:
+    return f"page:{page_id}"
+
+
+class TokenCache:
+    """
+    name -> {"token", "expires_at", "valid", "checked_at"} in a local JSON file.
+
+    Expiry comes from /debug_token (expires_at 0 = never, which is normal for
+    page tokens minted from a long-lived user token). ensure_fresh() only goes
+    to the network for tokens that are invalid, expire within `margin`, or
+    were last checked more than `recheck_after` ago, so the posting path reads
+    tokens from memory and never pays for a refresh round trip.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        app_id: str,
+        app_secret: str,
+        graph: GraphClient | None = None,
+        margin: float = 3 * 86400,             # refresh this long before expiry
+        recheck_after: float = 12 * 3600,      # re-run debug_token this often
+    ):
+        self.path = path
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.graph = graph or GraphClient(app_secret=app_secret)
+        self.margin = margin
+        self.recheck_after = recheck_after
+        self._lock = threading.RLock()
+        self._tokens: dict[str, dict] = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self.load()
+
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            safe_print(f"⚠️ Ignoring unreadable token cache {self.path}: {e}")
+            return
+        with self._lock:
+            self._tokens = data.get("tokens") or {}
+
+
+    def save(self):
+        with self._lock:
+            payload = json.dumps({"tokens": self._tokens}, indent=2)
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tokens-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    # ------------------------------------------------------------------
+    # Access (memory only)
+    # ------------------------------------------------------------------
+    def get(self, name: str) -> str | None:
+        with self._lock:
+            entry = self._tokens.get(name)
+            return entry["token"] if entry else None
+
+
+    def seed(self, name: str, token: str | None):
+        """Register a token from .env if the cache does not know this name yet."""
+        if not token:
+            return
+        with self._lock:
+            if name not in self._tokens:
+                self._tokens[name] = {"token": token, "expires_at": None, "valid": None, "checked_at": 0}
+
+
+    def put(self, name: str, token: str, expires_at: float | None = None, valid: bool | None = True):
+        with self._lock:
+            self._tokens[name] = {
+                "token": token,
+                "expires_at": expires_at,
+                "valid": valid,
+                "checked_at": time.time() if valid is not None else 0,
+            }
+        self.save()
+
+
+    # ------------------------------------------------------------------
+    # Graph calls
+    # ------------------------------------------------------------------
+    def inspect(self, token: str) -> dict:
+        """/debug_token for token (app access token as the caller)."""
+        r = self.graph.get("debug_token", params={
+            "input_token": token,
+            "access_token": f"{self.app_id}|{self.app_secret}",
+        })
+        r.raise_for_status()
+        return r.json().get("data") or {}
+
+
+    def _exchange_user_token(self, token: str) -> str | None:
+        r = self.graph.get("oauth/access_token", params={
+            "grant_type": "fb_exchange_token",
+            "client_id": self.app_id,
+            "client_secret": self.app_secret,
+            "fb_exchange_token": token,
+        })
+        if not r.ok:
+            safe_print("FB token exchange error:", r.status_code, r.text)
+            return None
+        return r.json().get("access_token")
+
+
+    def _fetch_page_token(self, page_id: str) -> str | None:
+        user_token = self.get(USER)
+        if not user_token:
+            return None
+        r = self.graph.get("me/accounts", token=user_token)
+        if not r.ok:
+            safe_print("FB /me/accounts error:", r.status_code, r.text)
+            return None
+        for acc in r.json().get("data", []):
+            if acc.get("id") == page_id and acc.get("access_token"):
+                return acc["access_token"]
+        return None
+
+
+    def refresh(self, name: str) -> str | None:
+        """Mint a new token for name now; returns it (or None if that was not possible)."""
+        old = self.get(name)
+        if name == USER:
+            new = self._exchange_user_token(old) if old else None
+        elif name.startswith("page:"):
+            new = self._fetch_page_token(name.split(":", 1)[1])
+        else:
+            new = None
+        if not new:
+            return None
+        try:
+            info = self.inspect(new)
+            self.put(name, new, expires_at=info.get("expires_at"), valid=bool(info.get("is_valid", True)))
+        except Exception:
+            self.put(name, new, valid=None)
+        safe_print(f"🔑 Token cache: refreshed {name}.")
+        return new
+
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def _needs_refresh(self, entry: dict, now: float) -> bool:
+        if entry.get("valid") is False:
+            return True
+        exp = entry.get("expires_at")
+        return bool(exp) and exp - now < self.margin
+
+
+    def ensure_fresh(self):
+        """Re-check stale entries and refresh the ones about to expire. User token first."""
+        now = time.time()
+        with self._lock:
+            names = sorted(self._tokens, key=lambda n: n != USER)
+        for name in names:
+            with self._lock:
+                entry = dict(self._tokens[name])
+            if now - (entry.get("checked_at") or 0) > self.recheck_after:
+                try:
+                    info = self.inspect(entry["token"])
+                    entry.update(expires_at=info.get("expires_at"), valid=bool(info.get("is_valid")), checked_at=now)
+                    with self._lock:
+                        self._tokens[name] = entry
+                    self.save()
+                except Exception as e:
+                    safe_print(f"⚠️ Token cache: debug_token for {name} failed: {e}")
+                    continue
+            if self._needs_refresh(entry, now) and not self.refresh(name) and name == USER:
+                safe_print("⚠️ Long-lived user token is expiring; run renew_fb_tokens.py.")
+
+
+    def start_background(self, interval: float = 3600.0):
+        """Run ensure_fresh() now and then every `interval` seconds on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return self._thread
+
+        def loop():
+            while True:
+                try:
+                    self.ensure_fresh()
+                except Exception as e:
+                    safe_print(f"⚠️ Token cache refresh error: {e}")
+                if self._stop.wait(interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="token-cache", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,418 @@
+# uploader.py — sync the local media folder into post/: only new or changed pairs, concurrent uploads, manifest as it goes
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from manifest import ManifestEntry, dump_manifest, entry_from_dict, parse_manifest
+from s3_queue import MEDIA_EXTS, S3QueueIndex
+from safio import get_env, load_env, safe_print
+from telemetry import shared_tracer
+
+
+MB = 1024 * 1024
+MIN_PART, MAX_PART, MAX_PARTS = 5 * MB, 5 * 1024 * MB, 10_000
+
+
+def part_size(chunksize: int, size: int) -> int:
+    """The part size boto3 really uses (s3transfer's ChunksizeAdjuster rules)."""
+    chunksize = min(max(chunksize, MIN_PART), MAX_PART)
+    while -(-size // chunksize) > MAX_PARTS:
+        chunksize *= 2
+    return chunksize
+
+
+def local_etag(path: str, threshold: int, chunksize: int) -> str:
+    """
+    The ETag S3 will report for this file uploaded with these transfer settings:
+    the MD5 of the bytes, or for a multipart upload the MD5 of the part MD5s
+    followed by "-<parts>" (part size as boto3 adjusts it: at least 5 MiB,
+    at most 10,000 parts).
+    """
+    size = os.path.getsize(path)
+    chunksize = part_size(chunksize, size)
+    with open(path, "rb") as f:
+        if size < threshold:
+            md5 = hashlib.md5()
+            for block in iter(lambda: f.read(MB), b""):
+                md5.update(block)
+            return md5.hexdigest()
+        parts = []
+        for block in iter(lambda: f.read(chunksize), b""):
+            parts.append(hashlib.md5(block).digest())
+    return f"{hashlib.md5(b''.join(parts)).hexdigest()}-{len(parts)}"
+
+
+class FolderSync:
+    """
+    Push a local folder (the OneDrive edit folder) into post/. Media files at the
+    top of the folder are paired with <name>.txt captions like on the bucket.
+
+    A pair is uploaded when it is new or its bytes changed: size and mtime are
+    checked against the local state file first, then the local ETag against the
+    post/ listing. Pairs this host uploaded before and that have since left
+    post/ (posted, set aside) are not sent again; without a state entry the
+    posted/ listing answers that instead. The caption goes up before its media,
+    so a poster never sees the media without its text. Videos above
+    multipart_threshold go up as concurrent multipart uploads.
+
+    With manifest_key set the uploader's manifest (order, inlined captions,
+    size, ETag) is rewritten every manifest_every seconds while uploads
+    complete and once at the end, keeping entries that are still in post/.
+    """
+
+    def __init__(
+        self,
+        *,
+        s3,
+        bucket: str,
+        folder: str,
+        prefix: str = "post/",
+        manifest_key: str | None = None,      # e.g. post/manifest.json; None = no manifest
+        state_path: str | None = None,        # local JSON of what was uploaded; None = memory only
+        workers: int = 4,                     # pairs uploading at the same time
+        multipart_threshold: int = 16 * MB,
+        multipart_chunksize: int = 8 * MB,
+        part_concurrency: int = 4,            # parts in flight per multipart upload
+        manifest_every: float = 10.0,         # seconds between manifest rewrites
+    ):
+        from boto3.s3.transfer import TransferConfig
+
+        self.s3 = s3
+        self.bucket = bucket
+        self.folder = folder
+        self.prefix = prefix
+        self.manifest_key = manifest_key
+        self.state_path = state_path
+        self.workers = max(1, workers)
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.manifest_every = manifest_every
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=part_concurrency,
+        )
+        self.queue = S3QueueIndex(s3=s3, bucket=bucket, prefix=prefix)
+        self._posted: S3QueueIndex | None = None
+        self._state: dict[str, dict] = {}     # file name -> {"size", "mtime_ns", "etag"}
+        self._lock = threading.Lock()
+
+
+    # ------------------------------------------------------------------
+    # Local state
+    # ------------------------------------------------------------------
+    def _load_state(self):
+        if not (self.state_path and os.path.exists(self.state_path)):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError) as e:
+            safe_print(f"⚠️ Ignoring unreadable upload state {self.state_path}: {e}")
+            return
+        if snap.get("bucket") == self.bucket and snap.get("prefix") == self.prefix:
+            self._state = snap.get("files") or {}
+
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            snap = {"bucket": self.bucket, "prefix": self.prefix, "files": dict(self._state)}
+        folder = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".upload-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp, self.state_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    def _remember(self, name: str, st: os.stat_result, etag: str):
+        with self._lock:
+            self._state[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "etag": etag}
+
+
+    # ------------------------------------------------------------------
+    # Planning
+    # ------------------------------------------------------------------
+    def scan(self) -> list[tuple[str, str | None]]:
+        """(media name, caption name or None) for the folder, in name order."""
+        names = {e.name for e in os.scandir(self.folder) if e.is_file()}
+        pairs = []
+        for name in sorted(names):
+            if not name.lower().endswith(MEDIA_EXTS):
+                continue
+            txt = os.path.splitext(name)[0] + ".txt"
+            pairs.append((name, txt if txt in names else None))
+        return pairs
+
+
+    def _etag(self, name: str, st: os.stat_result) -> str:
+        """Local ETag; reused from the state file while size and mtime are unchanged."""
+        known = self._state.get(name)
+        if known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns:
+            return known["etag"]
+        return local_etag(os.path.join(self.folder, name), self.multipart_threshold, self.multipart_chunksize)
+
+
+    def _was_posted(self, name: str, etag: str) -> bool:
+        if self._posted is None:
+            self._posted = S3QueueIndex(s3=self.s3, bucket=self.bucket, prefix="posted/")
+            self._posted.refresh(full=True)
+        meta = self._posted.meta(f"posted/{name}")
+        return bool(meta) and meta.get("etag") == etag
+
+
+    def _needs_upload(self, name: str) -> tuple[bool, str, os.stat_result]:
+        """(upload?, local ETag, stat) for one file."""
+        st = os.stat(os.path.join(self.folder, name))
+        etag = self._etag(name, st)
+        remote = self.queue.meta(self.prefix + name)
+        if remote:
+            return remote.get("etag") != etag, etag, st
+        known = self._state.get(name)
+        if known and known.get("etag") == etag:
+            return False, etag, st            # uploaded earlier and consumed since
+        if self._was_posted(name, etag):
+            return False, etag, st
+        return True, etag, st
+
+
+    def plan(self) -> list[dict]:
+        """Pairs with something to send: {"media", "caption", "upload": [names], "etags", "stats"}."""
+        jobs = []
+        for media, caption in self.scan():
+            upload, etags, stats = [], {}, {}
+            m_up, etags[media], stats[media] = self._needs_upload(media)
+            in_queue = self.queue.meta(self.prefix + media) is not None
+            if caption:
+                c_up, etags[caption], stats[caption] = self._needs_upload(caption)
+                # A caption edit only matters while its media is still queued (or going up now).
+                if c_up and (m_up or in_queue):
+                    upload.append(caption)
+            if m_up:
+                upload.append(media)
+            for name in etags:
+                if name not in upload:
+                    self._remember(name, stats[name], etags[name])
+            if upload:
+                jobs.append({"media": media, "caption": caption, "upload": upload,
+                             "etags": etags, "stats": stats})
+        return jobs
+
+
+    # ------------------------------------------------------------------
+    # Upload
+    # ------------------------------------------------------------------
+    def _put(self, name: str):
+        path = os.path.join(self.folder, name)
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if name.lower().endswith(".txt"):
+            content_type = "text/plain; charset=utf-8"
+        with shared_tracer().span("upload", key=self.prefix + name, bytes=os.path.getsize(path)):
+            self.s3.upload_file(path, self.bucket, self.prefix + name,
+                                ExtraArgs={"ContentType": content_type}, Config=self.transfer)
+
+
+    def _upload_pair(self, job: dict) -> dict:
+        for name in job["upload"]:            # caption first (scan order puts it there)
+            self._put(name)
+            self._remember(name, job["stats"][name], job["etags"][name])
+        return job
+
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+    def _read_manifest(self) -> list[ManifestEntry]:
+        from botocore.exceptions import ClientError
+
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket, Key=self.manifest_key)
+        except ClientError as e:
+            if str(e.response.get("Error", {}).get("Code")) in ("404", "NoSuchKey", "NotFound"):
+                return []
+            raise
+        try:
+            return [entry_from_dict(d) for d in parse_manifest(obj["Body"].read())]
+        except ValueError as e:
+            safe_print(f"⚠️ Unreadable {self.manifest_key} ({e}); writing a new one.")
+            return []
+
+
+    def _adopt(self, known: dict) -> list[ManifestEntry]:
+        """
+        Entries for media already in post/ that the manifest does not list (queued
+        before the manifest existed, or by hand), in name order. Posters read only
+        the manifest once there is one, so these would never be posted otherwise.
+        Their captions are read once here and inlined like any other entry's.
+        """
+        from botocore.exceptions import ClientError
+
+        keys = [k for k in self.queue.media_keys() if k not in known]
+        if not keys:
+            return []
+
+        def read(txt_key):
+            try:
+                body = self.s3.get_object(Bucket=self.bucket, Key=txt_key)["Body"].read()
+            except ClientError as e:
+                safe_print(f"⚠️ Could not read {txt_key}: {e}")
+                return None
+            return body.decode("utf-8", errors="replace").strip() or None
+
+        txt_keys = {k: self.queue.caption_key_for(k) for k in keys}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload") as pool:
+            texts = dict(zip(keys, pool.map(lambda k: read(txt_keys[k]) if txt_keys[k] else None, keys)))
+        entries = []
+        for k in keys:
+            meta = self.queue.meta(k) or {}
+            entries.append(ManifestEntry(
+                key=k,
+                captions={"default": texts[k]} if texts[k] else {},
+                caption_key=txt_keys[k],
+                size=meta.get("size"),
+                etag=meta.get("etag") or None,
+            ))
+        safe_print(f"🗒️ Adding {len(entries)} queued items missing from {self.manifest_key}")
+        return entries
+
+
+    def _entry(self, media: str, caption: str | None, etag: str, size: int) -> ManifestEntry:
+        text = None
+        if caption:
+            with open(os.path.join(self.folder, caption), "r", encoding="utf-8", errors="replace") as f:
+                text = f.read().strip() or None
+        return ManifestEntry(
+            key=self.prefix + media,
+            captions={"default": text} if text else {},
+            caption_key=self.prefix + caption if caption else None,
+            size=size,
+            etag=etag,
+        )
+
+
+    # ------------------------------------------------------------------
+    # Run
+    # ------------------------------------------------------------------
+    def run(self, dry_run: bool = False) -> dict:
+        """Sync once. Returns {"uploaded": [media names], "failed": {name: error}, "skipped": n}."""
+        t0 = time.perf_counter()
+        self._load_state()
+        self.queue.refresh(full=True)
+        total = len(self.scan())
+        jobs = self.plan()
+        size = sum(job["stats"][n].st_size for job in jobs for n in job["upload"])
+        safe_print(f"🔎 {self.folder}: {total} items, {len(jobs)} to upload ({size / MB:.1f} MB)")
+        if dry_run:
+            for job in jobs:
+                safe_print(f"   would upload {', '.join(job['upload'])}")
+            return {"uploaded": [], "failed": {}, "skipped": total - len(jobs)}
+
+        # Entries still in post/ keep their place (and any per-platform captions or
+        # schedule set by hand); queued items the manifest lacks follow, then new
+        # items, each in name order.
+        kept: dict[str, ManifestEntry] = {}
+        pruned = adopted = 0
+        if self.manifest_key:
+            listed = self._read_manifest()
+            kept = {e.key: e for e in listed if self.queue.meta(e.key)}
+            pruned = len(listed) - len(kept)
+            for e in self._adopt(kept):
+                kept[e.key] = e
+                adopted += 1
+
+        uploaded, failed, done = [], {}, set()
+        last_write = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload") as pool:
+            futures = {pool.submit(self._upload_pair, job): job for job in jobs}
+            for fut in as_completed(futures):
+                job = futures[fut]
+                done.add(job["media"])
+                try:
+                    fut.result()
+                    uploaded.append(job["media"])
+                    safe_print(f"📤 Uploaded {', '.join(job['upload'])}")
+                except Exception as e:
+                    failed[job["media"]] = str(e)
+                    safe_print(f"❌ Upload failed for {job['media']}: {e}")
+                if self.manifest_key and time.monotonic() - last_write >= self.manifest_every:
+                    # Only the finished prefix, so nothing jumps ahead of an item still uploading.
+                    self.write_manifest(self._merge(kept, jobs, done, failed))
+                    self.save()
+                    last_write = time.monotonic()
+
+        if self.manifest_key and (jobs or pruned or adopted):
+            self.write_manifest(self._merge(kept, jobs, done, failed))
+        self.save()
+        safe_print(f"✅ Uploaded {len(uploaded)} items ({len(failed)} failed) in {time.perf_counter() - t0:.1f}s")
+        return {"uploaded": uploaded, "failed": failed, "skipped": total - len(jobs)}
+
+
+    def _merge(self, kept: dict, jobs: list[dict], done: set, failed: dict) -> list[ManifestEntry]:
+        """Manifest entries: kept ones (refreshed where re-uploaded), then new ones up to the first pending job."""
+        entries = dict(kept)
+        for job in jobs:
+            if job["media"] not in done:
+                break
+            if job["media"] in failed:
+                continue
+            media = job["media"]
+            new = self._entry(media, job["caption"], job["etags"][media], job["stats"][media].st_size)
+            old = entries.get(new.key)
+            if old:                           # re-uploaded: keep hand-set targets, schedule, captions
+                new.platforms, new.not_before = old.platforms, old.not_before
+                new.captions = {**old.captions, **new.captions}
+            entries[new.key] = new
+        return list(entries.values())
+
+
+    def write_manifest(self, entries: list[ManifestEntry]):
+        with shared_tracer().span("manifest_put", key=self.manifest_key, items=len(entries)):
+            self.s3.put_object(Bucket=self.bucket, Key=self.manifest_key, Body=dump_manifest(entries),
+                               ContentType="application/json")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Upload new or changed media + captions from a local folder to post/.")
+    ap.add_argument("folder", nargs="?", help="local media folder (default: UPLOAD_FOLDER)")
+    ap.add_argument("--workers", type=int, default=4, help="items uploading at the same time")
+    ap.add_argument("--no-manifest", action="store_true", help="do not write MANIFEST_KEY")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be uploaded")
+    args = ap.parse_args(argv)
+    load_env()
+
+    from media_source import make_s3_client
+
+    folder = args.folder or get_env("UPLOAD_FOLDER")
+    if not folder:
+        ap.error("no folder given and UPLOAD_FOLDER is not set")
+    sync = FolderSync(
+        s3 = make_s3_client(get_env("S3_ENDPOINT"), get_env("S3_KEY"), get_env("S3_SECRET"),
+                            max_pool_connections=max(10, args.workers * 4)),
+        bucket = get_env("S3_BUCKET"),
+        folder = folder,
+        manifest_key = None if args.no_manifest else (get_env("MANIFEST_KEY") or None),
+        state_path = get_env("UPLOAD_STATE_PATH", os.path.join(folder, ".upload_state.json")),
+        workers = args.workers,
+        multipart_threshold = int(float(get_env("UPLOAD_MULTIPART_MB", 16)) * MB),
+        multipart_chunksize = int(float(get_env("UPLOAD_CHUNK_MB", 8)) * MB),
+    )
+    res = sync.run(dry_run=args.dry_run)
+    return 1 if res["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# x_post.py — X (Twitter) as an in-process platform: S3 object -> chunked upload -> tweet
+import logging
+import os
+
+import tweepy
+
+from media_source import S3RangeSource
+from rate_limit import shared_limiter
+from safio import safe_print
+from telemetry import shared_tracer
+from xpost.chunked_upload import ChunkedUploader
+from xpost.media_cache import MediaIdCache
+
+
+class XPoster:
+    """Post one queued item to X straight from S3 (replaces the local copy + xpost cron hop)."""
+
+    def __init__(
+        self,
+        *,
+        api_key: str,
+        api_secret: str,
+        access_token: str,
+        access_token_secret: str,
+        s3,                                   # boto3 S3 client (shared with SocialPoster)
+        s3_bucket: str,
+        chunk_size: int = 4 * 1024 * 1024,
+        state_dir: str = ".",                 # upload progress for resume
+        client=None,                          # tweepy.Client / API (v1.1) stand-ins; built from the keys if not given
+        api_v1=None,
+    ):
+        self.client = client or tweepy.Client(
+            consumer_key=api_key,
+            consumer_secret=api_secret,
+            access_token=access_token,
+            access_token_secret=access_token_secret,
+            wait_on_rate_limit=True,
+        )
+        # media uploads use API v1.1
+        self.api_v1 = api_v1 or tweepy.API(tweepy.OAuth1UserHandler(api_key, api_secret, access_token, access_token_secret))
+        # X access tokens are "<user id>-<secret>": one bucket per account
+        self.limiter = shared_limiter()
+        self.limit_key = f"x:{access_token.split('-', 1)[0]}"
+        self.s3 = s3
+        self.s3_bucket = s3_bucket
+        self.tracer = shared_tracer()
+        os.makedirs(state_dir, exist_ok=True)
+        self.uploader = ChunkedUploader(self.api_v1, chunk_size=chunk_size, state_dir=state_dir, logger=logging,
+                                        limiter=self.limiter, limiter_key=self.limit_key,
+                                        media_cache=MediaIdCache(os.path.join(state_dir, "media_ids.json")),
+                                        tracer=self.tracer)
+
+
+    def post_x(
+        self,
+        message: str,
+        media_key: str | None = None,
+        *,
+        size: int | None = None,
+        etag: str | None = None,
+        path: str | None = None,              # local rendition instead of the S3 object
+    ) -> dict:
+        """Stream media_key from S3 (or path) into X's chunked upload and tweet it. Returns {"id", "media_id"}."""
+        text = (message or "")[:280]
+        if path:
+            media_id = self.uploader.upload_file(path)
+        else:
+            source = S3RangeSource(self.s3, self.s3_bucket, media_key, size=size, etag=etag)
+            media_id = self.uploader.upload(source)
+
+        with self.tracer.span("x_tweet", media_id=media_id) as sp:
+            self.limiter.acquire(self.limit_key)
+            response = self.client.create_tweet(text=text, media_ids=[media_id])
+            tweet_id = response.data["id"]
+            sp.set(tweet_id=tweet_id)
+        safe_print(f"🐦 X: posted tweet {tweet_id} (media {media_id})")
+        return {"id": tweet_id, "media_id": media_id}
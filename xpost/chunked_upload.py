@@ -0,0 +1,277 @@
+# chunked_upload.py — resumable INIT/APPEND/FINALIZE media upload for X (API v1.1 via tweepy)
+import contextlib
+import hashlib
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import random
+import time
+
+
+MAX_SEGMENT = 5 * 1024 * 1024                  # X rejects APPEND segments above 5 MB
+
+
+class _NoSpan:
+    def set(self, **attrs):
+        pass
+
+
+def media_category_for(media_type: str) -> str:
+    if media_type == "image/gif":
+        return "tweet_gif"
+    return "tweet_video" if media_type.startswith("video/") else "tweet_image"
+
+
+# ----------------------------------------------------------------------
+# Sources — anything with name / size / media_type / read(offset, length)
+# (and optionally a content `digest`, for media_id reuse)
+# ----------------------------------------------------------------------
+class FileSource:
+    """Local file read through a read-only memory map (no whole-file buffer)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.abspath(path)
+        self.size = os.path.getsize(path)
+        self.mtime = os.path.getmtime(path)
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._mm is None:
+            return b""
+        return self._mm[offset:offset + length]
+
+
+    def fingerprint(self) -> dict:
+        return {"name": self.name, "size": self.size, "mtime": self.mtime}
+
+
+    @property
+    def digest(self) -> str:
+        """md5:<hex> — the same form as a single-part S3 ETag, so both sides match."""
+        if not hasattr(self, "_digest"):
+            self._digest = "md5:" + hashlib.md5(self._mm if self._mm is not None else b"").hexdigest()
+        return self._digest
+
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._f.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ----------------------------------------------------------------------
+# Uploader
+# ----------------------------------------------------------------------
+class ChunkedUploader:
+    """
+    INIT -> APPEND (segment by segment) -> FINALIZE -> STATUS, resumable.
+
+    After every acknowledged APPEND the progress (media_id + next segment) is
+    written to a small JSON file in state_dir, so a run interrupted by a network
+    blip continues at the last acknowledged segment instead of re-sending the
+    whole file. Video processing is awaited by polling STATUS with backoff.
+    """
+
+    def __init__(
+        self,
+        api,                                   # tweepy.API (v1.1)
+        *,
+        chunk_size: int = 4 * 1024 * 1024,
+        state_dir: str | None = None,          # default: next to the media file
+        max_retries: int = 5,                  # per segment, with exponential backoff
+        status_budget: float = 600.0,          # seconds to wait for video processing
+        logger=logging,
+        sleep=time.sleep,
+        limiter=None,                          # optional rate_limit.RateLimiter (acquire/observe_x)
+        limiter_key: str = "x",
+        media_cache=None,                      # optional media_cache.MediaIdCache (reuse by digest)
+        tracer=None,                           # optional telemetry.Telemetry (upload/segment spans)
+    ):
+        self.api = api
+        self.tracer = tracer
+        self.limiter = limiter
+        self.limiter_key = limiter_key
+        self.media_cache = media_cache
+        self.chunk_size = max(1, min(chunk_size, MAX_SEGMENT))
+        self.state_dir = state_dir
+        self.max_retries = max_retries
+        self.status_budget = status_budget
+        self.log = logger
+        self.sleep = sleep
+
+
+    # ------------------------------------------------------------------
+    # Progress state
+    # ------------------------------------------------------------------
+    def _state_path(self, source) -> str:
+        folder = self.state_dir or os.path.dirname(getattr(source, "path", "") or ".") or "."
+        base = os.path.basename(source.name.rstrip("/")) or "media"
+        return os.path.join(folder, f".{base}.upload.json")
+
+
+    def _load_state(self, source) -> dict | None:
+        path = self._state_path(source)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                st = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if st.get("fingerprint") != source.fingerprint() or st.get("chunk_size") != self.chunk_size:
+            return None
+        if st.get("expires_at", 0) <= time.time() + 60:
+            return None
+        return st
+
+
+    def _save_state(self, source, st: dict):
+        path = self._state_path(source)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(st, f)
+        os.replace(tmp, path)
+
+
+    def _clear_state(self, source):
+        try:
+            os.remove(self._state_path(source))
+        except OSError:
+            pass
+
+
+    # ------------------------------------------------------------------
+    # Upload
+    # ------------------------------------------------------------------
+    def _span(self, name: str, /, **attrs):
+        return self.tracer.span(name, **attrs) if self.tracer else contextlib.nullcontext(_NoSpan())
+
+
+    def _call(self, fn):
+        """One API call, paced by the limiter and reporting x-rate-limit-* back to it."""
+        if self.limiter:
+            self.limiter.acquire(self.limiter_key)
+        try:
+            return fn()
+        finally:
+            if self.limiter:
+                resp = getattr(self.api, "last_response", None)
+                self.limiter.observe_x(self.limiter_key, getattr(resp, "headers", None))
+
+
+    def _retry(self, what: str, fn):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._call(fn)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                pause = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+                resp = getattr(e, "response", None)
+                limited = getattr(resp, "status_code", None) == 429
+                if self.tracer:
+                    self.tracer.retry("rate_limit" if limited else what.split()[0].lower())
+                if limited:
+                    if self.limiter:
+                        self.limiter.observe_x(self.limiter_key, resp.headers)
+                        pause = 0.0            # the next acquire() waits for the reset
+                    else:
+                        reset = float(resp.headers.get("x-rate-limit-reset") or 0)
+                        pause = min(900.0, max(pause, reset - time.time() + 1))
+                self.log.warning(f"{what} failed ({e}); retry {attempt + 1}/{self.max_retries} in {pause:.1f}s")
+                self.sleep(pause)
+
+
+    def upload(self, source, media_category: str | None = None) -> str:
+        """Upload source (FileSource or compatible); returns the media_id string."""
+        with self._span("x_upload", source=source.name, bytes=source.size) as sp:
+            return self._upload(source, media_category, sp)
+
+
+    def _upload(self, source, media_category: str | None, sp) -> str:
+        category = media_category or media_category_for(source.media_type)
+        segments = max(1, -(-source.size // self.chunk_size))
+        sp.set(category=category, segments=segments)
+
+        digest = getattr(source, "digest", None) if self.media_cache else None
+        reused = self.media_cache.get(digest) if digest else None
+        if reused:
+            self.log.info(f"Reusing media {reused} for {source.name} ({digest}); nothing uploaded")
+            sp.set(reused=True, bytes=0)
+            return reused
+
+        st = self._load_state(source)
+        if st:
+            self.log.info(f"Resuming upload of {source.name}: media {st['media_id']}, "
+                          f"segment {st['next_segment']}/{segments}")
+            sp.set(resumed_at=st["next_segment"])
+        else:
+            media = self._retry("INIT", lambda: self.api.chunked_upload_init(
+                source.size, source.media_type, media_category=category))
+            st = {
+                "fingerprint": source.fingerprint(),
+                "chunk_size": self.chunk_size,
+                "media_id": media.media_id_string,
+                "expires_at": time.time() + float(getattr(media, "expires_after_secs", None) or 86400),
+                "next_segment": 0,
+            }
+            self._save_state(source, st)
+            self.log.info(f"INIT {source.name}: media {st['media_id']} ({source.size} bytes, {segments} segments)")
+
+        media_id = st["media_id"]
+        for index in range(st["next_segment"], segments):
+            with self._span("x_append", segment=index) as seg:
+                chunk = source.read(index * self.chunk_size, self.chunk_size)
+                seg.set(bytes=len(chunk))
+                self._retry(f"APPEND {index + 1}/{segments}",
+                            lambda: self.api.chunked_upload_append(media_id, chunk, index))
+            st["next_segment"] = index + 1
+            self._save_state(source, st)
+
+        media = self._retry("FINALIZE", lambda: self.api.chunked_upload_finalize(media_id))
+        self._wait_processing(media_id, getattr(media, "processing_info", None))
+        self._clear_state(source)
+        sp.set(media_id=media_id)
+        if digest:
+            self.media_cache.put(digest, media_id, st["expires_at"])
+        self.log.info(f"Uploaded {source.name}: media {media_id}")
+        return media_id
+
+
+    def upload_file(self, path: str, media_category: str | None = None) -> str:
+        with FileSource(path) as source:
+            return self.upload(source, media_category)
+
+
+    def _wait_processing(self, media_id: str, info: dict | None):
+        """Poll STATUS (honouring check_after_secs) until processing succeeds."""
+        deadline = time.monotonic() + self.status_budget
+        attempt = 0
+        while info and info.get("state") in ("pending", "in_progress"):
+            hint = float(info.get("check_after_secs") or 0)
+            pause = max(hint, min(30.0, 2 ** attempt)) * random.uniform(0.9, 1.2)
+            if time.monotonic() + pause > deadline:
+                raise TimeoutError(f"X media {media_id} still processing after {self.status_budget:.0f}s")
+            self.log.info(f"X media {media_id}: {info.get('state')} "
+                          f"({info.get('progress_percent', '?')}%), next check in {pause:.1f}s")
+            self.sleep(pause)
+            attempt += 1
+            with self._span("x_status", media_id=media_id):
+                status = self._retry("STATUS", lambda: self.api.get_media_upload_status(media_id))
+            info = getattr(status, "processing_info", None)
+
+        if info and info.get("state") == "failed":
+            raise RuntimeError(f"X media {media_id} processing failed: {info.get('error')}")
@@ -0,0 +1,58 @@
+# media_cache.py — content digest -> still-valid X media_id, so identical bytes are uploaded once
+import json
+import os
+import threading
+import time
+
+
+class MediaIdCache:
+    """
+    Small JSON map {digest: {"media_id", "expires_at"}}. A media_id can be
+    attached to tweets until X expires it (expires_after_secs, ~24 h), so a
+    re-post of the same content within that window skips the upload entirely.
+    """
+
+    def __init__(self, path: str, *, margin: float = 600.0):
+        self.path = path
+        self.margin = margin                   # don't hand out ids about to expire
+        self._lock = threading.Lock()
+        self._data: dict[str, dict] | None = None
+
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+
+    def _save(self):
+        now = time.time()
+        data = {d: e for d, e in self._data.items() if e.get("expires_at", 0) > now}
+        self._data = data
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+    def get(self, digest: str | None) -> str | None:
+        if not digest:
+            return None
+        with self._lock:
+            e = self._load().get(digest)
+        if e and e.get("expires_at", 0) > time.time() + self.margin:
+            return e["media_id"]
+        return None
+
+
+    def put(self, digest: str | None, media_id: str, expires_at: float):
+        if not digest:
+            return
+        with self._lock:
+            self._load()[digest] = {"media_id": media_id, "expires_at": expires_at}
+            self._save()
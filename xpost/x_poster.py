@@ -1,7 +1,17 @@
 import os
+import sys
 import logging
+from contextlib import nullcontext
 from dotenv import load_dotenv
-import tweepy
+from chunked_upload import ChunkedUploader
+from media_cache import MediaIdCache
+
+# Spans/metrics come from the repo's telemetry module when xpost runs inside the checkout.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from telemetry import Telemetry
+except ImportError:
+    Telemetry = None
 
 # Setup logging
 load_dotenv()
@@ -21,19 +31,54 @@ if not all([X_API_KEY, X_API_SECRET, X_ACCESS_TOKEN, X_ACCESS_TOKEN_SECRET, POST
     print("Error: Missing required environment variables. Check .env file.")
     exit(1)
 
-# Initialize Tweepy client for API v2
-client = tweepy.Client(
-    consumer_key=X_API_KEY,
-    consumer_secret=X_API_SECRET,
-    access_token=X_ACCESS_TOKEN,
-    access_token_secret=X_ACCESS_TOKEN_SECRET
-)
+# Tweepy clients are created on first use, so a run that finds no media
+# never pays for importing tweepy.
+client = None
+uploader = None
+
+# TELEMETRY_PATH: JSON line per span; TELEMETRY_PROM_PATH: Prometheus textfile written at exit
+tracer = Telemetry(os.getenv('TELEMETRY_PATH') or None) if Telemetry else None
+
+
+def span(name, **attrs):
+    return tracer.span(name, **attrs) if tracer else nullcontext()
+
+
+def init_clients():
+    """Initialize the Tweepy v2 client and the chunked (v1.1) uploader once."""
+    global client, uploader
+    if client is not None:
+        return
+    import tweepy
+
+    # Tweepy client for API v2
+    client = tweepy.Client(
+        consumer_key=X_API_KEY,
+        consumer_secret=X_API_SECRET,
+        access_token=X_ACCESS_TOKEN,
+        access_token_secret=X_ACCESS_TOKEN_SECRET,
+        wait_on_rate_limit=True,
+    )
+
+    # For media uploads (uses API v1.1)
+    auth = tweepy.OAuth1UserHandler(
+        X_API_KEY, X_API_SECRET, X_ACCESS_TOKEN, X_ACCESS_TOKEN_SECRET
+    )
+    api_v1 = tweepy.API(auth, wait_on_rate_limit=True)
+
+    # Chunked, resumable uploads (segment size in MB, max 5); identical content
+    # re-posted while X still holds its media_id is not uploaded again
+    state_dir = os.getenv('X_UPLOAD_STATE_DIR') or None
+    uploader = ChunkedUploader(
+        api_v1,
+        chunk_size=int(float(os.getenv('X_UPLOAD_CHUNK_MB', '4')) * 1024 * 1024),
+        state_dir=state_dir,
+        logger=logging,
+        media_cache=MediaIdCache(os.path.join(state_dir or os.path.dirname(os.path.abspath(__file__)),
+                                              '.x_media_ids.json')),
+        tracer=tracer,
+    )
 
-# For media uploads (uses API v1.1)
-auth = tweepy.OAuth1UserHandler(
-    X_API_KEY, X_API_SECRET, X_ACCESS_TOKEN, X_ACCESS_TOKEN_SECRET
-)
-api_v1 = tweepy.API(auth)
 
 def get_daily_file():
     """Find the first media file (jpg or mp4) sorted alphabetically."""
@@ -77,19 +122,16 @@ def get_text_content(text_file):
 def post_media(media_file, text_content):
     """Upload media and post to X.com."""
     try:
+        init_clients()
         logging.info(f"Uploading media: {media_file}")
-        media = api_v1.media_upload(
-            filename=media_file,
-            file=open(media_file, 'rb'),
-            chunked=True if media_file.lower().endswith('.mp4') else False
-        )
-        media_id = media.media_id_string
+        media_id = uploader.upload_file(media_file)
         logging.info(f"Uploaded media ID: {media_id}")
         
-        response = client.create_tweet(
-            text=text_content or "",
-            media_ids=[media_id]
-        )
+        with span("x_tweet", media_id=media_id):
+            response = client.create_tweet(
+                text=text_content or "",
+                media_ids=[media_id]
+            )
         logging.info(f"Posted to X.com: Tweet ID {response.data['id']}, Media: {media_file}, Text: {text_content}")
         print(f"Posted successfully: Tweet ID {response.data['id']}")
         return True
@@ -118,8 +160,14 @@ def main():
     
     text_content = get_text_content(text_file) if text_file else None
     
-    if post_media(media_file, text_content):
+    with span("post", poster="x", key=os.path.basename(media_file), bytes=os.path.getsize(media_file)) as sp:
+        ok = post_media(media_file, text_content)
+        if sp:
+            sp.set(posted=ok)
+    if ok:
         delete_files(media_file, text_file)
+    if tracer and os.getenv('TELEMETRY_PROM_PATH'):
+        tracer.write_prometheus(os.getenv('TELEMETRY_PROM_PATH'))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file